@@ -7,6 +7,7 @@ from app.api.endpoints import base
 from app.api.endpoints import workflow
 from app.api.endpoints import chatflow
 from app.api.endpoints import health
+from app.api.endpoints import retrieval
 from app.core.config import settings
 
 api_router = APIRouter(prefix=settings.api_version_url)
@@ -18,3 +19,4 @@ api_router.include_router(config.router, prefix="/config", tags=["config"])
 api_router.include_router(workflow.router, prefix="/workflow", tags=["workflow"])
 api_router.include_router(chatflow.router, prefix="/chatflow", tags=["chatflow"])
 api_router.include_router(health.router, prefix="/health", tags=["health"])
+api_router.include_router(retrieval.router, prefix="/retrieval", tags=["retrieval"])
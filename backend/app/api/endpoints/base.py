@@ -3,7 +3,10 @@ import uuid
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile
 from fastapi.responses import RedirectResponse
 from app.db.redis import redis
-from app.db.milvus import MilvusManager
+from app.db.index_profiles import resolve_index_profile
+from app.db.shared_collection_store import shared_collection_store
+from app.db.deletion_queue import deletion_queue
+from app.db.milvus_async import async_milvus_manager
 from app.db.ultils import format_page_response
 from app.models.conversation import GetUserFiles
 from app.models.knowledge_base import (
@@ -11,6 +14,7 @@ from app.models.knowledge_base import (
     KnowledgeBaseCreate,
     KnowledgeBaseRenameInput,
     KnowledgeBaseSummary,
+    KnowledgeBaseVectorConfigInput,
     PageResponse,
 )
 from app.models.user import User
@@ -20,11 +24,19 @@ from app.rag.convert_file import (
     save_file_to_minio,
 )
 from app.utils.kafka_producer import kafka_producer_manager
+from app.core.config import settings
 from app.core.logging import logger
 from app.db.miniodb import async_minio_manager
 
 router = APIRouter()
-milvus_client = MilvusManager()
+
+# 决定向量存储方式的配置，创建后只能通过迁移命令修改
+STORAGE_VECTOR_CONFIG = {
+    "quantization",
+    "pool_factor",
+    "prune_similarity",
+    "index_profile",
+}
 
 
 # 查询指定用户的所有知识库
@@ -64,13 +76,39 @@ async def create_knowledge_base(
     knowledge_base_id = (
         knowledge_base.username + "_" + str(uuid.uuid4())
     )  # 生成 UUIDv4,
+    vector_config = (
+        knowledge_base.vector_config.model_dump(exclude_none=True)
+        if knowledge_base.vector_config
+        else {}
+    )
+    collection_name = "colqwen" + knowledge_base_id.replace("-", "_")
+    vector_store = await async_milvus_manager.get_vector_store(collection_name)
+    if vector_store is shared_collection_store:
+        # 共享集合使用全局的量化存储模式和默认索引
+        vector_config["quantization"] = settings.milvus_quantization
+        vector_config.pop("index_profile", None)
+    vector_config.setdefault("quantization", settings.milvus_quantization)
+    vector_config.setdefault("pool_factor", settings.embedding_pool_factor)
+    vector_config.setdefault("prune_similarity", settings.embedding_prune_similarity)
+    try:
+        vector_config["index_profile"] = resolve_index_profile(
+            vector_config.get("index_profile"), vector_config["quantization"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     await db.create_knowledge_base(
         username=knowledge_base.username,
         knowledge_base_name=knowledge_base.knowledge_base_name,
         knowledge_base_id=knowledge_base_id,
         is_delete=False,
+        vector_config=vector_config,
+    )
+    await async_milvus_manager.run(
+        vector_store.create_collection,
+        collection_name,
+        quantization=vector_config["quantization"],
+        index_profile=vector_config["index_profile"],
     )
-    milvus_client.create_collection("colqwen" + knowledge_base_id.replace("-", "_"))
     return {"status": "success"}
 
 
@@ -93,6 +131,33 @@ async def re_name(
     return result
 
 
+# 修改知识库检索配置
+@router.post("/knowledge_base/vector_config", response_model=dict)
+async def update_vector_config(
+    configInput: KnowledgeBaseVectorConfigInput,
+    db: MongoDB = Depends(get_mongo),
+    current_user: User = Depends(get_current_user),
+):
+    await verify_username_match(
+        current_user, configInput.knowledge_base_id.split("_")[0]
+    )
+
+    vector_config = configInput.vector_config.model_dump(exclude_unset=True)
+    storage_keys = STORAGE_VECTOR_CONFIG & set(vector_config)
+    if storage_keys:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{', '.join(sorted(storage_keys))} can only be set when the knowledge base is created",
+        )
+
+    result = await db.update_knowledge_base_vector_config(
+        configInput.knowledge_base_id, vector_config
+    )
+    if result["status"] == "failed":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
+
 # 批量删除接口
 @router.delete("/files/bulk-delete", response_model=dict)
 async def bulk_delete_files(
@@ -144,22 +209,28 @@ async def bulk_delete_files(
     # 执行批量删除
     deletion_result = await db.bulk_delete_files_from_knowledge(valid_operations)
 
-    # 处理 Milvus 删除
+    # 处理 Milvus 删除：同一知识库的文件合并为一条删除消息
     if deletion_result.get("status") in ["success", "partial_success"]:
+        file_ids_by_knowledge = {}
         for item in valid_operations:
+            file_ids_by_knowledge.setdefault(item["knowledge_id"], []).append(
+                item["file_id"]
+            )
+        for knowledge_id, file_ids in file_ids_by_knowledge.items():
             try:
-                collection_name = "colqwen" + item["knowledge_id"].replace("-", "_")
-                milvus_client.delete_files(collection_name, [item["file_id"]])
+                collection_name = "colqwen" + knowledge_id.replace("-", "_")
+                await deletion_queue.enqueue_files(collection_name, file_ids)
             except Exception as e:
-                logger.error(f"Milvus 删除失败 {item}: {str(e)}")
+                logger.error(f"Milvus 删除失败 {knowledge_id}: {str(e)}")
                 if "milvus_errors" not in deletion_result:
                     deletion_result["milvus_errors"] = []
-                deletion_result["milvus_errors"].append(
+                deletion_result["milvus_errors"].extend(
                     {
-                        "knowledge_id": item["knowledge_id"],
-                        "file_id": item["file_id"],
+                        "knowledge_id": knowledge_id,
+                        "file_id": file_id,
                         "error": str(e),
                     }
+                    for file_id in file_ids
                 )
 
     # 构建最终响应
@@ -195,9 +266,8 @@ async def delete_file(
         username = knowledge_base_id.split("_")[0]
     await verify_username_match(current_user, username)
     result = await db.delete_file_from_knowledge_base(knowledge_base_id, file_id)
-    milvus_client.delete_files(
-        "colqwen" + knowledge_base_id.replace("-", "_"), [file_id]
-    )
+    collection_name = "colqwen" + knowledge_base_id.replace("-", "_")
+    await deletion_queue.enqueue_files(collection_name, [file_id])
     if result["status"] == "failed":
         raise HTTPException(status_code=404, detail=result["message"])
     return result
@@ -212,7 +282,8 @@ async def delete_knowledge_base(
 ):
     await verify_username_match(current_user, knowledge_base_id.split("_")[0])
     result = await db.delete_knowledge_base(knowledge_base_id)
-    milvus_client.delete_collection("colqwen" + knowledge_base_id.replace("-", "_"))
+    collection_name = "colqwen" + knowledge_base_id.replace("-", "_")
+    await deletion_queue.enqueue_collection(collection_name)
     if result["status"] == "failed":
         raise HTTPException(status_code=404, detail=result["message"])
     return result
@@ -255,9 +326,8 @@ async def delete_knowledge_base(
             temp_knowledge_base_id = knowledge_base["knowledge_base_id"]
             if "_".join(temp_knowledge_base_id[5:].split("_")[0:2]) not in chat_chatflow_id:
                 result = await db.delete_knowledge_base(temp_knowledge_base_id)
-                milvus_client.delete_collection(
-                    "colqwen" + temp_knowledge_base_id.replace("-", "_")
-                )
+                collection_name = "colqwen" + temp_knowledge_base_id.replace("-", "_")
+                await deletion_queue.enqueue_collection(collection_name)
                 if result["status"] == "failed":
                     failed_count += 1
                 else:
@@ -14,8 +14,9 @@ from app.db.mongo import MongoDB, get_mongo
 from app.core.security import get_current_user, verify_username_match
 from app.rag.convert_file import save_file_to_minio
 from app.utils.kafka_producer import kafka_producer_manager
+from app.core.config import settings
 from app.core.logging import logger
-from app.db.milvus import milvus_client
+from app.db.milvus_async import async_milvus_manager
 
 router = APIRouter()
 
@@ -197,11 +198,18 @@ async def upload_multiple_files(
         f"temp_base_{username}_{id}",
         knowledge_db_id,
         True,
+        vector_config={
+            "quantization": settings.milvus_quantization,
+            "pool_factor": settings.embedding_pool_factor,
+            "prune_similarity": settings.embedding_prune_similarity,
+        },
     )
-    if not milvus_client.check_collection(
-        "colqwen" + knowledge_db_id.replace("-", "_")
+    collection_name = "colqwen" + knowledge_db_id.replace("-", "_")
+    vector_store = await async_milvus_manager.get_vector_store(collection_name)
+    if not await async_milvus_manager.run(
+        vector_store.check_collection, collection_name
     ):
-        milvus_client.create_collection("colqwen" + knowledge_db_id.replace("-", "_"))
+        await async_milvus_manager.run(vector_store.create_collection, collection_name)
     # 生成任务ID
     task_id = username + "_" + str(uuid.uuid4())
     total_files = len(files)
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, status
 from fastapi.responses import JSONResponse
+from app.db.deletion_queue import deletion_queue
+from app.db.milvus_async import async_milvus_manager
 
 router = APIRouter()
 
@@ -11,3 +13,15 @@ async def health_check():
         status_code=status.HTTP_200_OK,
         content={"status": "UP", "details": "All systems operational"},
     )
+
+
+# Milvus 调用统计：在途调用数、排队数和各操作的调用、错误、超时次数
+@router.get("/milvus", response_model=dict)
+async def milvus_metrics():
+    return async_milvus_manager.metrics()
+
+
+# 删除队列积压：待处理消息数、已读取未确认数和待 compaction 的集合数
+@router.get("/milvus/deletions", response_model=dict)
+async def milvus_deletion_metrics():
+    return await deletion_queue.stats()
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends
+from app.core.logging import logger
+from app.core.security import get_current_user, verify_username_match
+from app.models.retrieval import BatchRetrievalRequest, BatchRetrievalResponse
+from app.models.user import User
+from app.rag.embedding_cache import embedding_cache
+from app.rag.retrieval import get_collection_name, search_knowledge_bases_batch
+
+router = APIRouter()
+
+
+def knowledge_base_owner(knowledge_base_id: str) -> str:
+    # 临时知识库ID为 temp_用户名_...，普通知识库为 用户名_...
+    if "temp" in knowledge_base_id:
+        return knowledge_base_id.split("_")[1]
+    return knowledge_base_id.split("_")[0]
+
+
+# 批量检索：多个查询同时检索多个知识库，只返回匹配的页，不调用大模型
+@router.post("/batch", response_model=BatchRetrievalResponse)
+async def batch_retrieval(
+    request: BatchRetrievalRequest,
+    current_user: User = Depends(get_current_user),
+):
+    knowledge_base_ids = list(dict.fromkeys(request.knowledge_base_ids))
+    for knowledge_base_id in knowledge_base_ids:
+        await verify_username_match(
+            current_user, knowledge_base_owner(knowledge_base_id)
+        )
+
+    # 所有查询的 embedding 一次请求生成（已缓存的查询不再请求）
+    query_embeddings = await embedding_cache.get_text_embeddings(request.queries)
+    results = await search_knowledge_bases_batch(
+        knowledge_base_ids,
+        query_embeddings,
+        top_k=request.top_k,
+        score_threshold=request.score_threshold,
+        file_ids=request.file_ids,
+        query_texts=request.queries if request.hybrid else None,
+    )
+    logger.info(
+        f"Batch retrieval | Queries: {len(request.queries)} | Knowledge bases: {len(knowledge_base_ids)}"
+    )
+
+    collection_knowledge_bases = {
+        get_collection_name(knowledge_base_id): knowledge_base_id
+        for knowledge_base_id in knowledge_base_ids
+    }
+    return {
+        "results": [
+            {
+                "query": query,
+                "pages": [
+                    {
+                        "knowledge_base_id": collection_knowledge_bases[
+                            score["collection_name"]
+                        ],
+                        "file_id": score["file_id"],
+                        "image_id": score["image_id"],
+                        "page_number": score["page_number"],
+                        "score": score["score"],
+                    }
+                    for score in scores
+                ],
+            }
+            for query, scores in zip(request.queries, results)
+        ]
+    }
@@ -14,6 +14,7 @@ class Settings(BaseSettings):
     redis_token_db: int = 0  # 用于token存储
     redis_task_db: int = 1  # 用于存储embedding任务队列
     redis_lock_db: int = 2  # 用于存储embedding任务队列
+    redis_embedding_cache_db: int = 3  # 用于缓存查询文本的embedding
     secret_key: str = "your_secret_key"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 60 * 24 * 8  # 8 days
@@ -34,6 +35,46 @@ class Settings(BaseSettings):
     minio_secret_key: str = "your_secret_key"  # MinIO 的密钥
     minio_bucket_name: str = "minio-file"  # 需要上传的桶的名称
     milvus_uri: str = "http://127.0.0.1:19530"
+    milvus_rerank_fetch_pages: int = 16  # 重排时每次 Milvus 查询拉取的候选页数
+    milvus_page_index: bool = True  # 新建知识库时是否同时创建页级池化向量集合
+    milvus_candidate_limit: int = 50  # 第一阶段召回的候选页数（可按知识库覆盖）
+    milvus_quantization: str = "none"  # 新建知识库的 token 向量存储模式: none/int8/binary
+    milvus_search_workers: int = 16  # 执行 Milvus 调用（检索、写入、删除）的线程池大小
+    milvus_pool_size: int = 4  # 每个进程的 Milvus 连接数
+    milvus_call_timeout: float = 30  # 单次 Milvus 调用的超时（秒）
+    milvus_insert_timeout: float = 600  # 写入一个文件向量的超时（秒）
+    milvus_call_retries: int = 2  # 检索、删除等幂等调用失败后的重试次数
+    milvus_insert_batch_rows: int = 16384  # 单次 insert 的最大向量数
+    milvus_insert_retries: int = 3  # insert 失败后的重试次数
+    milvus_num_partitions: int = 16  # 单个知识库的 token 集合以 file_id 为分区键的分区数（页级集合不分区）
+    milvus_shared_num_partitions: int = 64  # 共享集合以 kb_id 为分区键的分区数
+    milvus_max_loaded_collections: int = 100  # 同时加载的知识库集合数上限
+    milvus_max_loaded_vectors: int = 20_000_000  # 已加载集合的向量总数上限
+    milvus_release_idle_seconds: int = 600  # 集合空闲超过该时长才可被释放
+    milvus_residency_check_interval: int = 60  # 检查加载预算的间隔（秒）
+    milvus_load_check_interval: int = 30  # 进程内缓存集合已加载状态的时长（秒）
+    milvus_schema_check_interval: int = 60  # 进程内缓存集合量化存储模式的时长（秒），迁移存储模式后其他进程在此时长内生效
+    milvus_prewarm_collections: int = 20  # 启动时预加载最近访问的集合数
+    milvus_deletion_batch_size: int = 200  # 删除队列每批读取的消息数
+    milvus_deletion_max_wait: float = 2  # 删除队列等待新消息的最长时间（秒）
+    milvus_deletion_claim_idle: int = 300  # 删除消息超过该时长（秒）未确认时由其他 worker 接管重试
+    milvus_compaction_hours: str = "2-5"  # 执行 Milvus compaction 的低峰时段（北京时间，起止小时），为空表示不执行
+    milvus_compaction_check_interval: int = 600  # 低峰时段内检查待 compaction 集合的间隔（秒）
+    milvus_text_analyzer: str = "jieba"  # 页文本 BM25 索引的分词器: jieba/standard/english/chinese，不支持时页级集合只做稠密召回
+    milvus_rrf_k: int = 60  # 稠密与 BM25 召回结果 RRF 融合的平滑参数
+    milvus_query_prune: str = "none"  # 检索前查询 token 的裁剪方式: none/dedup/importance/norm
+    milvus_query_prune_keep_ratio: float = 0.6  # importance/norm 裁剪保留的 token 比例
+    milvus_query_prune_min_tokens: int = 4  # 裁剪后至少保留的查询 token 数
+    milvus_query_prune_similarity: float = 0.95  # 余弦相似度高于该值的查询 token 视为重复
+    milvus_layout: str = "collection"  # 新建知识库的存储布局: collection（每个知识库一个集合）/shared（共享集合）
+    milvus_shared_collections: int = 16  # shared 布局下共享集合的数量，创建后不可修改
+    temp_vector_store: str = "local"  # 对话临时知识库的向量存储: local（本地磁盘）/milvus
+    local_vector_store_dir: str = "/app/temp_vectors"  # 本地向量存储目录
+    plaid_index_dir: str = "/app/plaid_index"  # PLAID 延迟交互索引目录
+    plaid_nprobe: int = 8  # 每个查询 token 探测的质心数
+    plaid_centroid_threshold: float = 0.45  # 质心交互时忽略与所有查询 token 相似度都低于该值的质心
+    plaid_candidate_pages: int = 256  # 质心交互后做精确 MaxSim 的候选页数
+    plaid_residual_bits: int = 4  # 残差量化位数: 2/4/8
     colbert_model_path: str = "/home/liwei/ai/colqwen2.5-v0.2"
     sandbox_shared_volume: str = "/app/sandbox_workspace"
     server_ip: str = "http://localhost"
@@ -41,6 +82,15 @@ class Settings(BaseSettings):
     unoserver_host: str = "unoserver"
     unoserver_base_port: int = 2003
     embedding_image_dpi: int = 200
+    embedding_pool_factor: int = 1  # 入库时 token 向量层次聚类池化倍数，1 表示不池化
+    embedding_prune_similarity: float = 0  # 入库时去掉页内余弦相似度高于该值的重复 token（背景图像块），0 表示不去重，建议 0.98
+    embedding_prune_min_tokens: int = 32  # 去重后每页至少保留的 token 数
+    embedding_insert_pages: int = 16  # 入库时每收到该页数的向量写入一次 Milvus
+    embedding_busy_retries: int = 5  # 模型服务返回 429/503 时的重试次数
+    embedding_max_retry_wait: float = 60  # 按 Retry-After 等待的最长时间（秒）
+    embedding_wire_format: str = "float16"  # 从本地模型服务获取向量的传输格式: float16/float32（二进制）/json
+    embedding_cache_ttl: int = 60 * 60 * 24  # 查询 embedding 缓存过期时间（秒）
+    embedding_cache_local_size: int = 1024  # 进程内 LRU 缓存的查询条数
     embedding_model: str = "local_colqwen" # "local_colqwen" or "jina_embeddings_v4",
     jina_api_key: str = "" # embedding_model = "jina_embeddings_v4" 时生效
     jina_embeddings_v4_url:str = "https://api.jina.ai/v1/embeddings" # embedding_model = "jina_embeddings_v4" 时生效
@@ -0,0 +1,45 @@
+class VectorStore:
+    """知识库多向量存储接口
+
+    集合名为 "colqwen" + 知识库ID，写入的每页为
+    {"colqwen_vecs", "page_number", "image_id", "file_id"}，
+    检索返回按分数降序的 {"score", "image_id", "file_id", "page_number"} 列表。
+    """
+
+    def check_collection(self, collection_name: str) -> bool:
+        raise NotImplementedError
+
+    def create_collection(self, collection_name: str, dim: int = 128, **kwargs):
+        raise NotImplementedError
+
+    def delete_collection(self, collection_name: str):
+        raise NotImplementedError
+
+    def delete_files(self, collection_name: str, file_ids: list):
+        raise NotImplementedError
+
+    def insert_pages(self, collection_name: str, pages: list) -> int:
+        raise NotImplementedError
+
+    def ensure_loaded(self, collection_name: str) -> None:
+        """检索前加载集合，默认无需加载"""
+        return None
+
+    def compact(self, collection_name: str):
+        """清理已删除的向量，默认无需处理"""
+        return None
+
+    def search(
+        self, collection_name: str, data, topk: int, file_ids: list = None, **kwargs
+    ) -> list:
+        raise NotImplementedError
+
+    def search_batch(
+        self, collection_name: str, queries: list, topk: int, **kwargs
+    ) -> list:
+        """检索多个查询，返回与 queries 一一对应的结果列表，默认逐个检索"""
+        query_texts = kwargs.pop("query_texts", None) or [None] * len(queries)
+        return [
+            self.search(collection_name, data, topk, query_text=query_text, **kwargs)
+            for data, query_text in zip(queries, query_texts)
+        ]
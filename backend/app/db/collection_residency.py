@@ -0,0 +1,133 @@
+import asyncio
+import time
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.milvus import milvus_client
+from app.db.milvus_async import LOAD_TIMEOUT, async_milvus_manager
+from app.db.redis import redis
+
+# 集合最近访问时间（zset，score 为时间戳），所有 worker 共享
+ACCESS_KEY = "milvus:collection_access"
+# 预算检查和预加载只由一个 worker 执行
+RESIDENCY_LOCK_KEY = "lock:milvus_residency"
+PREWARM_LOCK_KEY = "lock:milvus_prewarm"
+# 同一集合在该间隔内只记录一次访问，减少 Redis 写入
+TOUCH_INTERVAL = 10
+
+
+class CollectionResidency:
+    """管理 Milvus 集合的加载：记录访问时间，超出预算时释放最久未访问的集合
+
+    检索时由 MilvusManager.ensure_loaded 按需加载，这里只负责释放和预加载。
+    """
+
+    def __init__(self):
+        self._touched = {}  # 集合名 -> 本进程最近一次写入访问时间
+
+    async def touch(self, collection_name: str):
+        now = time.time()
+        if now - self._touched.get(collection_name, 0) < TOUCH_INTERVAL:
+            return
+        self._touched[collection_name] = now
+        try:
+            redis_connection = await redis.get_lock_connection()
+            await redis_connection.zadd(ACCESS_KEY, {collection_name: now})
+        except Exception as e:
+            logger.warning(f"Record access of {collection_name} failed: {str(e)}")
+
+    async def enforce_budget(self) -> list:
+        """释放超出数量或向量预算的冷集合，返回被释放的集合名"""
+        redis_connection = await redis.get_lock_connection()
+        if not await redis_connection.set(
+            RESIDENCY_LOCK_KEY,
+            "1",
+            nx=True,
+            ex=max(1, settings.milvus_residency_check_interval - 1),
+        ):
+            return []
+
+        loaded = await async_milvus_manager.run(milvus_client.loaded_collections)
+        access = dict(await redis_connection.zrange(ACCESS_KEY, 0, -1, withscores=True))
+        collection_count = len(loaded)
+        vector_count = sum(loaded.values())
+        now = time.time()
+        released = []
+        # 从最久未访问的集合开始释放，没有访问记录的视为最冷
+        for collection_name in sorted(loaded, key=lambda name: access.get(name, 0)):
+            if (
+                collection_count <= settings.milvus_max_loaded_collections
+                and vector_count <= settings.milvus_max_loaded_vectors
+            ):
+                break
+            if (
+                now - access.get(collection_name, 0)
+                < settings.milvus_release_idle_seconds
+            ):
+                # 剩余集合都在使用中，宁可超出预算也不释放
+                logger.warning(
+                    f"Milvus residency over budget: {collection_count} collections, {vector_count} vectors"
+                )
+                break
+            await async_milvus_manager.run(
+                milvus_client.release_collection, collection_name
+            )
+            collection_count -= 1
+            vector_count -= loaded[collection_name]
+            released.append(collection_name)
+            logger.info(f"Released idle Milvus collection {collection_name}")
+
+        # 清理已删除集合的访问记录
+        existing = set(
+            await async_milvus_manager.run(
+                lambda: milvus_client.client.list_collections(),
+                operation="list_collections",
+            )
+        )
+        stale = [name for name in access if name not in existing]
+        if stale:
+            await redis_connection.zrem(ACCESS_KEY, *stale)
+        return released
+
+    async def prewarm(self) -> list:
+        """启动时预加载最近访问的集合"""
+        redis_connection = await redis.get_lock_connection()
+        if not await redis_connection.set(PREWARM_LOCK_KEY, "1", nx=True, ex=300):
+            return []
+        limit = min(
+            settings.milvus_prewarm_collections, settings.milvus_max_loaded_collections
+        )
+        if limit <= 0:
+            return []
+        collection_names = await redis_connection.zrevrange(ACCESS_KEY, 0, limit - 1)
+        loaded = []
+        for collection_name in collection_names:
+            try:
+                if await async_milvus_manager.run(
+                    milvus_client.check_collection, collection_name
+                ):
+                    await async_milvus_manager.run(
+                        milvus_client.ensure_loaded,
+                        collection_name,
+                        timeout=LOAD_TIMEOUT,
+                    )
+                    loaded.append(collection_name)
+            except Exception as e:
+                logger.warning(f"Prewarm {collection_name} failed: {str(e)}")
+        logger.info(f"Prewarmed {len(loaded)} Milvus collections")
+        return loaded
+
+    async def run(self):
+        """后台任务：预加载后定期检查加载预算"""
+        try:
+            await self.prewarm()
+        except Exception as e:
+            logger.error(f"Milvus prewarm failed: {str(e)}")
+        while True:
+            try:
+                await self.enforce_budget()
+            except Exception as e:
+                logger.error(f"Milvus residency check failed: {str(e)}")
+            await asyncio.sleep(settings.milvus_residency_check_interval)
+
+
+collection_residency = CollectionResidency()
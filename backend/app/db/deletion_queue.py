@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from redis.exceptions import ResponseError
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.milvus_async import async_milvus_manager
+from app.db.redis import redis
+from app.utils.timezone import beijing_time_now
+
+# 待删除向量的消息流，所有 worker 通过消费组分摊处理
+DELETION_STREAM_KEY = "milvus:deletions"
+DELETION_GROUP = "milvus_deletion_group"
+# 有删除、等待低峰时段 compaction 的集合（hash，值为累计删除的文件数）
+COMPACTION_PENDING_KEY = "milvus:compaction_pending"
+COMPACTION_LOCK_KEY = "lock:milvus_compaction"
+# 单次删除表达式中的最大文件数
+DELETE_CHUNK_SIZE = 1000
+
+
+def in_compaction_window(hours: str, hour: int) -> bool:
+    """hours 形如 "2-5"，表示 2 点到 5 点（含），支持跨零点如 "23-4" """
+    if not hours:
+        return False
+    start, end = (int(value) for value in hours.split("-"))
+    if start <= end:
+        return start <= hour <= end
+    return hour >= start or hour <= end
+
+
+class DeletionQueue:
+    """后台删除向量
+
+    删除文件或知识库时只写入 Redis Stream，由各 worker 的后台任务批量执行：
+    同一批中同一集合的文件合并为一次删除，整个集合被删除时忽略其文件删除。
+    删除过的集合在低峰时段触发 compaction，避免已删除向量拖慢检索。
+    """
+
+    def __init__(self):
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+
+    async def enqueue_files(self, collection_name: str, file_ids: list):
+        if file_ids:
+            await self._enqueue(
+                {
+                    "action": "files",
+                    "collection_name": collection_name,
+                    "file_ids": json.dumps(list(file_ids)),
+                }
+            )
+
+    async def enqueue_collection(self, collection_name: str):
+        await self._enqueue(
+            {"action": "collection", "collection_name": collection_name}
+        )
+
+    async def _enqueue(self, message: dict):
+        try:
+            redis_connection = await redis.get_task_connection()
+            await redis_connection.xadd(DELETION_STREAM_KEY, message)
+        except Exception as e:
+            # Redis 不可用时直接删除，保证向量不残留
+            logger.warning(f"Enqueue vector deletion failed, deleting inline: {str(e)}")
+            await self.apply(
+                {
+                    message["collection_name"]: {
+                        "drop": message["action"] == "collection",
+                        "file_ids": set(json.loads(message.get("file_ids", "[]"))),
+                    }
+                }
+            )
+
+    async def _ensure_group(self, redis_connection):
+        try:
+            await redis_connection.xgroup_create(
+                DELETION_STREAM_KEY, DELETION_GROUP, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read(self, redis_connection) -> list:
+        """优先接管其他 worker 长时间未确认的消息（如进程退出），再读取新消息"""
+        claimed = await redis_connection.xautoclaim(
+            DELETION_STREAM_KEY,
+            DELETION_GROUP,
+            self.consumer_name,
+            min_idle_time=settings.milvus_deletion_claim_idle * 1000,
+            count=settings.milvus_deletion_batch_size,
+        )
+        if claimed[1]:
+            return claimed[1]
+        messages = await redis_connection.xreadgroup(
+            groupname=DELETION_GROUP,
+            consumername=self.consumer_name,
+            streams={DELETION_STREAM_KEY: ">"},
+            count=settings.milvus_deletion_batch_size,
+            block=int(settings.milvus_deletion_max_wait * 1000),
+        )
+        return messages[0][1] if messages else []
+
+    @staticmethod
+    def group_messages(messages: list) -> dict:
+        """按集合合并消息，返回 集合名 -> {"drop", "file_ids", "message_ids"}"""
+        batches = {}
+        for message_id, fields in messages:
+            batch = batches.setdefault(
+                fields["collection_name"],
+                {"drop": False, "file_ids": set(), "message_ids": []},
+            )
+            batch["message_ids"].append(message_id)
+            if fields["action"] == "collection":
+                batch["drop"] = True
+            else:
+                batch["file_ids"].update(json.loads(fields["file_ids"]))
+        return batches
+
+    async def apply(self, batches: dict) -> list:
+        """执行合并后的删除，返回成功的集合名"""
+        done = []
+        for collection_name, batch in batches.items():
+            try:
+                if batch["drop"]:
+                    await async_milvus_manager.delete_collection(collection_name)
+                    logger.info(f"Deleted vector collection {collection_name}")
+                elif batch["file_ids"] and await async_milvus_manager.check_collection(
+                    collection_name
+                ):
+                    file_ids = sorted(batch["file_ids"])
+                    for i in range(0, len(file_ids), DELETE_CHUNK_SIZE):
+                        await async_milvus_manager.delete_files(
+                            collection_name, file_ids[i : i + DELETE_CHUNK_SIZE]
+                        )
+                    await self._mark_for_compaction(collection_name, len(file_ids))
+                    logger.info(
+                        f"Deleted vectors of {len(file_ids)} files from {collection_name}"
+                    )
+                done.append(collection_name)
+            except Exception as e:
+                # 不确认消息，超过 milvus_deletion_claim_idle 后重试
+                logger.error(f"Delete vectors from {collection_name} failed: {str(e)}")
+        return done
+
+    async def _mark_for_compaction(self, collection_name: str, file_count: int):
+        try:
+            redis_connection = await redis.get_task_connection()
+            await redis_connection.hincrby(
+                COMPACTION_PENDING_KEY, collection_name, file_count
+            )
+        except Exception as e:
+            logger.warning(f"Mark {collection_name} for compaction failed: {str(e)}")
+
+    async def compact_pending(self) -> list:
+        """低峰时段对有删除的集合执行 compaction，只由一个 worker 执行"""
+        if not in_compaction_window(
+            settings.milvus_compaction_hours, beijing_time_now().hour
+        ):
+            return []
+        redis_connection = await redis.get_lock_connection()
+        if not await redis_connection.set(
+            COMPACTION_LOCK_KEY,
+            "1",
+            nx=True,
+            ex=max(1, settings.milvus_compaction_check_interval - 1),
+        ):
+            return []
+        task_connection = await redis.get_task_connection()
+        pending = await task_connection.hgetall(COMPACTION_PENDING_KEY)
+        compacted = []
+        for collection_name, file_count in pending.items():
+            try:
+                if await async_milvus_manager.check_collection(collection_name):
+                    vector_store = await async_milvus_manager.get_vector_store(
+                        collection_name
+                    )
+                    await async_milvus_manager.run(
+                        vector_store.compact, collection_name
+                    )
+                    logger.info(
+                        f"Compacted {collection_name} after deleting {file_count} files"
+                    )
+                await task_connection.hdel(COMPACTION_PENDING_KEY, collection_name)
+                compacted.append(collection_name)
+            except Exception as e:
+                logger.warning(f"Compact {collection_name} failed: {str(e)}")
+        return compacted
+
+    async def stats(self) -> dict:
+        redis_connection = await redis.get_task_connection()
+        await self._ensure_group(redis_connection)
+        pending = await redis_connection.xpending(DELETION_STREAM_KEY, DELETION_GROUP)
+        return {
+            "queued": await redis_connection.xlen(DELETION_STREAM_KEY),
+            "pending": pending["pending"],
+            "compaction_pending": await redis_connection.hlen(COMPACTION_PENDING_KEY),
+        }
+
+    async def run(self):
+        last_compaction = 0.0
+        while True:
+            try:
+                redis_connection = await redis.get_task_connection()
+                await self._ensure_group(redis_connection)
+                while True:
+                    messages = await self._read(redis_connection)
+                    if messages:
+                        batches = self.group_messages(messages)
+                        for collection_name in await self.apply(batches):
+                            message_ids = batches[collection_name]["message_ids"]
+                            await redis_connection.xack(
+                                DELETION_STREAM_KEY, DELETION_GROUP, *message_ids
+                            )
+                            await redis_connection.xdel(
+                                DELETION_STREAM_KEY, *message_ids
+                            )
+                    if (
+                        time.time() - last_compaction
+                        >= settings.milvus_compaction_check_interval
+                    ):
+                        last_compaction = time.time()
+                        await self.compact_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Vector deletion queue failed: {str(e)}")
+                await asyncio.sleep(5)
+
+
+deletion_queue = DeletionQueue()
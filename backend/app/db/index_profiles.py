@@ -0,0 +1,93 @@
+# 向量索引配置：build 为建索引参数，search 为检索参数
+# 小知识库用 flat 即可精确检索，大知识库按召回率/延迟在 HNSW、IVF、DISKANN 之间选择
+INDEX_PROFILES = {
+    "flat": {
+        "index_type": "FLAT",
+        "metric_type": "IP",
+        "build": {},
+        "search": {},
+    },
+    "hnsw": {
+        "index_type": "HNSW",
+        "metric_type": "IP",
+        "build": {"M": 16, "efConstruction": 500},
+        "search": {"ef": 64},
+    },
+    "hnsw_light": {
+        "index_type": "HNSW",
+        "metric_type": "IP",
+        "build": {"M": 8, "efConstruction": 128},
+        "search": {"ef": 32},
+    },
+    "ivf_flat": {
+        "index_type": "IVF_FLAT",
+        "metric_type": "IP",
+        "build": {"nlist": 1024},
+        "search": {"nprobe": 16},
+    },
+    "ivf_sq8": {
+        "index_type": "IVF_SQ8",
+        "metric_type": "IP",
+        "build": {"nlist": 1024},
+        "search": {"nprobe": 16},
+    },
+    "ivf_pq": {
+        "index_type": "IVF_PQ",
+        "metric_type": "IP",
+        "build": {"nlist": 1024, "m": 16, "nbits": 8},
+        "search": {"nprobe": 16},
+    },
+    "diskann": {
+        "index_type": "DISKANN",
+        "metric_type": "IP",
+        "build": {},
+        "search": {"search_list": 100},
+    },
+    "bin_flat": {
+        "index_type": "BIN_FLAT",
+        "metric_type": "HAMMING",
+        "build": {},
+        "search": {},
+    },
+    "bin_ivf_flat": {
+        "index_type": "BIN_IVF_FLAT",
+        "metric_type": "HAMMING",
+        "build": {"nlist": 1024},
+        "search": {"nprobe": 16},
+    },
+}
+
+# 各量化存储模式下的默认索引
+DEFAULT_INDEX_PROFILES = {"none": "hnsw", "int8": "ivf_sq8", "binary": "bin_ivf_flat"}
+
+# 检索参数中需要不小于 limit 的项
+LIMIT_BOUND_SEARCH_PARAMS = ("ef", "search_list")
+
+
+def compatible_index_profiles(quantization: str) -> list:
+    """返回与量化存储模式兼容的索引配置名称（二值向量只能使用 HAMMING 索引）"""
+    binary = quantization == "binary"
+    return [
+        name
+        for name, profile in INDEX_PROFILES.items()
+        if (profile["metric_type"] == "HAMMING") == binary
+    ]
+
+
+def resolve_index_profile(name: str, quantization: str) -> str:
+    """校验索引配置，未指定时返回该存储模式的默认配置"""
+    name = name or DEFAULT_INDEX_PROFILES[quantization]
+    if name not in compatible_index_profiles(quantization):
+        raise ValueError(
+            f"Index profile {name} is not available for {quantization} vectors"
+        )
+    return name
+
+
+def build_search_params(name: str, limit: int, overrides: dict = None) -> dict:
+    profile = INDEX_PROFILES[name]
+    params = {**profile["search"], **(overrides or {})}
+    for key in LIMIT_BOUND_SEARCH_PARAMS:
+        if key in params:
+            params[key] = max(params[key], limit)
+    return {"metric_type": profile["metric_type"], "params": params}
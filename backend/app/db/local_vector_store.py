@@ -0,0 +1,153 @@
+import heapq
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+from app.core.config import settings
+from app.db.base_vector_store import VectorStore
+from app.db.milvus import maxsim_scores
+
+# 每个集合一个目录，每个文件一个子目录；每次写入生成一个分段：
+#   <segment>.npy   该批所有页的 token 向量（float16，按页连续存放）
+#   <segment>.json  每页的 image_id、page_number 和在 .npy 中的偏移
+# .json 最后写入，存在即表示分段完整
+SEGMENT_META = ".json"
+SEGMENT_VECTORS = ".npy"
+
+
+class LocalVectorStore(VectorStore):
+    """本地磁盘上的临时向量存储，检索时内存映射读取并做精确 MaxSim
+
+    用于对话上传文件产生的临时知识库：页数很少，无需建 Milvus 集合和索引。
+    """
+
+    def __init__(self, root: str = settings.local_vector_store_dir):
+        self.root = root
+
+    def _collection_dir(self, collection_name: str) -> str:
+        return os.path.join(self.root, collection_name)
+
+    def _file_dir(self, collection_name: str, file_id: str) -> str:
+        # file_id 来自用户名拼接，避免路径穿越
+        return os.path.join(
+            self._collection_dir(collection_name), file_id.replace(os.sep, "_")
+        )
+
+    def check_collection(self, collection_name: str) -> bool:
+        return os.path.isdir(self._collection_dir(collection_name))
+
+    def create_collection(self, collection_name: str, dim: int = 128, **kwargs):
+        # 量化和索引配置对精确检索无意义，忽略
+        # 多个 worker 可能同时创建同一临时知识库，已存在时保留其中的数据
+        os.makedirs(self._collection_dir(collection_name), exist_ok=True)
+
+    def delete_collection(self, collection_name: str):
+        shutil.rmtree(self._collection_dir(collection_name), ignore_errors=True)
+
+    def delete_files(self, collection_name: str, file_ids: list):
+        for file_id in file_ids:
+            shutil.rmtree(self._file_dir(collection_name, file_id), ignore_errors=True)
+
+    def insert_pages(self, collection_name: str, pages: list, **kwargs) -> int:
+        inserted = 0
+        pages_by_file = {}
+        for page in pages:
+            pages_by_file.setdefault(page["file_id"], []).append(page)
+        for file_id, file_pages in pages_by_file.items():
+            inserted += self._write_segment(collection_name, file_id, file_pages)
+        return inserted
+
+    def _write_segment(self, collection_name, file_id, pages) -> int:
+        file_dir = self._file_dir(collection_name, file_id)
+        os.makedirs(file_dir, exist_ok=True)
+        page_vectors = [
+            np.asarray(page["colqwen_vecs"], dtype=np.float16) for page in pages
+        ]
+        offsets = np.cumsum([0] + [len(vectors) for vectors in page_vectors])
+        meta = [
+            {
+                "image_id": page["image_id"],
+                "page_number": page["page_number"],
+                "start": int(offsets[i]),
+                "end": int(offsets[i + 1]),
+            }
+            for i, page in enumerate(pages)
+        ]
+
+        segment = os.path.join(file_dir, uuid.uuid4().hex)
+        # 先写临时文件再改名，其他进程不会读到写了一半的分段
+        with open(segment + ".tmp", "wb") as f:
+            np.save(f, np.concatenate(page_vectors))
+        os.replace(segment + ".tmp", segment + SEGMENT_VECTORS)
+        with open(segment + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(segment + ".tmp", segment + SEGMENT_META)
+        return int(offsets[-1])
+
+    def _iter_pages(self, collection_name, file_ids=None):
+        """遍历集合中的页，返回 (file_id, 页信息, 向量) 迭代器"""
+        collection_dir = self._collection_dir(collection_name)
+        if not os.path.isdir(collection_dir):
+            return
+        for file_id in file_ids or os.listdir(collection_dir):
+            file_dir = self._file_dir(collection_name, file_id)
+            if not os.path.isdir(file_dir):
+                continue
+            for name in os.listdir(file_dir):
+                if not name.endswith(SEGMENT_META):
+                    continue
+                segment = os.path.join(file_dir, name[: -len(SEGMENT_META)])
+                with open(segment + SEGMENT_META, encoding="utf-8") as f:
+                    meta = json.load(f)
+                vectors = np.load(segment + SEGMENT_VECTORS, mmap_mode="r")
+                for page in meta:
+                    yield file_id, page, vectors[page["start"] : page["end"]]
+
+    def search(
+        self,
+        collection_name: str,
+        data,
+        topk: int,
+        file_ids: list = None,
+        chunk_pages: int = 256,
+        **kwargs,
+    ) -> list:
+        # 对所有页做精确 MaxSim，按块计算以限制内存占用
+        heap = []
+        chunk = []
+
+        def score_chunk():
+            scores = maxsim_scores(data, [vectors for _, _, vectors in chunk])
+            for (file_id, page, _), score in zip(chunk, scores):
+                item = (
+                    float(score),
+                    page["image_id"],
+                    file_id,
+                    page["page_number"],
+                )
+                if len(heap) < topk:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+            chunk.clear()
+
+        for item in self._iter_pages(collection_name, file_ids):
+            chunk.append(item)
+            if len(chunk) >= chunk_pages:
+                score_chunk()
+        if chunk:
+            score_chunk()
+
+        return [
+            {
+                "score": score,
+                "image_id": image_id,
+                "file_id": file_id,
+                "page_number": page_number,
+            }
+            for score, image_id, file_id, page_number in sorted(heap, reverse=True)
+        ]
+
+
+local_vector_store = LocalVectorStore()
@@ -1,167 +1,1138 @@
-from pymilvus import MilvusClient, DataType
+import itertools
+import json
+import threading
+import time
+from pymilvus import (
+    AnnSearchRequest,
+    DataType,
+    Function,
+    FunctionType,
+    MilvusClient,
+    MilvusException,
+    RRFRanker,
+)
+from pymilvus.client.types import LoadState
 import numpy as np
-import concurrent.futures
 from app.core.config import settings
+from app.core.logging import logger
+from app.db.base_vector_store import VectorStore
+from app.db.index_profiles import (
+    INDEX_PROFILES,
+    build_search_params,
+    resolve_index_profile,
+)
+from app.db.query_pruning import prune_query_tokens
 
+# Milvus 单次 query 返回的最大行数
+MILVUS_QUERY_LIMIT = 16384
 
-class MilvusManager:
+# token 向量的存储模式：
+# - none:   FLOAT_VECTOR + HNSW
+# - int8:   FLOAT16_VECTOR + IVF_SQ8（索引为 int8 标量量化，原始 float16 用于重排）
+# - binary: BINARY_VECTOR + BIN_IVF_FLAT 做召回，另存 mmap 的 float16 副本用于重排
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+
+def maxsim_scores(query, docs):
+    """对多个文档一次性计算 ColBERT 式 MaxSim 分数
+
+    Args:
+        query: 查询的多向量，形状为 (n_query_tokens, dim)
+        docs: 文档多向量列表，每项形状为 (n_doc_tokens, dim)，长度可不同
+
+    Returns:
+        np.ndarray: 每个文档的分数，形状为 (len(docs),)
+    """
+    query = np.asarray(query, dtype=np.float32)
+    if not len(docs):
+        return np.zeros(0, dtype=np.float32)
+
+    lengths = np.array([len(doc) for doc in docs])
+    # 将不等长的文档补齐为一个 (n_docs, max_len, dim) 的张量
+    packed = np.zeros((len(docs), lengths.max(), query.shape[1]), dtype=np.float32)
+    for i, doc in enumerate(docs):
+        packed[i, : lengths[i]] = doc
+    mask = np.arange(lengths.max())[None, :] < lengths[:, None]
+
+    similarity = np.matmul(packed, query.T)  # (n_docs, max_len, n_query_tokens)
+    similarity[~mask] = -np.inf
+    return similarity.max(axis=1).sum(axis=1)
+
+
+def pool_vectors(vectors):
+    """将一页（或一个查询）的多向量均值池化为单个归一化向量"""
+    pooled = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(pooled)
+    return pooled / norm if norm > 0 else pooled
+
+
+def to_vector_array(value) -> np.ndarray:
+    # Milvus 返回的 float16 向量为 bytes（或仅含一个 bytes 的列表）
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], bytes):
+        value = value[0]
+    if isinstance(value, bytes):
+        return np.frombuffer(value, dtype=np.float16).astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def file_filter(file_ids) -> str:
+    return f"file_id in {json.dumps(list(file_ids))}"
+
+
+def kb_filter(kb_id: str) -> str:
+    return f"kb_id == {json.dumps(kb_id)}"
+
+
+def scoped_filter(kb_id: str, expr: str = "") -> str:
+    # 共享集合中的检索和删除都限定在单个知识库内
+    if not kb_id:
+        return expr
+    return f"{kb_filter(kb_id)} and ({expr})" if expr else kb_filter(kb_id)
+
+
+def page_collection_name(collection_name: str) -> str:
+    # 每页一个池化向量的候选集合，与 token 集合一一对应
+    return f"{collection_name}_pages"
+
+
+# 页文本字段的最大字节数（VARCHAR 上限 65535）
+PAGE_TEXT_MAX_BYTES = 60000
+
+
+def truncate_text(text: str, max_bytes: int = PAGE_TEXT_MAX_BYTES) -> str:
+    # 按 UTF-8 字节数截断，不截断多字节字符
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+
+
+def text_analyzer_params(analyzer: str) -> dict:
+    # jieba 为中文分词器，standard/english/chinese 为 Milvus 内置分析器（Milvus Lite 不支持 english/chinese）
+    if analyzer == "jieba":
+        return {"tokenizer": "jieba"}
+    return {"type": analyzer}
+
+
+# 多知识库共享的 token 集合，命名避开 colqwen* 前缀，不会被当作单个知识库的集合处理
+SHARED_COLLECTION_PREFIX = "shared_colqwen_"
+
+# Milvus 集合未加载的错误码
+COLLECTION_NOT_LOADED = 101
+
+
+def is_not_loaded_error(e: Exception) -> bool:
+    return isinstance(e, MilvusException) and (
+        e.code == COLLECTION_NOT_LOADED or "not loaded" in str(e.message).lower()
+    )
+
+
+def page_index_profile(index_profile: str) -> str:
+    # 页级集合始终为 float32 向量，token 集合使用二值索引时页级集合退回 HNSW
+    if INDEX_PROFILES[index_profile]["metric_type"] == "HAMMING":
+        return "hnsw"
+    return index_profile
+
+
+class MilvusManager(VectorStore):
     def __init__(self):
-        self.client = MilvusClient(uri=settings.milvus_uri)
+        # 每个 MilvusClient 为一个独立的 gRPC 连接，各线程按轮询固定使用其中一个
+        self._clients = [
+            MilvusClient(uri=settings.milvus_uri)
+            for _ in range(max(1, settings.milvus_pool_size))
+        ]
+        self._thread_clients = threading.local()
+        self._client_counter = itertools.count()
+        self._page_collections = {}  # token 集合名 -> 是否存在页级候选集合
+        self._storage_modes = {}  # token 集合名 -> (量化存储模式, 读取时间)
+        self._shared = {}  # 集合名 -> 是否为以 kb_id 为分区键的共享集合
+        self._text_index = {}  # token 集合名 -> 页级集合是否带有文本 BM25 稀疏索引
+        self._loaded = {}  # token 集合名 -> 最近一次确认已加载的时间
+        self._load_locks = {}  # token 集合名 -> 加载锁，同一集合的并发加载只执行一次
+
+    @property
+    def client(self) -> MilvusClient:
+        index = getattr(self._thread_clients, "index", None)
+        if index is None:
+            index = self._thread_clients.index = next(self._client_counter)
+        return self._clients[index % len(self._clients)]
+
+    @client.setter
+    def client(self, client):
+        # 替换为单个客户端（如测试中统计调用次数的代理）
+        self._clients = [client]
 
     def delete_collection(self, collection_name: str):
+        self._page_collections.pop(collection_name, None)
+        self._storage_modes.pop(collection_name, None)
+        self._shared.pop(collection_name, None)
+        self._text_index.pop(collection_name, None)
+        self._loaded.pop(collection_name, None)
+        if self.client.has_collection(page_collection_name(collection_name)):
+            self.client.drop_collection(page_collection_name(collection_name))
         if self.client.has_collection(collection_name):
             self.client.drop_collection(collection_name)
             return True
         else:
             return False
 
-    def delete_files(self, collection_name: str, file_ids: list):
-        filter = "file_id in ["
-        for file_id in file_ids:
-            filter += f"'{file_id}', "
-        filter += "]"
+    def delete_files(self, collection_name: str, file_ids: list, kb_id: str = None):
+        # file_id 为分区键，删除只涉及相关分区；共享集合按 kb_id 裁剪分区
+        self.ensure_loaded(collection_name)
+        filter = scoped_filter(kb_id, file_filter(file_ids))
         res = self.client.delete(
             collection_name=collection_name,
             filter=filter,
         )
+        if self.has_page_index(collection_name):
+            self.client.delete(
+                collection_name=page_collection_name(collection_name),
+                filter=filter,
+            )
+        return res
+
+    def compact(self, collection_name: str) -> list:
+        """触发 compaction 合并段并物理清理已删除的向量，返回 compaction 任务ID"""
+        job_ids = [self.client.compact(collection_name)]
+        if self.has_page_index(collection_name):
+            job_ids.append(self.client.compact(page_collection_name(collection_name)))
+        return job_ids
+
+    def delete_knowledge_base(self, collection_name: str, kb_id: str):
+        """从共享集合中删除一个知识库的全部向量"""
+        self.ensure_loaded(collection_name)
+        res = self.client.delete(
+            collection_name=collection_name, filter=kb_filter(kb_id)
+        )
+        if self.has_page_index(collection_name):
+            self.client.delete(
+                collection_name=page_collection_name(collection_name),
+                filter=kb_filter(kb_id),
+            )
         return res
 
+    def count_knowledge_base(self, collection_name: str, kb_id: str) -> int:
+        """共享集合中一个知识库的向量数，0 表示知识库不在该集合中"""
+        self.ensure_loaded(collection_name)
+        return self.client.query(
+            collection_name=collection_name,
+            filter=kb_filter(kb_id),
+            output_fields=["count(*)"],
+        )[0]["count(*)"]
+
+    def is_shared(self, collection_name: str) -> bool:
+        if collection_name not in self._shared:
+            self._shared[collection_name] = self._has_field(collection_name, "kb_id")
+        return self._shared[collection_name]
+
     def check_collection(self, collection_name: str):
         if self.client.has_collection(collection_name):
             return True
         else:
             return False
 
-    def create_collection(self, collection_name: str, dim: int = 128) -> None:
+    def has_page_index(self, collection_name: str) -> bool:
+        if collection_name not in self._page_collections:
+            self._page_collections[collection_name] = self.client.has_collection(
+                page_collection_name(collection_name)
+            )
+        return self._page_collections[collection_name]
 
-        if self.client.has_collection(collection_name):
-            self.client.drop_collection(collection_name)
+    def has_text_index(self, collection_name: str) -> bool:
+        """页级集合是否存有页文本及其 BM25 稀疏向量（早期创建的集合没有）"""
+        if collection_name not in self._text_index:
+            self._text_index[collection_name] = self.has_page_index(
+                collection_name
+            ) and self._has_field(page_collection_name(collection_name), "sparse")
+        return self._text_index[collection_name]
+
+    def partition_key(self, collection_name: str):
+        """集合的分区键字段名（file_id / kb_id），未分区时为 None"""
+        return next(
+            (
+                field["name"]
+                for field in self.client.describe_collection(collection_name)["fields"]
+                if field.get("is_partition_key")
+            ),
+            None,
+        )
+
+    def _has_field(self, collection_name: str, field_name: str) -> bool:
+        return any(
+            field["name"] == field_name
+            for field in self.client.describe_collection(collection_name)["fields"]
+        )
+
+    def ensure_loaded(self, collection_name: str) -> None:
+        """按需加载 token 集合及其页级集合
+
+        确认结果在进程内缓存 milvus_load_check_interval 秒；
+        其他进程可能在此期间释放集合，检索时遇到未加载错误会重新加载。
+        """
+        if self._is_load_checked(collection_name):
+            return
+        with self._load_locks.setdefault(collection_name, threading.Lock()):
+            # 等锁期间其他线程可能已完成加载
+            if self._is_load_checked(collection_name):
+                return
+            names = [collection_name]
+            if self.has_page_index(collection_name):
+                names.append(page_collection_name(collection_name))
+            for name in names:
+                if self.client.get_load_state(name)["state"] != LoadState.Loaded:
+                    logger.info(f"Loading Milvus collection {name}")
+                    self.client.load_collection(name)
+            self._loaded[collection_name] = time.monotonic()
+
+    def _is_load_checked(self, collection_name: str) -> bool:
+        checked = self._loaded.get(collection_name)
+        return (
+            checked is not None
+            and time.monotonic() - checked < settings.milvus_load_check_interval
+        )
+
+    def release_collection(self, collection_name: str) -> None:
+        """释放 token 集合及其页级集合占用的内存，数据仍保留"""
+        with self._load_locks.setdefault(collection_name, threading.Lock()):
+            self._loaded.pop(collection_name, None)
+            self.client.release_collection(collection_name)
+            if self.has_page_index(collection_name):
+                self.client.release_collection(page_collection_name(collection_name))
+
+    def loaded_collections(self) -> dict:
+        """返回已加载的 token 集合（colqwen* 及共享集合）及其向量数（含页级集合）"""
+        names = set(self.client.list_collections())
+        loaded = {}
+        for name in names:
+            if (
+                not name.startswith(("colqwen", SHARED_COLLECTION_PREFIX))
+                or name.endswith(("_pages", "_migrating", "_backup", "_tune"))
+                or self.client.get_load_state(name)["state"] != LoadState.Loaded
+            ):
+                continue
+            loaded[name] = int(self.client.get_collection_stats(name)["row_count"])
+            if page_collection_name(name) in names:
+                loaded[name] += int(
+                    self.client.get_collection_stats(page_collection_name(name))[
+                        "row_count"
+                    ]
+                )
+        return loaded
+
+    def storage_mode(self, collection_name: str) -> str:
+        # 根据集合 schema 判断 token 向量的量化存储模式
+        # 缓存 milvus_schema_check_interval 秒，其他进程迁移存储模式后能重新读取
+        cached = self._storage_modes.get(collection_name)
+        if (
+            cached is not None
+            and time.monotonic() - cached[1] < settings.milvus_schema_check_interval
+        ):
+            return cached[0]
+        fields = {
+            field["name"]: field["type"]
+            for field in self.client.describe_collection(collection_name)["fields"]
+        }
+        if fields.get("vector") == DataType.BINARY_VECTOR:
+            mode = "binary"
+        elif fields.get("vector") == DataType.FLOAT16_VECTOR:
+            mode = "int8"
+        else:
+            mode = "none"
+        self._storage_modes[collection_name] = (mode, time.monotonic())
+        return mode
+
+    def create_collection(
+        self,
+        collection_name: str,
+        dim: int = 128,
+        page_index: bool = None,
+        quantization: str = None,
+        index_profile: str = None,
+        partition_key: str = "file_id",
+    ) -> None:
+        """创建 token 集合（及页级集合）；partition_key 为 kb_id 时为多知识库共享集合"""
+        if page_index is None:
+            page_index = settings.milvus_page_index
+        quantization = quantization or settings.milvus_quantization
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization mode: {quantization}")
+        index_profile = resolve_index_profile(index_profile, quantization)
+
+        self.delete_collection(collection_name)
+        self._create_collection(
+            collection_name, dim, quantization, index_profile, partition_key
+        )
+        text = False
+        if page_index:
+            text = self._create_page_collection(
+                collection_name, dim, index_profile, partition_key
+            )
+        self._page_collections[collection_name] = page_index
+        self._text_index[collection_name] = text
 
+    def _create_page_collection(
+        self, collection_name: str, dim: int, index_profile: str, partition_key: str
+    ) -> bool:
+        """创建页级候选集合，返回是否带有页文本 BM25 索引"""
+        page_name = page_collection_name(collection_name)
+        # 页级集合每页只有一个向量，内存占用很小，始终使用 float32
+        # 页级集合同时存放页文本，用于 BM25 关键词召回
+        # 数据量小，按文件过滤靠 file_id 倒排索引即可，只有共享集合按 kb_id 分区
+        partition_key = "kb_id" if partition_key == "kb_id" else None
+        try:
+            self._create_collection(
+                page_name,
+                dim,
+                index_profile=page_index_profile(index_profile),
+                partition_key=partition_key,
+                text=True,
+            )
+            return True
+        except MilvusException as e:
+            # 部署不支持配置的分词器时只保留稠密召回，不影响创建知识库
+            logger.warning(
+                f"Create text index for {page_name} failed, using dense recall only: {str(e)}"
+            )
+        if self.client.has_collection(page_name):
+            self.client.drop_collection(page_name)
+        self._create_collection(
+            page_name,
+            dim,
+            index_profile=page_index_profile(index_profile),
+            partition_key=partition_key,
+        )
+        return False
+
+    def _create_collection(
+        self,
+        collection_name: str,
+        dim: int,
+        quantization: str = "none",
+        index_profile: str = None,
+        partition_key: str = "file_id",
+        text: bool = False,
+    ) -> None:
         schema = self.client.create_schema(
             auto_id=True,
             enable_dynamic_fields=True,
         )
         schema.add_field(field_name="pk", datatype=DataType.INT64, is_primary=True)
-        schema.add_field(field_name="vector", datatype=DataType.FLOAT_VECTOR, dim=dim)
+        if quantization == "binary":
+            schema.add_field(
+                field_name="vector", datatype=DataType.BINARY_VECTOR, dim=dim
+            )
+            # 仅在重排时按 image_id 读取，使用 mmap 避免常驻内存
+            schema.add_field(
+                field_name="vector_fp16",
+                datatype=DataType.FLOAT16_VECTOR,
+                dim=dim,
+                mmap_enabled=True,
+            )
+        elif quantization == "int8":
+            schema.add_field(
+                field_name="vector", datatype=DataType.FLOAT16_VECTOR, dim=dim
+            )
+        else:
+            schema.add_field(
+                field_name="vector", datatype=DataType.FLOAT_VECTOR, dim=dim
+            )
         schema.add_field(
             field_name="image_id", datatype=DataType.VARCHAR, max_length=65535
         )
         schema.add_field(field_name="page_number", datatype=DataType.INT64)
+        # 以 file_id 作为分区键，同一文件的向量落在同一分区，删除和按文件过滤时可裁剪分区
+        # 共享集合改以 kb_id 作为分区键，检索和删除按知识库裁剪分区；partition_key 为 None 时不分区
         schema.add_field(
-            field_name="file_id", datatype=DataType.VARCHAR, max_length=65535
+            field_name="file_id",
+            datatype=DataType.VARCHAR,
+            max_length=65535,
+            is_partition_key=partition_key == "file_id",
+        )
+        if partition_key == "kb_id":
+            schema.add_field(
+                field_name="kb_id",
+                datatype=DataType.VARCHAR,
+                max_length=256,
+                is_partition_key=True,
+            )
+        if text:
+            # 页文本由 Milvus 分词并通过 BM25 函数生成稀疏向量，写入时只需提供文本
+            schema.add_field(
+                field_name="text",
+                datatype=DataType.VARCHAR,
+                max_length=65535,
+                enable_analyzer=True,
+                analyzer_params=text_analyzer_params(settings.milvus_text_analyzer),
+            )
+            schema.add_field(field_name="sparse", datatype=DataType.SPARSE_FLOAT_VECTOR)
+            schema.add_function(
+                Function(
+                    name="text_bm25",
+                    function_type=FunctionType.BM25,
+                    input_field_names=["text"],
+                    output_field_names=["sparse"],
+                )
+            )
+
+        # Milvus 集群的分区总数有限，单个知识库的集合只用少量分区
+        num_partitions = {
+            "file_id": settings.milvus_num_partitions,
+            "kb_id": settings.milvus_shared_num_partitions,
+        }.get(partition_key)
+        self.client.create_collection(
+            collection_name=collection_name,
+            schema=schema,
+            **({"num_partitions": num_partitions} if num_partitions else {}),
         )
+        self._storage_modes[collection_name] = (quantization, time.monotonic())
+        self._shared[collection_name] = partition_key == "kb_id"
+        self._create_index(collection_name, index_profile)
 
-        self.client.create_collection(collection_name=collection_name, schema=schema)
-        self._create_index(collection_name)
+    def rebuild_index(self, collection_name: str, index_profile: str) -> None:
+        """按新的索引配置重建 token 集合（及页级集合）的向量索引"""
+        index_profile = resolve_index_profile(
+            index_profile, self.storage_mode(collection_name)
+        )
+        self._create_index(collection_name, index_profile)
+        if self.has_page_index(collection_name):
+            self._create_index(
+                page_collection_name(collection_name),
+                page_index_profile(index_profile),
+            )
 
-    def _create_index(self, collection_name):
+    def _create_index(self, collection_name, index_profile=None):
         # Create an index on the vector field to enable fast similarity search.
         # Releases and drops any existing index before creating a new one with specified parameters.
+        # 建索引后不加载，首次检索时再按需加载
+        self._loaded.pop(collection_name, None)
         self.client.release_collection(collection_name=collection_name)
-        self.client.drop_index(collection_name=collection_name, index_name="vector")
+        # 逐个删除时重新列出索引，部分部署删除一个索引会连带删除同集合的其他索引
+        while indexes := self.client.list_indexes(collection_name=collection_name):
+            self.client.drop_index(
+                collection_name=collection_name, index_name=indexes[0]
+            )
         index_params = self.client.prepare_index_params()
+        # 标量倒排索引，加速按 image_id 拉取重排向量和按 file_id 过滤
+        index_params.add_index(
+            field_name="image_id", index_name="image_id_index", index_type="INVERTED"
+        )
+        index_params.add_index(
+            field_name="file_id", index_name="file_id_index", index_type="INVERTED"
+        )
+        if self.is_shared(collection_name):
+            index_params.add_index(
+                field_name="kb_id", index_name="kb_id_index", index_type="INVERTED"
+            )
+        mode = self.storage_mode(collection_name)
+        profile = INDEX_PROFILES[resolve_index_profile(index_profile, mode)]
         index_params.add_index(
             field_name="vector",
             index_name="vector_index",
-            index_type="HNSW",  # or any other index type you want
-            metric_type="IP",  # or the appropriate metric type
-            params={
-                "M": 16,
-                "efConstruction": 500,
-            },  # adjust these parameters as needed
+            index_type=profile["index_type"],
+            metric_type=profile["metric_type"],
+            params=profile["build"],
         )
+        if self._has_field(collection_name, "sparse"):
+            index_params.add_index(
+                field_name="sparse",
+                index_name="sparse_index",
+                index_type="SPARSE_INVERTED_INDEX",
+                metric_type="BM25",
+            )
+        if mode == "binary":
+            # 每个向量字段都必须建索引才能 load；FLAT 索引会另存一份 float16 向量，
+            # 同样开启 mmap，否则整份副本常驻内存
+            index_params.add_index(
+                field_name="vector_fp16",
+                index_name="vector_fp16_index",
+                index_type="FLAT",
+                metric_type="IP",
+                params={"mmap.enabled": True},
+            )
 
         self.client.create_index(
             collection_name=collection_name, index_params=index_params, sync=True
         )
-        self.client.load_collection(collection_name)
 
-    def search(self, collection_name, data, topk):
+    def search(
+        self,
+        collection_name,
+        data,
+        topk,
+        candidate_limit=None,
+        file_ids=None,
+        index_profile=None,
+        search_params=None,
+        kb_id=None,
+        query_text=None,
+        query_prune=None,
+    ):
+        return self.search_batch(
+            collection_name,
+            [data],
+            topk,
+            candidate_limit=candidate_limit,
+            file_ids=file_ids,
+            index_profile=index_profile,
+            search_params=search_params,
+            kb_id=kb_id,
+            query_texts=[query_text],
+            query_prune=query_prune,
+        )[0]
+
+    def search_batch(
+        self,
+        collection_name,
+        queries,
+        topk,
+        candidate_limit=None,
+        file_ids=None,
+        index_profile=None,
+        search_params=None,
+        kb_id=None,
+        query_texts=None,
+        query_prune=None,
+    ):
+        """一次检索多个查询，返回与 queries 一一对应的结果列表
+
+        第一阶段把所有查询合并为少量 ANN 请求，各查询的候选页去重后只拉取一次向量再分别重排。
+        """
+        # 两个阶段都使用裁剪后的查询 token，分数按裁剪比例放大，与未裁剪时的阈值保持可比
+        pruned = [
+            prune_query_tokens(
+                data,
+                query_prune or settings.milvus_query_prune,
+                keep_ratio=settings.milvus_query_prune_keep_ratio,
+                min_tokens=settings.milvus_query_prune_min_tokens,
+                similarity=settings.milvus_query_prune_similarity,
+            )
+            for data in queries
+        ]
+        search_args = dict(
+            candidate_limit=candidate_limit,
+            file_ids=file_ids,
+            index_profile=index_profile,
+            search_params=search_params,
+            kb_id=kb_id,
+            query_texts=query_texts,
+        )
+        self.ensure_loaded(collection_name)
+        try:
+            results = self._search(collection_name, pruned, topk, **search_args)
+        except MilvusException as e:
+            if not is_not_loaded_error(e):
+                raise
+            # 集合已被其他进程释放，重新加载后重试一次
+            self._loaded.pop(collection_name, None)
+            self.ensure_loaded(collection_name)
+            results = self._search(collection_name, pruned, topk, **search_args)
+        for data, kept, scores in zip(queries, pruned, results):
+            if len(data) != len(kept):
+                for score in scores:
+                    score["score"] *= len(data) / len(kept)
+        return results
+
+    def _search(
+        self,
+        collection_name,
+        queries,
+        topk,
+        candidate_limit=None,
+        file_ids=None,
+        index_profile=None,
+        search_params=None,
+        kb_id=None,
+        query_texts=None,
+    ):
         # Perform a vector search on the collection to find the top-k most similar documents.
-        search_params = {"metric_type": "IP", "params": {}}
-        results = self.client.search(
+        # 第一阶段只召回候选页的 image_id，第二阶段对候选页做完整 MaxSim 重排
+        candidate_limit = min(
+            max(candidate_limit or settings.milvus_candidate_limit, topk),
+            MILVUS_QUERY_LIMIT,
+        )
+        candidates = self._search_candidates(
             collection_name,
-            data,
-            limit=int(50),
-            output_fields=["vector", "image_id", "page_number", "file_id"],
+            queries,
+            candidate_limit,
+            file_ids=file_ids,
+            index_profile=index_profile,
             search_params=search_params,
+            kb_id=kb_id,
+            query_texts=query_texts,
         )
-        image_ids = set()
-        for r_id in range(len(results)):
-            for r in range(len(results[r_id])):
-                image_ids.add(results[r_id][r]["entity"]["image_id"])
-
-        scores = []
-
-        def rerank_single_doc(image_id, data, client, collection_name):
-            # Rerank a single document by retrieving its embeddings and calculating the similarity with the query.
-            doc_colbert_vecs = client.query(
-                collection_name=collection_name,
-                filter=f"image_id in ['{image_id}']",
-                output_fields=["vector", "image_id", "page_number", "file_id"],
-                limit=1000,
-            )
-            # 提取元数据（假设同一 image_id 对应的 file_id 和 page_number 是相同的）
-            if not doc_colbert_vecs:
-                return (
-                    0.0,
-                    {"image_id": image_id, "file_id": None, "page_number": None},
-                )
+        # 多个查询召回的相同页只拉取一次
+        pages = self.fetch_page_vectors(
+            collection_name,
+            {
+                image_id: file_id
+                for query_candidates in candidates
+                for image_id, file_id in query_candidates.items()
+            },
+        )
+        # 返回 Top-K 结果，包含所有字段
+        return [
+            self._rerank(
+                data,
+                {
+                    image_id: pages[image_id]
+                    for image_id in query_candidates
+                    if image_id in pages
+                },
+            )[:topk]
+            for data, query_candidates in zip(queries, candidates)
+        ]
 
-            # 取第一条记录的元数据（假设同一 image_id 的 file_id 和 page_number 一致）
-            metadata = {
-                "image_id": image_id,
-                "file_id": doc_colbert_vecs[0]["file_id"],
-                "page_number": doc_colbert_vecs[0]["page_number"],
-            }
+    def _search_candidates(
+        self,
+        collection_name,
+        queries,
+        candidate_limit,
+        file_ids=None,
+        index_profile=None,
+        search_params=None,
+        kb_id=None,
+        query_texts=None,
+    ):
+        # 返回每个查询的候选页 image_id -> file_id
+        # file_ids 不为空时只在这些文件中检索；index_profile/search_params 为知识库的索引配置
+        # kb_id 不为空时在共享集合中只检索该知识库
+        # query_texts 中有文本且页级集合有文本索引时，稠密召回与 BM25 召回经 RRF 融合后再重排
+        search_filter = scoped_filter(kb_id, file_filter(file_ids) if file_ids else "")
+        index_profile = resolve_index_profile(
+            index_profile, self.storage_mode(collection_name)
+        )
+        candidates = [{} for _ in queries]
 
-            doc_vecs = np.vstack(
-                [doc_colbert_vecs[i]["vector"] for i in range(len(doc_colbert_vecs))]
+        def collect(positions, results):
+            for position, hits in zip(positions, results):
+                for hit in hits:
+                    entity = hit["entity"]
+                    candidates[position][entity["image_id"]] = entity["file_id"]
+
+        query_texts = query_texts or [None] * len(queries)
+        hybrid = []
+        if self.has_text_index(collection_name):
+            hybrid = [i for i, text in enumerate(query_texts) if text and text.strip()]
+        if hybrid:
+            dense_params = build_search_params(
+                page_index_profile(index_profile), candidate_limit, search_params
+            )
+            results = self.client.hybrid_search(
+                page_collection_name(collection_name),
+                [
+                    AnnSearchRequest(
+                        data=[pool_vectors(queries[i]).tolist() for i in hybrid],
+                        anns_field="vector",
+                        param=dense_params,
+                        limit=candidate_limit,
+                        expr=search_filter,
+                    ),
+                    AnnSearchRequest(
+                        data=[query_texts[i] for i in hybrid],
+                        anns_field="sparse",
+                        param={"metric_type": "BM25", "params": {}},
+                        limit=candidate_limit,
+                        expr=search_filter,
+                    ),
+                ],
+                RRFRanker(settings.milvus_rrf_k),
+                limit=candidate_limit,
+                output_fields=["image_id", "file_id"],
             )
-            score = np.dot(data, doc_vecs.T).max(1).sum()
-            return (score, metadata)
+            collect(hybrid, results)
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=300) as executor:
-            futures = {
-                executor.submit(
-                    rerank_single_doc, image_id, data, self.client, collection_name
-                ): image_id
-                for image_id in image_ids
-            }
-            for future in concurrent.futures.as_completed(futures):
-                score, metadata = future.result()
-                scores.append((score, metadata))  # 保存元数据
+        dense = sorted(set(range(len(queries))) - set(hybrid))
+        if not dense:
+            return candidates
+        if self.has_page_index(collection_name):
+            # 用池化后的查询向量在页级集合中召回，每个查询一个向量，一次 ANN 搜索即可
+            results = self.client.search(
+                page_collection_name(collection_name),
+                [pool_vectors(queries[i]).tolist() for i in dense],
+                filter=search_filter,
+                limit=candidate_limit,
+                output_fields=["image_id", "file_id"],
+                search_params=build_search_params(
+                    page_index_profile(index_profile), candidate_limit, search_params
+                ),
+            )
+            collect(dense, results)
+            return candidates
 
-        scores.sort(key=lambda x: x[0], reverse=True)
-        # 返回 Top-K 结果，包含所有字段
+        # 所有查询的 token 合并检索，按返回结果总数分批
+        vectors = np.concatenate(
+            [np.asarray(queries[i], dtype=np.float32) for i in dense]
+        )
+        owners = np.repeat(dense, [len(queries[i]) for i in dense])
+        step = max(1, MILVUS_QUERY_LIMIT // candidate_limit)
+        search_params = build_search_params(
+            index_profile, candidate_limit, search_params
+        )
+        for start in range(0, len(vectors), step):
+            results = self.client.search(
+                collection_name,
+                self._encode_vectors(collection_name, vectors[start : start + step])[
+                    "vector"
+                ],
+                filter=search_filter,
+                limit=candidate_limit,
+                output_fields=["image_id", "file_id"],
+                search_params=search_params,
+            )
+            collect(owners[start : start + step], results)
+        return candidates
+
+    def _rerank(self, data, pages):
+        # 对候选页一次性向量化计算 MaxSim 并按分数降序返回
+        if not pages:
+            return []
+
+        page_ids = list(pages.keys())
+        scores = maxsim_scores(
+            data, [pages[image_id]["vectors"] for image_id in page_ids]
+        )
+        order = np.argsort(-scores)
         return [
             {
-                "score": score,
-                "image_id": metadata["image_id"],
-                "file_id": metadata["file_id"],
-                "page_number": metadata["page_number"],
+                "score": float(scores[i]),
+                "image_id": page_ids[i],
+                "file_id": pages[page_ids[i]]["file_id"],
+                "page_number": pages[page_ids[i]]["page_number"],
             }
-            for score, metadata in scores[:topk]
+            for i in order
         ]
 
+    def fetch_page_vectors(self, collection_name, candidates):
+        # 按 image_id 分批查询，每批只发起一次 Milvus 请求
+        # candidates 为 image_id -> file_id，带上 file_id 条件以裁剪分区
+        self.ensure_loaded(collection_name)
+        pages = {}
+        image_ids = list(candidates)
+        batch_size = max(1, settings.milvus_rerank_fetch_pages)
+        for i in range(0, len(image_ids), batch_size):
+            self._query_page_vectors(
+                collection_name,
+                {
+                    image_id: candidates[image_id]
+                    for image_id in image_ids[i : i + batch_size]
+                },
+                pages,
+            )
+        return pages
+
+    def _query_page_vectors(self, collection_name, candidates, pages):
+        # 量化集合使用 float16 副本重排，而不是召回用的量化向量
+        vector_field = (
+            "vector_fp16"
+            if self.storage_mode(collection_name) == "binary"
+            else "vector"
+        )
+        image_ids = list(candidates)
+        rows = self.client.query(
+            collection_name=collection_name,
+            filter=f"{file_filter(set(candidates.values()))} and image_id in {json.dumps(image_ids)}",
+            output_fields=[vector_field, "image_id", "page_number", "file_id"],
+            limit=MILVUS_QUERY_LIMIT,
+        )
+        # 结果被截断时拆分批次重新拉取，避免漏掉部分 token 向量
+        if len(rows) >= MILVUS_QUERY_LIMIT and len(image_ids) > 1:
+            middle = len(image_ids) // 2
+            for part in (image_ids[:middle], image_ids[middle:]):
+                self._query_page_vectors(
+                    collection_name,
+                    {image_id: candidates[image_id] for image_id in part},
+                    pages,
+                )
+            return
+
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row["image_id"], []).append(row)
+        for image_id, page_rows in grouped.items():
+            # 同一 image_id 的 file_id 和 page_number 一致，取第一条记录的元数据
+            pages[image_id] = {
+                "file_id": page_rows[0]["file_id"],
+                "page_number": page_rows[0]["page_number"],
+                "vectors": np.vstack(
+                    [to_vector_array(row[vector_field]) for row in page_rows]
+                ),
+            }
+
+    def _encode_vectors(self, collection_name, vectors):
+        # 按集合的存储模式编码 token 向量，返回 字段名 -> 每行的取值
+        vectors = np.asarray(vectors, dtype=np.float32)
+        mode = self.storage_mode(collection_name)
+        if mode == "binary":
+            return {
+                "vector": [bits.tobytes() for bits in np.packbits(vectors > 0, axis=1)],
+                "vector_fp16": list(vectors.astype(np.float16)),
+            }
+        if mode == "int8":
+            return {"vector": list(vectors.astype(np.float16))}
+        return {"vector": vectors.tolist()}
+
     def insert(self, data, collection_name):
         # Insert ColQwen embeddings and metadata for a document into the collection.
-        colqwen_vecs = [vec for vec in data["colqwen_vecs"]]
-        seq_length = len(colqwen_vecs)
+        self.insert_pages(collection_name, [data])
 
-        # Insert the data as multiple vectors (one for each sequence) along with the corresponding metadata.
-        self.client.insert(
-            collection_name,
-            [
-                {
-                    "vector": colqwen_vecs[i],
-                    "image_id": data["image_id"],
-                    "page_number": data["page_number"],
-                    "file_id": data["file_id"],
-                }
-                for i in range(seq_length)
-            ],
+    def insert_pages(self, collection_name, pages, batch_rows: int = None) -> int:
+        """批量写入多页（可跨文件）的 token 向量，返回写入的向量数
+
+        按页打包为不超过 batch_rows 行的批次，每个批次只发起一次 insert，
+        单页不会被拆到两个批次中，以便失败时按 image_id 清理后整体重试。
+        """
+        batch_rows = batch_rows or settings.milvus_insert_batch_rows
+        inserted = 0
+        batch, batch_size = [], 0
+        for page in pages:
+            page_size = len(page["colqwen_vecs"])
+            if batch and batch_size + page_size > batch_rows:
+                inserted += self._insert_batch(collection_name, batch)
+                batch, batch_size = [], 0
+            batch.append(page)
+            batch_size += page_size
+        if batch:
+            inserted += self._insert_batch(collection_name, batch)
+        return inserted
+
+    def _insert_batch(self, collection_name, pages) -> int:
+        # 整批 token 向量一次拼接和编码；MilvusClient.insert 只接受行格式，
+        # 每个向量仍是一行，行内直接引用编码结果和所在页的元数据
+        page_vectors = [
+            np.asarray(page["colqwen_vecs"], dtype=np.float32) for page in pages
+        ]
+        encoded = list(
+            self._encode_vectors(collection_name, np.concatenate(page_vectors)).items()
+        )
+        # 共享集合的每页带有所属知识库的 kb_id
+        fields = ["image_id", "page_number", "file_id"]
+        if self.is_shared(collection_name):
+            fields.append("kb_id")
+        rows = []
+        start = 0
+        for page, vectors in zip(pages, page_vectors):
+            metadata = {field: page[field] for field in fields}
+            rows.extend(
+                {**metadata, **{name: values[i] for name, values in encoded}}
+                for i in range(start, start + len(vectors))
+            )
+            start += len(vectors)
+        page_rows = [
+            {
+                "vector": pool_vectors(vectors).tolist(),
+                **{field: page[field] for field in fields},
+            }
+            for page, vectors in zip(pages, page_vectors)
+        ]
+        if self.has_text_index(collection_name):
+            for page_row, page in zip(page_rows, pages):
+                page_row["text"] = truncate_text(page.get("text") or "")
+
+        image_filter = f"image_id in {json.dumps([page['image_id'] for page in pages])}"
+        for attempt in range(settings.milvus_insert_retries + 1):
+            try:
+                self._insert_rows(collection_name, rows)
+                if self.has_page_index(collection_name):
+                    self._insert_rows(page_collection_name(collection_name), page_rows)
+                return len(rows)
+            except Exception as e:
+                if attempt == settings.milvus_insert_retries:
+                    raise
+                logger.warning(
+                    f"Milvus insert into {collection_name} failed (attempt {attempt + 1}), retrying: {str(e)}"
+                )
+                # 清理本批次可能已部分写入的数据，避免重试后出现重复向量
+                self.ensure_loaded(collection_name)
+                self.client.delete(collection_name=collection_name, filter=image_filter)
+                if self.has_page_index(collection_name):
+                    self.client.delete(
+                        collection_name=page_collection_name(collection_name),
+                        filter=image_filter,
+                    )
+                time.sleep(2**attempt)
+
+    def _insert_rows(self, collection_name, rows):
+        res = self.client.insert(collection_name, rows)
+        if res["insert_count"] != len(rows):
+            raise RuntimeError(
+                f"Partial insert into {collection_name}: {res['insert_count']}/{len(rows)} rows"
+            )
+
+    def migrate_quantization(
+        self, collection_name: str, quantization: str, batch_size: int = 4096
+    ) -> int:
+        """将已有 token 集合迁移为指定的量化存储模式，返回迁移的向量数
+
+        先写入临时集合，校验行数后将旧集合改名为备份、临时集合改为原名，
+        最后删除备份，任一步失败时原集合的数据仍在；页级候选集合不受影响。
+        """
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization mode: {quantization}")
+        backup_name = f"{collection_name}_backup"
+        if self.client.has_collection(backup_name):
+            if self.client.has_collection(collection_name):
+                # 上次迁移已完成替换，只是未删除备份
+                self.client.drop_collection(backup_name)
+            else:
+                # 上次迁移在两次改名之间中断，恢复原集合
+                self.client.rename_collection(backup_name, collection_name)
+        source_mode = self.storage_mode(collection_name)
+        if source_mode == quantization:
+            return 0
+
+        target_name = f"{collection_name}_migrating"
+        migrated = self.copy_collection(
+            collection_name, target_name, quantization, batch_size=batch_size
+        )
+        self.client.rename_collection(collection_name, backup_name)
+        try:
+            self.client.rename_collection(target_name, collection_name)
+        except Exception:
+            self.client.rename_collection(backup_name, collection_name)
+            raise
+        self.client.drop_collection(backup_name)
+        self._storage_modes[collection_name] = (quantization, time.monotonic())
+        self._storage_modes.pop(target_name, None)
+        self._loaded.pop(collection_name, None)
+        return migrated
+
+    def copy_collection(
+        self,
+        source_name: str,
+        target_name: str,
+        quantization: str = None,
+        index_profile: str = None,
+        batch_size: int = 4096,
+    ) -> int:
+        """将集合的全部向量复制到新建的目标集合（可改变存储模式和索引），返回复制的向量数"""
+        source_mode = self.storage_mode(source_name)
+        quantization = quantization or source_mode
+        vector_field = "vector_fp16" if source_mode == "binary" else "vector"
+        dim = next(
+            field["params"]["dim"]
+            for field in self.client.describe_collection(source_name)["fields"]
+            if field["name"] == vector_field
         )
+        # 目标集合沿用原集合的分区键，共享集合按 kb_id 分区并复制 kb_id
+        partition_key = self.partition_key(source_name)
+        metadata_fields = ["image_id", "page_number", "file_id"]
+        if partition_key == "kb_id":
+            metadata_fields.append("kb_id")
+        # 页级集合带有页文本时一并复制，稀疏向量由目标集合的 BM25 函数重新生成
+        text = self._has_field(source_name, "text")
+        if text:
+            metadata_fields.append("text")
+        if self.client.has_collection(target_name):
+            self.client.drop_collection(target_name)
+        self._create_collection(
+            target_name,
+            dim,
+            quantization,
+            index_profile,
+            partition_key=partition_key,
+            text=text,
+        )
+
+        self.ensure_loaded(source_name)
+        copied = 0
+        iterator = self.client.query_iterator(
+            collection_name=source_name,
+            batch_size=batch_size,
+            output_fields=[vector_field, *metadata_fields],
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                columns = self._encode_vectors(
+                    target_name,
+                    np.vstack([to_vector_array(row[vector_field]) for row in rows]),
+                )
+                self._insert_rows(
+                    target_name,
+                    [
+                        {
+                            **{field: values[i] for field, values in columns.items()},
+                            **{field: row[field] for field in metadata_fields},
+                        }
+                        for i, row in enumerate(rows)
+                    ],
+                )
+                copied += len(rows)
+        finally:
+            iterator.close()
+
+        self.client.flush(target_name)
+        self.client.load_collection(target_name)
+        target_count = self.client.query(
+            collection_name=target_name, filter="", output_fields=["count(*)"]
+        )[0]["count(*)"]
+        if target_count != copied:
+            self.client.drop_collection(target_name)
+            raise RuntimeError(
+                f"Copy of {source_name} incomplete: {target_count}/{copied} vectors"
+            )
+        return copied
+
+    def iter_pages(self, collection_name: str, batch_size: int = 4096):
+        """按批遍历集合中的完整页，每批为页列表
+
+        每页为 {"colqwen_vecs", "image_id", "page_number", "file_id"}，
+        同一页的 token 可能跨批次返回，凑齐后才输出。
+
+        依赖同一页的 token 连续返回：query_iterator 按主键顺序遍历，
+        一页的 token 总在同一次 insert 中写入（见 insert_pages），自增主键连续。
+        遇到已输出过的页时抛出 RuntimeError，而不是把一页拆成两页。
+        """
+        vector_field = (
+            "vector_fp16"
+            if self.storage_mode(collection_name) == "binary"
+            else "vector"
+        )
+        self.ensure_loaded(collection_name)
+        iterator = self.client.query_iterator(
+            collection_name=collection_name,
+            batch_size=batch_size,
+            output_fields=[vector_field, "image_id", "page_number", "file_id"],
+        )
+        pending = {}  # image_id -> 页信息
+        emitted = set()  # 已输出的页
+
+        def pop_pages(image_ids):
+            emitted.update(image_ids)
+            pages = [pending.pop(image_id) for image_id in image_ids]
+            for page in pages:
+                page["colqwen_vecs"] = np.vstack(page["colqwen_vecs"])
+            return pages
+
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                for row in rows:
+                    if row["image_id"] in emitted:
+                        raise RuntimeError(
+                            f"Tokens of page {row['image_id']} in {collection_name} are not contiguous"
+                        )
+                    page = pending.setdefault(
+                        row["image_id"],
+                        {
+                            "colqwen_vecs": [],
+                            "image_id": row["image_id"],
+                            "page_number": row["page_number"],
+                            "file_id": row["file_id"],
+                        },
+                    )
+                    page["colqwen_vecs"].append(to_vector_array(row[vector_field]))
+                # 最后一页可能还有 token 在下一批，留到下一批再输出
+                ready = [
+                    image_id for image_id in pending if image_id != rows[-1]["image_id"]
+                ]
+                if ready:
+                    yield pop_pages(ready)
+            if pending:
+                yield pop_pages(list(pending))
+        finally:
+            iterator.close()
 
 
 milvus_client = MilvusManager()
@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pymilvus import MilvusException
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.vector_store import get_vector_store
+
+# 加载大集合耗时较长，不使用默认的调用超时
+LOAD_TIMEOUT = 600
+
+
+class AsyncMilvusManager:
+    """向量存储的异步封装
+
+    pymilvus 为同步客户端，所有调用放到专用的有界线程池中执行，不阻塞事件循环，
+    每次调用有超时，幂等调用遇到 Milvus 错误时重试，并统计在途调用数。
+    超时只是不再等待结果，线程中的调用仍会执行完。
+    """
+
+    def __init__(self, workers: int = settings.milvus_search_workers):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="milvus"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._operations = {}  # 操作名 -> 调用统计
+
+    def _record(self, operation: str, **counts):
+        with self._lock:
+            stats = self._operations.setdefault(
+                operation,
+                {"calls": 0, "errors": 0, "timeouts": 0, "retries": 0, "seconds": 0.0},
+            )
+            for name, value in counts.items():
+                stats[name] += value
+
+    def _enter(self):
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "queued": self.executor._work_queue.qsize(),
+                "operations": {
+                    name: dict(stats) for name, stats in self._operations.items()
+                },
+            }
+
+    async def run(
+        self,
+        func,
+        *args,
+        operation: str = None,
+        timeout: float = None,
+        retries: int = None,
+        **kwargs,
+    ):
+        """在线程池中执行同步调用，retries 为 0 表示不重试（非幂等的写入）"""
+        operation = operation or getattr(func, "__name__", "call")
+        timeout = settings.milvus_call_timeout if timeout is None else timeout
+        retries = settings.milvus_call_retries if retries is None else retries
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            self._enter()
+            try:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(
+                        self.executor, functools.partial(func, *args, **kwargs)
+                    ),
+                    timeout=timeout,
+                )
+                self._record(operation, calls=1, seconds=time.perf_counter() - start)
+                return result
+            except asyncio.TimeoutError:
+                self._record(operation, calls=1, timeouts=1, seconds=timeout)
+                logger.error(f"Milvus {operation} timed out after {timeout}s")
+                raise
+            except MilvusException as e:
+                self._record(
+                    operation, calls=1, errors=1, seconds=time.perf_counter() - start
+                )
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                self._record(operation, retries=1)
+                logger.warning(
+                    f"Milvus {operation} failed, retry {attempt}/{retries}: {str(e)}"
+                )
+                await asyncio.sleep(0.2 * 2 ** (attempt - 1))
+            except Exception:
+                self._record(
+                    operation, calls=1, errors=1, seconds=time.perf_counter() - start
+                )
+                raise
+            finally:
+                self._exit()
+
+    async def get_vector_store(self, collection_name: str):
+        return await self.run(
+            get_vector_store, collection_name, operation="get_vector_store"
+        )
+
+    async def check_collection(self, collection_name: str) -> bool:
+        vector_store = await self.get_vector_store(collection_name)
+        return await self.run(vector_store.check_collection, collection_name)
+
+    async def ensure_loaded(self, collection_name: str, vector_store=None):
+        """检索前单独加载集合，冷集合的加载不占用检索的超时"""
+        vector_store = vector_store or await self.get_vector_store(collection_name)
+        await self.run(
+            vector_store.ensure_loaded, collection_name, timeout=LOAD_TIMEOUT
+        )
+
+    async def search_batch(
+        self, collection_name: str, queries: list, topk: int, **kwargs
+    ) -> list:
+        vector_store = await self.get_vector_store(collection_name)
+        await self.ensure_loaded(collection_name, vector_store)
+        return await self.run(
+            vector_store.search_batch, collection_name, queries, topk, **kwargs
+        )
+
+    async def insert_pages(self, collection_name: str, pages: list) -> int:
+        # 写入失败时 insert_pages 内部已清理并重试，这里不再重试以免重复写入
+        vector_store = await self.get_vector_store(collection_name)
+        return await self.run(
+            vector_store.insert_pages,
+            collection_name,
+            pages,
+            timeout=settings.milvus_insert_timeout,
+            retries=0,
+        )
+
+    async def delete_files(self, collection_name: str, file_ids: list):
+        vector_store = await self.get_vector_store(collection_name)
+        return await self.run(vector_store.delete_files, collection_name, file_ids)
+
+    async def delete_collection(self, collection_name: str):
+        vector_store = await self.get_vector_store(collection_name)
+        return await self.run(vector_store.delete_collection, collection_name)
+
+
+async_milvus_manager = AsyncMilvusManager()
@@ -7,7 +7,7 @@ from app.core.logging import logger
 from app.db.ultils import parse_aggregate_result
 from app.utils.timezone import beijing_time_now
 from app.db.miniodb import async_minio_manager
-from app.db.milvus import milvus_client
+from app.db.deletion_queue import deletion_queue
 from pymongo.errors import DuplicateKeyError, BulkWriteError
 
 
@@ -522,7 +522,8 @@ class MongoDB:
         for db_id in set(temp_dbs):
             result = await self.delete_knowledge_base(db_id)
             deletion_results.append({"knowledge_base_id": db_id, "result": result})
-            milvus_client.delete_collection("colqwen" + db_id.replace("-", "_"))
+            collection_name = "colqwen" + db_id.replace("-", "_")
+            await deletion_queue.enqueue_collection(collection_name)
 
         # 删除对话文档
         delete_result = await self.db.conversations.delete_one(
@@ -557,7 +558,8 @@ class MongoDB:
         for db_id in set(temp_dbs):
             result = await self.delete_knowledge_base(db_id)
             deletion_results.append({"knowledge_base_id": db_id, "result": result})
-            milvus_client.delete_collection("colqwen" + db_id.replace("-", "_"))
+            collection_name = "colqwen" + db_id.replace("-", "_")
+            await deletion_queue.enqueue_collection(collection_name)
 
         # 删除所有对话文档
         delete_result = await self.db.conversations.delete_many({"username": username})
@@ -698,7 +700,8 @@ class MongoDB:
         for db_id in set(temp_dbs):
             result = await self.delete_knowledge_base(db_id)
             deletion_results.append({"knowledge_base_id": db_id, "result": result})
-            milvus_client.delete_collection("colqwen" + db_id.replace("-", "_"))
+            collection_name = "colqwen" + db_id.replace("-", "_")
+            await deletion_queue.enqueue_collection(collection_name)
 
         # 删除chatflow文档
         delete_result = await self.db.chatflows.delete_one({"chatflow_id": chatflow_id})
@@ -730,7 +733,8 @@ class MongoDB:
         for db_id in set(temp_dbs):
             result = await self.delete_knowledge_base(db_id)
             deletion_results.append({"knowledge_base_id": db_id, "result": result})
-            milvus_client.delete_collection("colqwen" + db_id.replace("-", "_"))
+            collection_name = "colqwen" + db_id.replace("-", "_")
+            await deletion_queue.enqueue_collection(collection_name)
 
         # 删除所有chatflow文档
         delete_result = await self.db.chatflows.delete_many({"workflow_id":  workflow_id})
@@ -750,6 +754,7 @@ class MongoDB:
         knowledge_base_name: str,
         knowledge_base_id: str,
         is_delete: bool,
+        vector_config: Optional[dict] = None,
     ):
         """创建一个新的知识库（如果 knowledge_base_id 不存在则创建，存在则跳过）"""
         # 检查是否已存在相同的 knowledge_base_id
@@ -770,6 +775,7 @@ class MongoDB:
             "created_at": beijing_time_now(),
             "last_modify_at": beijing_time_now(),
             "is_delete": is_delete,
+            "vector_config": vector_config or {},
         }
 
         try:
@@ -877,6 +883,39 @@ class MongoDB:
             }
         return {"status": "success"}
 
+    async def get_knowledge_base_vector_config(self, knowledge_base_id: str) -> dict:
+        """获取知识库的向量检索配置（未配置的项使用全局默认值）"""
+        knowledge_base = await self.db.knowledge_bases.find_one(
+            {"knowledge_base_id": knowledge_base_id}, {"vector_config": 1}
+        )
+        if not knowledge_base:
+            return {}
+        return knowledge_base.get("vector_config") or {}
+
+    async def update_knowledge_base_vector_config(
+        self, knowledge_base_id: str, vector_config: dict
+    ) -> dict:
+        if not vector_config:
+            return {"status": "success"}
+        result = await self.db.knowledge_bases.update_one(
+            {"knowledge_base_id": knowledge_base_id, "is_delete": False},
+            {
+                "$set": {
+                    **{
+                        f"vector_config.{key}": value
+                        for key, value in vector_config.items()
+                    },
+                    "last_modify_at": beijing_time_now(),
+                }
+            },
+        )
+        if result.matched_count == 0:
+            return {
+                "status": "failed",
+                "message": "Knowledge base not found or update failed",
+            }
+        return {"status": "success"}
+
     async def knowledge_base_add_file(
         self,
         knowledge_base_id: str,
@@ -942,8 +981,9 @@ class MongoDB:
         minio_filename: str,
         minio_url: str,
         knowledge_db_id: str,
+        token_stats: Dict[str, int] = None,
     ):
-        """创建文件记录（带唯一索引保护）"""
+        """创建文件记录（带唯一索引保护），token_stats 记录入库的 token 数和去重去掉的数量"""
         file = {
             "file_id": file_id,
             "filename": filename,
@@ -952,6 +992,7 @@ class MongoDB:
             "minio_url": minio_url,
             "knowledge_db_id": knowledge_db_id,
             "images": [],
+            "token_stats": token_stats or {},
             "created_at": beijing_time_now(),
             "last_modify_at": beijing_time_now(),
             "is_delete": False,
@@ -0,0 +1,645 @@
+import contextlib
+import fcntl
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.base_vector_store import VectorStore
+from app.db.milvus import MilvusManager, maxsim_scores, milvus_client
+
+# PLAID 式的延迟交互索引，每个集合一个目录：
+#   meta.json         维度、质心数和残差位数
+#   centroids.npy     k-means 质心 (n_centroids, dim)
+#   version           每次写入或删除后更新，其他进程据此重新加载
+#   segments/<id>.*   每次写入一个分段，.json 最后写入，存在即表示分段完整
+#   tombstones/*.json 被删除的文件ID或页 (file_id, page_number)，重建索引时清理
+# 分段和删除记录的名称按写入顺序排序，删除记录只作用于比它早的分段；
+# <目录>.lock 为写入锁，写入时持共享锁，重建索引替换目录时持排他锁
+# 分段内的数组：
+#   codes             每个 token 所属质心 (n_tokens,)
+#   residuals         token 与质心之差按 bits 位量化后打包 (n_tokens, dim * bits / 8)
+#   scales            每个 token 残差的量化步长 (n_tokens,)
+#   page_offsets      第 i 页的 token 为 [page_offsets[i], page_offsets[i + 1])
+#   page_centroids    每页包含的质心（去重），偏移为 centroid_offsets
+#   ivf_pages         按质心排序的页下标，质心 c 的页为 [ivf_offsets[c], ivf_offsets[c + 1])
+SEGMENT_META = ".json"
+SEGMENT_ARRAYS = (
+    "codes",
+    "residuals",
+    "scales",
+    "page_offsets",
+    "page_centroids",
+    "centroid_offsets",
+    "ivf_pages",
+    "ivf_offsets",
+)
+# 质心编号用 uint16 存储
+MAX_CENTROIDS = 65536
+# 缺省质心数上限，CPU 上训练更多质心耗时过长，需要时可显式指定
+DEFAULT_MAX_CENTROIDS = 16384
+
+
+def sequence_name() -> str:
+    # 以纳秒时间戳开头，名称顺序即写入顺序
+    return f"{time.time_ns():020d}_{uuid.uuid4().hex}"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def default_centroid_count(n_tokens: int) -> int:
+    # 与 PLAID 相同，质心数取 16 * sqrt(token 数) 附近的 2 的幂
+    count = 2 ** int(np.floor(np.log2(16 * np.sqrt(max(n_tokens, 1)))))
+    return int(min(max(count, 16), DEFAULT_MAX_CENTROIDS, max(n_tokens, 1)))
+
+
+def assign_centroids(vectors, centroids, chunk_size: int = 8192) -> np.ndarray:
+    """返回每个向量内积最大的质心编号"""
+    codes = np.empty(len(vectors), dtype=np.int64)
+    for i in range(0, len(vectors), chunk_size):
+        codes[i : i + chunk_size] = np.argmax(
+            vectors[i : i + chunk_size] @ centroids.T, axis=1
+        )
+    return codes
+
+
+def train_centroids(
+    sample, n_centroids: int, iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    """在采样的 token 向量上训练球面 k-means 质心"""
+    rng = np.random.default_rng(seed)
+    sample = normalize(np.asarray(sample, dtype=np.float32))
+    n_centroids = min(n_centroids, len(sample), MAX_CENTROIDS)
+    centroids = sample[rng.choice(len(sample), n_centroids, replace=False)]
+    for _ in range(iterations):
+        codes = assign_centroids(sample, centroids)
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=n_centroids)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        # 按质心排序后分段求和，比 np.add.at 快得多
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        # 空簇重新随机取一个样本作为质心
+        sums[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def pack_residuals(levels: np.ndarray, bits: int) -> np.ndarray:
+    # 每个分量取 levels 的低 bits 位，按行打包为字节
+    planes = np.unpackbits(levels[..., None], axis=-1)[..., 8 - bits :]
+    return np.packbits(planes.reshape(len(levels), -1), axis=1)
+
+
+def unpack_residuals(packed: np.ndarray, bits: int, dim: int) -> np.ndarray:
+    planes = np.unpackbits(packed, axis=1)[:, : dim * bits].reshape(-1, dim, bits)
+    weights = 1 << np.arange(bits - 1, -1, -1)
+    return (planes * weights).sum(axis=-1)
+
+
+def compress(vectors: np.ndarray, centroids: np.ndarray, bits: int):
+    """把 token 向量编码为 (质心编号, 打包的残差, 量化步长)"""
+    codes = assign_centroids(vectors, centroids)
+    residuals = vectors - centroids[codes]
+    half = 2 ** (bits - 1) - 1
+    # 步长过小时 float16 会下溢为 0
+    scales = np.maximum(np.abs(residuals).max(axis=1) / half, 1e-4).astype(np.float16)
+    levels = np.clip(
+        np.round(residuals / scales.astype(np.float32)[:, None]), -half, half
+    )
+    packed = pack_residuals((levels + half).astype(np.uint8), bits)
+    return codes.astype(np.uint16), packed, scales
+
+
+def decompress(centroids, codes, packed, scales, bits: int) -> np.ndarray:
+    half = 2 ** (bits - 1) - 1
+    levels = unpack_residuals(packed, bits, centroids.shape[1]) - half
+    return centroids[codes] + levels * scales.astype(np.float32)[:, None]
+
+
+class PlaidSegment:
+    """内存映射打开的分段"""
+
+    def __init__(self, path: str):
+        with open(path + SEGMENT_META, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.image_ids = meta["image_ids"]
+        self.file_ids = np.array(meta["file_ids"], dtype=object)
+        self.page_numbers = meta["page_numbers"]
+        self.page_keys = list(zip(meta["file_ids"], meta["page_numbers"]))
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, np.load(f"{path}.{name}.npy", mmap_mode="r"))
+        self.alive = np.ones(len(self.image_ids), dtype=bool)
+
+
+class PlaidIndex:
+    """单个集合的 PLAID 索引：质心交互筛选候选页，再用解压后的向量精确计算 MaxSim
+
+    写入和删除只追加分段和删除记录，检索时发现 version 变化才重新加载。
+    重新写入已有的页（同一文件的同一页码）时，先用删除记录覆盖旧页。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._version = None
+        self._segments = {}  # 分段名 -> PlaidSegment
+        self._centroids = None
+        self._meta = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(os.path.join(self.path, "meta.json"))
+
+    @contextlib.contextmanager
+    def write_lock(self, exclusive: bool = False):
+        """跨进程的写入锁，锁文件在索引目录之外，替换目录后仍然有效"""
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self) -> set:
+        """当前的分段和删除记录，元素为 ("segments" / "tombstones", 名称)"""
+        if not self.exists():
+            return set()
+        return {
+            (kind, name[: -len(SEGMENT_META)])
+            for kind in ("segments", "tombstones")
+            for name in os.listdir(os.path.join(self.path, kind))
+            if name.endswith(SEGMENT_META)
+        }
+
+    @staticmethod
+    def create(path: str, centroids: np.ndarray, bits: int) -> "PlaidIndex":
+        os.makedirs(os.path.join(path, "segments"))
+        os.makedirs(os.path.join(path, "tombstones"))
+        np.save(os.path.join(path, "centroids.npy"), centroids.astype(np.float32))
+        index = PlaidIndex(path)
+        index._touch()
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "dim": int(centroids.shape[1]),
+                    "n_centroids": len(centroids),
+                    "bits": bits,
+                },
+                f,
+            )
+        return index
+
+    def _touch(self):
+        version = os.path.join(self.path, "version")
+        with open(version + ".tmp", "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(version + ".tmp", version)
+
+    def _read_version(self) -> str:
+        try:
+            with open(os.path.join(self.path, "version"), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """version 变化时加载新增的分段、丢弃已删除的分段并应用删除记录"""
+        version = self._read_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            if version is None:
+                # 索引已被删除
+                self._segments = {}
+                self._version = None
+                return
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f:
+                self._meta = json.load(f)
+            self._centroids = np.load(os.path.join(self.path, "centroids.npy"))
+
+            segment_dir = os.path.join(self.path, "segments")
+            names = {
+                name[: -len(SEGMENT_META)]
+                for name in os.listdir(segment_dir)
+                if name.endswith(SEGMENT_META)
+            }
+            segments = {
+                name: self._segments.get(name)
+                or PlaidSegment(os.path.join(segment_dir, name))
+                for name in names
+            }
+
+            tombstones = [
+                (name, self.read_tombstone(name))
+                for kind, name in self.entries()
+                if kind == "tombstones"
+            ]
+            for segment_name, segment in segments.items():
+                alive = np.ones(len(segment.image_ids), dtype=bool)
+                for tombstone_name, tombstone in tombstones:
+                    if tombstone_name < segment_name:
+                        continue
+                    if tombstone.get("file_ids"):
+                        alive &= ~np.isin(segment.file_ids, tombstone["file_ids"])
+                    if tombstone.get("pages"):
+                        pages = {tuple(key) for key in tombstone["pages"]}
+                        alive &= np.array(
+                            [key not in pages for key in segment.page_keys]
+                        )
+                segment.alive = alive
+            self._segments = segments
+            self._version = version
+
+    def page_count(self) -> int:
+        self._load()
+        return int(sum(segment.alive.sum() for segment in self._segments.values()))
+
+    def read_tombstone(self, name: str) -> dict:
+        with open(
+            os.path.join(self.path, "tombstones", name + SEGMENT_META), encoding="utf-8"
+        ) as f:
+            return json.load(f)
+
+    def _write_tombstone(self, tombstone: dict):
+        path = os.path.join(self.path, "tombstones", sequence_name())
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(tombstone, f)
+        os.replace(path + ".tmp", path + SEGMENT_META)
+
+    def segment_pages(self, name: str) -> list:
+        """解压一个分段中未删除的页，用于把分段写入按其他质心编码的索引"""
+        self._load()
+        segment = self._segments[name]
+        pages = []
+        for page in np.flatnonzero(segment.alive):
+            start, end = segment.page_offsets[page], segment.page_offsets[page + 1]
+            pages.append(
+                {
+                    "colqwen_vecs": decompress(
+                        self._centroids,
+                        segment.codes[start:end],
+                        segment.residuals[start:end],
+                        segment.scales[start:end],
+                        self._meta["bits"],
+                    ),
+                    "image_id": segment.image_ids[page],
+                    "file_id": segment.file_ids[page],
+                    "page_number": segment.page_numbers[page],
+                }
+            )
+        return pages
+
+    def add_pages(self, pages: list) -> int:
+        """把页压缩后写入一个新分段，返回写入的向量数"""
+        if not pages:
+            return 0
+        with self.write_lock():
+            return self._add_pages(pages)
+
+    def _replaced_pages(self, pages: list) -> list:
+        """索引中已有的同文件同页码的页"""
+        keys = {(page["file_id"], page["page_number"]) for page in pages}
+        file_ids = list({page["file_id"] for page in pages})
+        return [
+            list(segment.page_keys[page])
+            for segment in self._segments.values()
+            for page in np.flatnonzero(
+                segment.alive & np.isin(segment.file_ids, file_ids)
+            )
+            if segment.page_keys[page] in keys
+        ]
+
+    def _add_pages(self, pages: list) -> int:
+        self._load()
+        # 同一批中重复的页只保留最后写入的
+        pages = list(
+            {(page["file_id"], page["page_number"]): page for page in pages}.values()
+        )
+        replaced = self._replaced_pages(pages)
+        if replaced:
+            # 删除记录早于新分段，只覆盖旧页
+            self._write_tombstone({"pages": replaced})
+        bits = self._meta["bits"]
+        page_vectors = [
+            np.asarray(page["colqwen_vecs"], dtype=np.float32) for page in pages
+        ]
+        page_offsets = np.cumsum([0] + [len(vectors) for vectors in page_vectors])
+        codes, residuals, scales = compress(
+            np.concatenate(page_vectors), self._centroids, bits
+        )
+        page_centroids = [
+            np.unique(codes[page_offsets[i] : page_offsets[i + 1]])
+            for i in range(len(pages))
+        ]
+        centroid_offsets = np.cumsum([0] + [len(c) for c in page_centroids])
+        page_centroids = np.concatenate(page_centroids)
+        # 倒排表：质心 -> 包含该质心的页
+        page_ids = np.repeat(np.arange(len(pages)), np.diff(centroid_offsets))
+        order = np.argsort(page_centroids, kind="stable")
+        ivf_offsets = np.searchsorted(
+            page_centroids[order], np.arange(len(self._centroids) + 1)
+        )
+        arrays = {
+            "codes": codes,
+            "residuals": residuals,
+            "scales": scales,
+            "page_offsets": page_offsets.astype(np.int64),
+            "page_centroids": page_centroids,
+            "centroid_offsets": centroid_offsets.astype(np.int64),
+            "ivf_pages": page_ids[order].astype(np.int32),
+            "ivf_offsets": ivf_offsets.astype(np.int64),
+        }
+
+        segment = os.path.join(self.path, "segments", sequence_name())
+        for name, values in arrays.items():
+            # 先写临时文件再改名，其他进程不会读到写了一半的分段
+            with open(f"{segment}.{name}.tmp", "wb") as f:
+                np.save(f, values)
+            os.replace(f"{segment}.{name}.tmp", f"{segment}.{name}.npy")
+        with open(segment + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "image_ids": [page["image_id"] for page in pages],
+                    "file_ids": [page["file_id"] for page in pages],
+                    "page_numbers": [page["page_number"] for page in pages],
+                },
+                f,
+            )
+        os.replace(segment + ".tmp", segment + SEGMENT_META)
+        self._touch()
+        return int(page_offsets[-1])
+
+    def delete_files(self, file_ids: list):
+        if not file_ids:
+            return
+        with self.write_lock():
+            self._write_tombstone({"file_ids": list(file_ids)})
+            self._touch()
+
+    def search(
+        self,
+        data,
+        topk: int,
+        file_ids: list = None,
+        nprobe: int = None,
+        centroid_threshold: float = None,
+        candidate_pages: int = None,
+    ) -> list:
+        """
+        1. 每个查询 token 取最相近的 nprobe 个质心，包含这些质心的页为候选
+        2. 质心交互：用页所含质心与查询的相似度近似 MaxSim，相似度低于阈值的质心不参与
+        3. 近似分数最高的 candidate_pages 页解压残差后精确计算 MaxSim
+        """
+        self._load()
+        if not self._segments:
+            return []
+        nprobe = nprobe or settings.plaid_nprobe
+        centroid_threshold = (
+            settings.plaid_centroid_threshold
+            if centroid_threshold is None
+            else centroid_threshold
+        )
+        candidate_pages = max(candidate_pages or settings.plaid_candidate_pages, topk)
+
+        query = np.asarray(data, dtype=np.float32)
+        centroid_scores = query @ self._centroids.T  # (n_query_tokens, n_centroids)
+        nprobe = min(nprobe, centroid_scores.shape[1])
+        probed = np.unique(
+            np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        )
+        pruned_scores = np.where(
+            centroid_scores.max(axis=0) >= centroid_threshold, centroid_scores, 0
+        ).astype(np.float32)
+
+        heap = []  # (近似分数, 分段名, 页下标)
+        for name, segment in self._segments.items():
+            pages = np.unique(
+                np.concatenate(
+                    [
+                        segment.ivf_pages[
+                            segment.ivf_offsets[c] : segment.ivf_offsets[c + 1]
+                        ]
+                        for c in probed
+                    ]
+                )
+            )
+            alive = segment.alive[pages]
+            if file_ids:
+                alive &= np.isin(segment.file_ids[pages], file_ids)
+            pages = pages[alive]
+            for page, score in zip(
+                pages, self._centroid_interaction(segment, pages, pruned_scores)
+            ):
+                item = (float(score), name, int(page))
+                if len(heap) < candidate_pages:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+
+        candidates = [(name, page) for _, name, page in heap]
+        docs = []
+        for name, page in candidates:
+            segment = self._segments[name]
+            start, end = segment.page_offsets[page], segment.page_offsets[page + 1]
+            docs.append(
+                decompress(
+                    self._centroids,
+                    segment.codes[start:end],
+                    segment.residuals[start:end],
+                    segment.scales[start:end],
+                    self._meta["bits"],
+                )
+            )
+        scores = maxsim_scores(query, docs)
+        results = []
+        for i in np.argsort(-scores)[:topk]:
+            segment = self._segments[candidates[i][0]]
+            page = candidates[i][1]
+            results.append(
+                {
+                    "score": float(scores[i]),
+                    "image_id": segment.image_ids[page],
+                    "file_id": segment.file_ids[page],
+                    "page_number": segment.page_numbers[page],
+                }
+            )
+        return results
+
+    @staticmethod
+    def _centroid_interaction(segment, pages, centroid_scores, chunk_pages=4096):
+        # 每个查询 token 取页内质心的最大相似度再求和，按块计算以限制内存占用
+        approx = np.empty(len(pages), dtype=np.float32)
+        for i in range(0, len(pages), chunk_pages):
+            chunk = pages[i : i + chunk_pages]
+            starts = segment.centroid_offsets[chunk]
+            lengths = segment.centroid_offsets[chunk + 1] - starts
+            bounds = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            positions = np.repeat(starts - bounds, lengths) + np.arange(lengths.sum())
+            similarity = centroid_scores[:, segment.page_centroids[positions]]
+            approx[i : i + chunk_pages] = np.maximum.reduceat(
+                similarity, bounds, axis=1
+            ).sum(axis=0)
+        return approx
+
+
+class PlaidVectorStore(VectorStore):
+    """向量仍存放在 Milvus，已建 PLAID 索引的集合改用进程内索引检索
+
+    写入和删除同时更新 Milvus 和索引；索引由 app.scripts.build_plaid_index 从 Milvus 构建，
+    重建即合并分段并清理删除记录。
+    """
+
+    def __init__(self, manager: MilvusManager, root: str = settings.plaid_index_dir):
+        self.manager = manager
+        self.root = root
+        self._indexes = {}
+
+    def _index_path(self, collection_name: str) -> str:
+        return os.path.join(self.root, collection_name)
+
+    def index(self, collection_name: str) -> PlaidIndex:
+        if collection_name not in self._indexes:
+            self._indexes[collection_name] = PlaidIndex(
+                self._index_path(collection_name)
+            )
+        return self._indexes[collection_name]
+
+    def has_index(self, collection_name: str) -> bool:
+        return self.index(collection_name).exists()
+
+    def check_collection(self, collection_name: str) -> bool:
+        return self.manager.check_collection(collection_name)
+
+    def create_collection(self, collection_name: str, dim: int = 128, **kwargs):
+        self.manager.create_collection(collection_name, dim=dim, **kwargs)
+
+    def delete_collection(self, collection_name: str):
+        self.manager.delete_collection(collection_name)
+        self.drop_index(collection_name)
+
+    def drop_index(self, collection_name: str):
+        shutil.rmtree(self._index_path(collection_name), ignore_errors=True)
+        self._indexes.pop(collection_name, None)
+
+    def delete_files(self, collection_name: str, file_ids: list):
+        result = self.manager.delete_files(collection_name, file_ids)
+        if self.has_index(collection_name):
+            self.index(collection_name).delete_files(file_ids)
+        return result
+
+    def compact(self, collection_name: str):
+        # 索引中的删除记录在重建索引时清理
+        return self.manager.compact(collection_name)
+
+    def insert_pages(self, collection_name: str, pages: list, **kwargs) -> int:
+        inserted = self.manager.insert_pages(collection_name, pages, **kwargs)
+        if self.has_index(collection_name):
+            # 增量写入：新页按已有质心编码，质心不重新训练
+            self.index(collection_name).add_pages(pages)
+        return inserted
+
+    def search(
+        self, collection_name: str, data, topk: int, file_ids: list = None, **kwargs
+    ) -> list:
+        return self.index(collection_name).search(data, topk, file_ids=file_ids)
+
+    def build_index(
+        self,
+        collection_name: str,
+        n_centroids: int = None,
+        sample_tokens: int = 262144,
+        bits: int = None,
+        batch_size: int = 4096,
+        segment_pages: int = 8192,
+        seed: int = 0,
+    ) -> int:
+        """从 Milvus 读取集合的全部页构建索引，完成后替换旧索引，返回索引的页数
+
+        构建期间写入旧索引的分段和删除记录在替换前按顺序重放到新索引。
+        """
+        bits = bits or settings.plaid_residual_bits
+        if bits not in (2, 4, 8):
+            raise ValueError(f"Unsupported residual bits: {bits}")
+        live = self.index(collection_name)
+        replayed = live.entries()
+        self.manager.ensure_loaded(collection_name)
+        n_tokens = self.manager.client.query(
+            collection_name=collection_name, filter="", output_fields=["count(*)"]
+        )[0]["count(*)"]
+        if not n_tokens:
+            raise ValueError(f"{collection_name} is empty")
+
+        # 第一遍按比例采样 token 训练质心
+        rng = np.random.default_rng(seed)
+        ratio = min(1.0, sample_tokens / n_tokens)
+        sample = []
+        for pages in self.manager.iter_pages(collection_name, batch_size):
+            for page in pages:
+                vectors = page["colqwen_vecs"]
+                sample.append(vectors[rng.random(len(vectors)) < ratio])
+        sample = np.concatenate(sample)
+        centroids = train_centroids(
+            sample, n_centroids or default_centroid_count(n_tokens), seed=seed
+        )
+        logger.info(
+            f"Trained {len(centroids)} PLAID centroids for {collection_name} on {len(sample)} tokens"
+        )
+
+        # 第二遍编码写入新目录，完成后替换旧索引
+        path = self._index_path(collection_name)
+        building = f"{path}.building"
+        shutil.rmtree(building, ignore_errors=True)
+        index = PlaidIndex.create(building, centroids, bits)
+        buffer = []
+        for pages in self.manager.iter_pages(collection_name, batch_size):
+            buffer.extend(pages)
+            if len(buffer) >= segment_pages:
+                index.add_pages(buffer)
+                buffer = []
+        index.add_pages(buffer)
+
+        # 先在不阻塞写入的情况下重放，再持排他锁重放剩余部分并替换目录
+        replayed = self._replay(live, index, replayed)
+        retired = f"{path}.retired"
+        shutil.rmtree(retired, ignore_errors=True)
+        with live.write_lock(exclusive=True):
+            self._replay(live, index, replayed)
+            indexed = index.page_count()
+            if os.path.isdir(path):
+                os.rename(path, retired)
+            os.rename(building, path)
+        shutil.rmtree(retired, ignore_errors=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{building}.lock")
+        self._indexes.pop(collection_name, None)
+        return indexed
+
+    @staticmethod
+    def _replay(source: PlaidIndex, target: PlaidIndex, replayed: set) -> set:
+        """把 source 中不在 replayed 里的分段和删除记录按写入顺序追加到 target
+
+        分段按旧质心解压后重新编码，多一次量化误差，下次重建时从 Milvus 重新读取。
+        返回 source 当前的全部记录。
+        """
+        entries = source.entries()
+        for kind, name in sorted(entries - replayed, key=lambda entry: entry[1]):
+            if kind == "tombstones":
+                target._write_tombstone(source.read_tombstone(name))
+            else:
+                target.add_pages(source.segment_pages(name))
+        target._touch()
+        return entries
+
+
+plaid_vector_store = PlaidVectorStore(milvus_client)
@@ -0,0 +1,71 @@
+import numpy as np
+
+# 查询 token 裁剪方式：
+# - none:       不裁剪
+# - dedup:      去掉与已保留 token 近似重复的 token（如查询末尾的填充增强 token）
+# - importance: 去重后按与查询均值的差异度保留信息量最高的 token
+# - norm:       按向量范数保留，适用于未归一化的 embedding
+QUERY_PRUNE_MODES = ("none", "dedup", "importance", "norm")
+
+
+def dedup_tokens(vectors: np.ndarray, similarity: float) -> np.ndarray:
+    """按顺序贪心去重，返回保留 token 的下标"""
+    normalized = vectors / np.maximum(
+        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+    )
+    kept = []
+    for i, vector in enumerate(normalized):
+        if not kept or np.max(normalized[kept] @ vector) < similarity:
+            kept.append(i)
+    return np.array(kept, dtype=np.int64)
+
+
+def prune_query_tokens(
+    vectors,
+    mode: str = "none",
+    keep_ratio: float = 1.0,
+    min_tokens: int = 1,
+    similarity: float = 0.95,
+) -> np.ndarray:
+    """裁剪查询的 token 向量，保持 token 原有顺序
+
+    Args:
+        vectors: 查询的多向量，形状为 (n_tokens, dim)
+        mode: 裁剪方式，见 QUERY_PRUNE_MODES
+        keep_ratio: importance/norm 模式下保留的 token 比例
+        min_tokens: 至少保留的 token 数
+        similarity: dedup/importance 模式下视为重复的余弦相似度
+
+    Returns:
+        np.ndarray: 裁剪后的多向量
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if mode == "none" or len(vectors) <= min_tokens:
+        return vectors
+    if mode not in QUERY_PRUNE_MODES:
+        raise ValueError(f"Unknown query prune mode: {mode}")
+
+    if mode == "norm":
+        candidates = np.arange(len(vectors))
+        importance = np.linalg.norm(vectors, axis=1)
+    else:
+        candidates = dedup_tokens(vectors, similarity)
+        if mode == "dedup" or len(candidates) <= min_tokens:
+            kept = candidates
+            if len(kept) < min_tokens:
+                # 去重过多时补回被去掉的 token
+                dropped = np.setdiff1d(np.arange(len(vectors)), kept)
+                kept = np.concatenate([kept, dropped[: min_tokens - len(kept)]])
+            return vectors[np.sort(kept)]
+        # 与所有 token 均值越接近的 token 越像提示词等通用成分，信息量越低
+        normalized = vectors[candidates] / np.maximum(
+            np.linalg.norm(vectors[candidates], axis=1, keepdims=True), 1e-12
+        )
+        mean = normalized.mean(axis=0)
+        importance = -(normalized @ (mean / max(np.linalg.norm(mean), 1e-12)))
+
+    keep = min(
+        len(candidates), max(min_tokens, int(np.ceil(len(vectors) * keep_ratio)))
+    )
+    kept = candidates[np.argsort(-importance, kind="stable")[:keep]]
+    return vectors[np.sort(kept)]
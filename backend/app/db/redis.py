@@ -6,17 +6,18 @@ class Redis:
     def __init__(self):
         self.redis_pools = {}
 
-    def get_redis_pool(self, db: int):
-        if db not in self.redis_pools:
-            self.redis_pools[db] = aioredis.ConnectionPool.from_url(
+    def get_redis_pool(self, db: int, decode_responses: bool = True):
+        key = (db, decode_responses)
+        if key not in self.redis_pools:
+            self.redis_pools[key] = aioredis.ConnectionPool.from_url(
                 f"redis://:{settings.redis_password}@{settings.redis_url}",
-                decode_responses=True,
+                decode_responses=decode_responses,
                 db=db,
             )
-        return self.redis_pools[db]
+        return self.redis_pools[key]
 
-    async def get_redis_connection(self, db: int = 0):
-        pool = self.get_redis_pool(db)
+    async def get_redis_connection(self, db: int = 0, decode_responses: bool = True):
+        pool = self.get_redis_pool(db, decode_responses)
         return aioredis.Redis(connection_pool=pool)
 
     async def get_token_connection(self):
@@ -28,6 +29,12 @@ class Redis:
     async def get_lock_connection(self):
         return await self.get_redis_connection(settings.redis_lock_db)
 
+    async def get_embedding_cache_connection(self):
+        # 缓存值为二进制向量，不做解码
+        return await self.get_redis_connection(
+            settings.redis_embedding_cache_db, decode_responses=False
+        )
+
     async def close(self):
         for pool in self.redis_pools.values():
             await pool.disconnect()
@@ -0,0 +1,172 @@
+import threading
+import zlib
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.base_vector_store import VectorStore
+from app.db.milvus import (
+    SHARED_COLLECTION_PREFIX,
+    MilvusManager,
+    milvus_client,
+    page_collection_name,
+)
+
+
+def shared_kb_id(collection_name: str) -> str:
+    # 知识库在共享集合中的 kb_id 即其单独集合名去掉 "colqwen" 前缀
+    return collection_name[len("colqwen") :]
+
+
+def shared_collection_name(collection_name: str) -> str:
+    """按 kb_id 的哈希将知识库分配到固定的共享集合"""
+    index = zlib.crc32(shared_kb_id(collection_name).encode("utf-8"))
+    return f"{SHARED_COLLECTION_PREFIX}{index % settings.milvus_shared_collections}"
+
+
+class SharedCollectionStore(VectorStore):
+    """把知识库存放在少量以 kb_id 为分区键的共享集合中
+
+    对外仍使用 "colqwen" + 知识库ID 作为集合名，内部映射为共享集合 + kb_id 过滤。
+    共享集合使用全局的量化和索引配置，知识库级的 index_profile 不生效。
+    """
+
+    def __init__(self, manager: MilvusManager):
+        self.manager = manager
+        self._create_lock = threading.Lock()
+        # 已确认在共享集合中的知识库；知识库只会被删除，不会移出共享集合，只缓存肯定结果
+        self._contains = set()
+
+    def _resolve(self, collection_name: str):
+        return shared_collection_name(collection_name), shared_kb_id(collection_name)
+
+    def ensure_shared_collection(self, shared_name: str, dim: int = 128):
+        if self.manager.check_collection(shared_name):
+            return
+        with self._create_lock:
+            if self.manager.check_collection(shared_name):
+                return
+            logger.info(f"Creating shared Milvus collection {shared_name}")
+            self.manager.create_collection(
+                shared_name,
+                dim=dim,
+                quantization=settings.milvus_quantization,
+                partition_key="kb_id",
+            )
+
+    def contains(self, collection_name: str) -> bool:
+        if collection_name in self._contains:
+            return True
+        shared_name, kb_id = self._resolve(collection_name)
+        if self.manager.check_collection(shared_name) and bool(
+            self.manager.count_knowledge_base(shared_name, kb_id)
+        ):
+            self._contains.add(collection_name)
+            return True
+        return False
+
+    def check_collection(self, collection_name: str) -> bool:
+        return self.manager.check_collection(shared_collection_name(collection_name))
+
+    def create_collection(self, collection_name: str, dim: int = 128, **kwargs):
+        # 共享集合按需创建，新知识库本身无需建集合
+        self.ensure_shared_collection(shared_collection_name(collection_name), dim)
+
+    def delete_collection(self, collection_name: str):
+        shared_name, kb_id = self._resolve(collection_name)
+        self._contains.discard(collection_name)
+        if self.manager.check_collection(shared_name):
+            self.manager.delete_knowledge_base(shared_name, kb_id)
+
+    def delete_files(self, collection_name: str, file_ids: list):
+        shared_name, kb_id = self._resolve(collection_name)
+        return self.manager.delete_files(shared_name, file_ids, kb_id=kb_id)
+
+    def ensure_loaded(self, collection_name: str) -> None:
+        self.manager.ensure_loaded(shared_collection_name(collection_name))
+
+    def compact(self, collection_name: str):
+        return self.manager.compact(shared_collection_name(collection_name))
+
+    def insert_pages(self, collection_name: str, pages: list, **kwargs) -> int:
+        shared_name, kb_id = self._resolve(collection_name)
+        self.ensure_shared_collection(shared_name)
+        inserted = self.manager.insert_pages(
+            shared_name, [{**page, "kb_id": kb_id} for page in pages], **kwargs
+        )
+        self._contains.add(collection_name)
+        return inserted
+
+    def search(
+        self, collection_name: str, data, topk: int, file_ids: list = None, **kwargs
+    ) -> list:
+        shared_name, kb_id = self._resolve(collection_name)
+        kwargs.pop("index_profile", None)
+        return self.manager.search(
+            shared_name, data, topk, file_ids=file_ids, kb_id=kb_id, **kwargs
+        )
+
+    def search_batch(
+        self, collection_name: str, queries: list, topk: int, **kwargs
+    ) -> list:
+        shared_name, kb_id = self._resolve(collection_name)
+        kwargs.pop("index_profile", None)
+        return self.manager.search_batch(
+            shared_name, queries, topk, kb_id=kb_id, **kwargs
+        )
+
+    def _page_texts(self, collection_name: str) -> dict:
+        """读取单独集合的页文本，返回 image_id -> text"""
+        texts = {}
+        iterator = self.manager.client.query_iterator(
+            collection_name=page_collection_name(collection_name),
+            batch_size=1000,
+            output_fields=["image_id", "text"],
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                texts.update((row["image_id"], row["text"]) for row in rows)
+        finally:
+            iterator.close()
+        return texts
+
+    def migrate_from_collection(
+        self, collection_name: str, batch_size: int = 4096
+    ) -> int:
+        """将单独集合中的知识库迁移到共享集合，校验向量数后删除原集合，返回迁移的向量数"""
+        shared_name, kb_id = self._resolve(collection_name)
+        self.ensure_shared_collection(shared_name)
+        if self.manager.count_knowledge_base(shared_name, kb_id):
+            # 上次迁移中断时共享集合中可能残留部分数据
+            self.manager.delete_knowledge_base(shared_name, kb_id)
+
+        self.manager.ensure_loaded(collection_name)
+        texts = (
+            self._page_texts(collection_name)
+            if self.manager.has_text_index(collection_name)
+            else {}
+        )
+        migrated = 0
+        for pages in self.manager.iter_pages(collection_name, batch_size):
+            migrated += self.insert_pages(
+                collection_name,
+                [{**page, "text": texts.get(page["image_id"], "")} for page in pages],
+            )
+
+        self.manager.client.flush(shared_name)
+        source_count = self.manager.client.query(
+            collection_name=collection_name, filter="", output_fields=["count(*)"]
+        )[0]["count(*)"]
+        shared_count = self.manager.count_knowledge_base(shared_name, kb_id)
+        if shared_count != source_count:
+            self.manager.delete_knowledge_base(shared_name, kb_id)
+            self._contains.discard(collection_name)
+            raise RuntimeError(
+                f"Migration of {collection_name} incomplete: {shared_count}/{source_count} vectors"
+            )
+        self.manager.delete_collection(collection_name)
+        return migrated
+
+
+shared_collection_store = SharedCollectionStore(milvus_client)
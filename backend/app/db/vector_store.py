@@ -0,0 +1,37 @@
+from app.core.config import settings
+from app.db.base_vector_store import VectorStore
+from app.db.local_vector_store import local_vector_store
+from app.db.milvus import milvus_client
+from app.db.plaid_index import plaid_vector_store
+from app.db.shared_collection_store import shared_collection_store
+
+# 对话上传文件产生的临时知识库集合
+TEMP_COLLECTION_PREFIX = "colqwentemp_"
+
+
+def get_vector_store(collection_name: str) -> VectorStore:
+    """按集合选择向量存储
+
+    - 临时知识库默认使用本地存储
+    - 已有单独集合的知识库使用该集合，建有 PLAID 索引时用索引检索
+    - 其余知识库按 milvus_layout 使用共享集合或新建单独集合
+    """
+    if settings.temp_vector_store == "local" and collection_name.startswith(
+        TEMP_COLLECTION_PREFIX
+    ):
+        if local_vector_store.check_collection(collection_name):
+            return local_vector_store
+        # 切换前已建在 Milvus 中的临时集合继续使用 Milvus
+        if milvus_client.check_collection(collection_name):
+            return milvus_client
+        return local_vector_store
+    if milvus_client.check_collection(collection_name):
+        if plaid_vector_store.has_index(collection_name):
+            return plaid_vector_store
+        return milvus_client
+    # 切换回 collection 布局后，已在共享集合中的知识库仍从共享集合读写
+    if settings.milvus_layout == "shared" or shared_collection_store.contains(
+        collection_name
+    ):
+        return shared_collection_store
+    return milvus_client
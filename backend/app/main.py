@@ -13,6 +13,8 @@ from app.db.mysql_session import mysql
 from app.db.mongo import mongodb
 from app.db.redis import redis
 from app.db.miniodb import async_minio_manager
+from app.db.collection_residency import collection_residency
+from app.db.deletion_queue import deletion_queue
 from app.utils.kafka_producer import kafka_producer_manager
 from app.utils.kafka_consumer import kafka_consumer_manager
 
@@ -45,16 +47,21 @@ async def lifespan(app: FastAPI):
     await async_minio_manager.init_minio()
     # await kafka_consumer_manager.start()  # 启动Kafka消费者
     consumer_task = asyncio.create_task(kafka_consumer_manager.consume_messages())  # 启动Kafka消费者
+    residency_task = asyncio.create_task(collection_residency.run())  # 预加载并释放冷集合
+    deletion_task = asyncio.create_task(deletion_queue.run())  # 后台删除向量
 
     # 添加关闭钩子
     async def shutdown_hook():
         logger.info("Stopping Kafka consumer...")
         await kafka_consumer_manager.stop()
         consumer_task.cancel()
-        try:
-            await consumer_task
-        except asyncio.CancelledError:
-            pass
+        residency_task.cancel()
+        deletion_task.cancel()
+        for task in (consumer_task, residency_task, deletion_task):
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
     app.state.shutdown_hook = shutdown_hook
 
@@ -1,11 +1,22 @@
 # Pydantic 模型，用于输入数据验证
-from typing import Any, Dict, List
-from pydantic import BaseModel
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
 
 
+class KnowledgeBaseVectorConfig(BaseModel):
+    # 为空时使用全局默认配置
+    candidate_limit: Optional[int] = Field(default=None, ge=1, le=16384)
+    # 存储相关配置只能在创建知识库时指定
+    quantization: Optional[Literal["none", "int8", "binary"]] = None
+    pool_factor: Optional[int] = Field(default=None, ge=1, le=16)
+    prune_similarity: Optional[float] = Field(default=None, ge=0, le=1)
+    index_profile: Optional[str] = None  # 见 app.db.index_profiles
+    search_params: Optional[Dict[str, Any]] = None  # 覆盖索引配置中的检索参数
+
 class KnowledgeBaseCreate(BaseModel):
     username: str
     knowledge_base_name: str
+    vector_config: Optional[KnowledgeBaseVectorConfig] = None
 
 class KnowledgeBaseSummary(BaseModel):
     knowledge_base_id: str
@@ -18,6 +29,10 @@ class KnowledgeBaseRenameInput(BaseModel):
     knowledge_base_id: str
     knowledge_base_new_name: str
 
+class KnowledgeBaseVectorConfigInput(BaseModel):
+    knowledge_base_id: str
+    vector_config: KnowledgeBaseVectorConfig
+
 class PageResponse(BaseModel):
     data: list
     total: int
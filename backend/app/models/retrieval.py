@@ -0,0 +1,31 @@
+# Pydantic 模型，用于输入数据验证
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class BatchRetrievalRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=1024)
+    knowledge_base_ids: List[str] = Field(min_length=1, max_length=64)
+    top_k: int = Field(default=5, ge=1, le=100)
+    score_threshold: Optional[float] = None
+    # 知识库ID -> 文件ID列表，限定部分知识库只检索指定文件
+    file_ids: Optional[Dict[str, List[str]]] = None
+    # 是否用查询文本做关键词检索，与向量召回融合
+    hybrid: bool = True
+
+
+class RetrievedPage(BaseModel):
+    knowledge_base_id: str
+    file_id: str
+    image_id: str
+    page_number: int
+    score: float
+
+
+class QueryRetrievalResult(BaseModel):
+    query: str
+    pages: List[RetrievedPage]
+
+
+class BatchRetrievalResponse(BaseModel):
+    results: List[QueryRetrievalResult]
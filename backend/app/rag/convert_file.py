@@ -1,5 +1,6 @@
+import asyncio
 import os
-from typing import List
+from typing import List, Tuple, Union
 from fastapi import UploadFile
 from pdf2image import convert_from_bytes
 from app.db.miniodb import async_minio_manager
@@ -14,19 +15,23 @@ import io
 async def convert_file_to_images(
     file_content: bytes,
     file_name: str = None,
-    handle_all_frames: bool = False
-) -> List[io.BytesIO]:
+    handle_all_frames: bool = False,
+    extract_text: bool = False,
+) -> Union[List[io.BytesIO], Tuple[List[io.BytesIO], List[str]]]:
     """支持多格式文件转换的图片生成函数，可选择处理动图的所有帧
     
     Args:
         file_content: 二进制文件内容
         file_name: 文件名（包含点，如.docx）
         handle_all_frames: 是否处理动图的所有帧（True=所有帧，False=仅第一帧）
+        extract_text: 是否同时提取每页的文本层
     
     Returns:
-        List[BytesIO]: 包含图片数据的字节流列表
+        List[BytesIO]: 包含图片数据的字节流列表；
+        extract_text 为 True 时返回 (图片列表, 每页文本列表)，图片文件的文本为空
     """
     start_time = time.time()
+    pdf_content = None
     file_extension = file_name.split(".")[-1].lower() if file_name else ""
     
     # 定义支持的图片格式（不包括svg）
@@ -65,6 +70,7 @@ async def convert_file_to_images(
     elif file_extension == "pdf":
         # 直接处理PDF文件
         logger.info("Processing PDF directly")
+        pdf_content = file_content
         images = convert_from_bytes(file_content, dpi=int(settings.embedding_image_dpi))
     
     elif file_extension:  # 其他格式（含svg）
@@ -117,7 +123,36 @@ async def convert_file_to_images(
         f"Successfully converted file to {len(images_buffer)} images | "
         f"Total: {total_time:.2f}s | Processing: {processing_time:.2f}s"
     )
-    return images_buffer
+    if not extract_text:
+        return images_buffer
+
+    page_texts = await extract_pdf_text(pdf_content) if pdf_content else []
+    # 与图片逐页对齐，提取失败或页数不一致时缺失的页文本为空
+    page_texts = (page_texts + [""] * len(images_buffer))[: len(images_buffer)]
+    return images_buffer, page_texts
+
+
+async def extract_pdf_text(pdf_content: bytes) -> List[str]:
+    """用 poppler 的 pdftotext 提取 PDF 每页的文本层，扫描件等无文本层的页为空字符串"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "pdftotext", "-q", "-enc", "UTF-8", "-", "-",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate(pdf_content)
+        if process.returncode != 0:
+            logger.warning(f"pdftotext exited with code {process.returncode}")
+            return []
+    except Exception as e:
+        logger.warning(f"PDF text extraction failed: {str(e)}")
+        return []
+    # pdftotext 以换页符分隔各页，最后一页之后也有一个换页符
+    pages = stdout.decode("utf-8", errors="ignore").split("\f")
+    if pages and not pages[-1].strip():
+        pages = pages[:-1]
+    return [" ".join(page.split()) for page in pages]
 
 def resize_image_to_a4(image: Image.Image) -> Image.Image:
     """调整图片尺寸，长边不超过A4长度（100dpi下1169像素）"""
@@ -0,0 +1,113 @@
+import hashlib
+import re
+import struct
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.redis import redis
+from app.rag.get_embedding import get_embeddings_from_httpx
+
+# 缓存值格式：行数、维度（uint32 小端）+ float16 向量
+HEADER = struct.Struct("<II")
+
+
+def normalize_query(text: str) -> str:
+    """统一全半角、去掉首尾空白并合并连续空白，大小写保持不变"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(text: str, embedding_model: str) -> str:
+    digest = hashlib.sha1(normalize_query(text).encode("utf-8")).hexdigest()
+    return f"embedding:{embedding_model}:{digest}"
+
+
+def encode_embedding(embedding) -> bytes:
+    array = np.asarray(embedding, dtype=np.float16)
+    return HEADER.pack(*array.shape) + array.tobytes()
+
+
+def decode_embedding(value: bytes) -> list:
+    rows, dim = HEADER.unpack_from(value)
+    array = np.frombuffer(value, dtype=np.float16, offset=HEADER.size)
+    return array.reshape(rows, dim).astype(np.float32).tolist()
+
+
+class EmbeddingCache:
+    """查询 embedding 两级缓存：进程内 LRU + Redis"""
+
+    def __init__(self, max_entries: int = settings.embedding_cache_local_size):
+        self.max_entries = max_entries
+        self._local = OrderedDict()
+
+    def _get_local(self, key: str):
+        value = self._local.get(key)
+        if value is not None:
+            self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: bytes):
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _get_remote(self, keys: list) -> list:
+        try:
+            redis_connection = await redis.get_embedding_cache_connection()
+            return await redis_connection.mget(keys)
+        except Exception as e:
+            # 缓存不可用时直接回源，不影响检索
+            logger.warning(f"Embedding cache read failed: {str(e)}")
+            return [None] * len(keys)
+
+    async def _set_remote(self, items: dict):
+        try:
+            redis_connection = await redis.get_embedding_cache_connection()
+            async with redis_connection.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(key, value, ex=settings.embedding_cache_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    async def get_text_embeddings(
+        self, texts: list, embedding_model: str = settings.embedding_model
+    ) -> list:
+        """与 get_embeddings_from_httpx(texts, endpoint="embed_text") 返回格式一致"""
+        keys = [cache_key(text, embedding_model) for text in texts]
+        values = {key: self._get_local(key) for key in keys}
+
+        missing = [key for key, value in values.items() if value is None]
+        if missing:
+            for key, value in zip(missing, await self._get_remote(missing)):
+                if value is not None:
+                    values[key] = value
+                    self._set_local(key, value)
+
+        # 同一批次内相同的查询只请求一次
+        texts_by_key = dict(zip(keys, texts))
+        missing = [key for key, value in values.items() if value is None]
+        if missing:
+            embeddings = await get_embeddings_from_httpx(
+                [normalize_query(texts_by_key[key]) for key in missing],
+                endpoint="embed_text",
+                embedding_model=embedding_model,
+            )
+            fetched = {
+                key: encode_embedding(embedding)
+                for key, embedding in zip(missing, embeddings)
+            }
+            for key, value in fetched.items():
+                values[key] = value
+                self._set_local(key, value)
+            await self._set_remote(fetched)
+
+        logger.info(
+            f"Query embeddings | Items: {len(texts)} | Cache misses: {len(missing)}"
+        )
+        return [decode_embedding(values[key]) for key in keys]
+
+
+embedding_cache = EmbeddingCache()
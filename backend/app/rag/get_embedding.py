@@ -1,11 +1,206 @@
+import asyncio
 import base64
 from io import BytesIO
 import json
+import struct
 import httpx
-from typing import Literal, Optional, List, Union, Tuple
+import numpy as np
+from typing import AsyncIterator, Literal, Optional, List, Union, Tuple
 from app.core.config import settings
 from app.core.logging import logger
 
+# 模型服务的二进制向量格式（小端），与 model-server/embedding_codec.py 一致：
+#   count, dim (uint32) | count 个 uint32 行数 | 按顺序拼接的 rows * dim 个 float16/float32
+EMBEDDINGS_MEDIA_TYPE = "application/x-embeddings"
+EMBEDDINGS_HEADER = struct.Struct("<II")
+# 流式响应的逐页帧：index, rows, dim (int32, uint32, uint32) | rows * dim 个值，
+# index 为 -1 表示出错，之后为 rows 字节的 UTF-8 错误信息
+EMBEDDINGS_STREAM_MEDIA_TYPE = "application/x-embeddings-stream"
+FRAME_HEADER = struct.Struct("<iII")
+# 模型服务推理队列已满或正在重启
+BUSY_STATUS_CODES = (429, 503)
+
+
+def retry_after_seconds(response: httpx.Response, attempt: int) -> float:
+    """按响应的 Retry-After 头（秒）决定等待时间，没有时指数退避"""
+    try:
+        wait = float(response.headers.get("retry-after", ""))
+    except ValueError:
+        wait = 2**attempt
+    return min(max(wait, 0.1), settings.embedding_max_retry_wait)
+
+
+async def post_with_retry(client: httpx.AsyncClient, url: str, **kwargs):
+    """模型服务繁忙时等待后重试，其他响应直接返回"""
+    for attempt in range(settings.embedding_busy_retries + 1):
+        response = await client.post(url, **kwargs)
+        if (
+            response.status_code not in BUSY_STATUS_CODES
+            or attempt == settings.embedding_busy_retries
+        ):
+            return response
+        wait = retry_after_seconds(response, attempt)
+        logger.warning(
+            f"Embedding model busy ({response.status_code}), retry in {wait:.1f}s"
+        )
+        await asyncio.sleep(wait)
+
+
+def embeddings_accept_header(wire_format: str = settings.embedding_wire_format) -> str:
+    if wire_format == "json":
+        return "application/json"
+    # 旧版模型服务忽略该格式，返回 JSON
+    return f"{EMBEDDINGS_MEDIA_TYPE}; dtype={wire_format}, application/json; q=0.5"
+
+
+def media_type_params(content_type: str) -> Tuple[str, dict]:
+    media_type, *params = [part.strip() for part in content_type.split(";")]
+    return media_type, {
+        name.strip(): value.strip()
+        for name, _, value in (param.partition("=") for param in params)
+    }
+
+
+def decode_embeddings(content: bytes, dtype: str) -> List[np.ndarray]:
+    """解码二进制向量响应，返回的数组直接引用响应内容，不复制（只读）"""
+    count, dim = EMBEDDINGS_HEADER.unpack_from(content)
+    rows = np.frombuffer(
+        content, dtype="<u4", count=count, offset=EMBEDDINGS_HEADER.size
+    )
+    data = np.frombuffer(
+        content,
+        dtype=np.dtype(dtype).newbyteorder("<"),
+        offset=EMBEDDINGS_HEADER.size + rows.nbytes,
+    )
+    if data.size != int(rows.sum()) * dim:
+        raise ValueError(
+            f"Embedding payload size mismatch: {data.size} values for {int(rows.sum())}x{dim}"
+        )
+    data = data.reshape(-1, dim) if dim else data.reshape(0, 0)
+    offsets = np.concatenate([[0], np.cumsum(rows, dtype=np.int64)])
+    return [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def parse_embeddings_response(response: httpx.Response) -> list:
+    """按响应的 Content-Type 解析二进制或 JSON 格式的向量"""
+    media_type, params = media_type_params(response.headers.get("content-type", ""))
+    if media_type != EMBEDDINGS_MEDIA_TYPE:
+        return response.json()["embeddings"]
+    return decode_embeddings(response.content, params.get("dtype", "float16"))
+
+
+async def _iter_frames(response: httpx.Response, dtype: str):
+    """解析二进制帧流，每收到一页完整的向量即返回 (页序号, 向量)"""
+    itemsize = np.dtype(dtype).itemsize
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer.extend(chunk)
+        while len(buffer) >= FRAME_HEADER.size:
+            index, rows, dim = FRAME_HEADER.unpack_from(buffer)
+            size = FRAME_HEADER.size + (rows if index < 0 else rows * dim * itemsize)
+            if len(buffer) < size:
+                break
+            frame = bytes(buffer[FRAME_HEADER.size : size])
+            del buffer[:size]
+            if index < 0:
+                raise Exception(f"Embedding stream failed: {frame.decode('utf-8')}")
+            embedding = np.frombuffer(frame, dtype=np.dtype(dtype).newbyteorder("<"))
+            yield index, embedding.reshape(rows, dim)
+    if buffer:
+        raise Exception("Embedding stream ended with an incomplete frame")
+
+
+async def _iter_ndjson(response: httpx.Response):
+    async for line in response.aiter_lines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if "error" in item:
+            raise Exception(f"Embedding stream failed: {item['error']}")
+        yield item["index"], item["embedding"]
+
+
+async def stream_image_embeddings(
+    data: List[Tuple[str, Tuple[str, BytesIO, str]]],
+    embedding_model: Literal[
+        "local_colqwen", "jina_embeddings_v4"
+    ] = settings.embedding_model,
+) -> AsyncIterator[Tuple[int, Union[np.ndarray, List[List[float]]]]]:
+    """逐页获取图片向量，按页顺序返回 (页序号, 向量)
+
+    本地模型服务每算完一页即返回，调用方可以边接收边写入；
+    Jina 或不支持流式接口的旧版模型服务一次返回全部结果。
+    """
+    if embedding_model != "local_colqwen":
+        for index, embedding in enumerate(
+            await get_embeddings_from_httpx(
+                data, endpoint="embed_image", embedding_model=embedding_model
+            )
+        ):
+            yield index, embedding
+        return
+
+    logger.info(f"Streaming local image embeddings | Items: {len(data)}")
+    wire_format = settings.embedding_wire_format
+    accept = (
+        "application/x-ndjson"
+        if wire_format == "json"
+        else f"{EMBEDDINGS_STREAM_MEDIA_TYPE}; dtype={wire_format}, application/x-ndjson; q=0.5"
+    )
+    received = 0
+    async with httpx.AsyncClient() as client:
+        for attempt in range(settings.embedding_busy_retries + 1):
+            async with client.stream(
+                "POST",
+                "http://model-server:8005/embed_image_stream",
+                files=data,
+                headers={"Accept": accept},
+                timeout=1200.0,
+            ) as response:
+                if response.status_code == 404:
+                    break
+                if (
+                    response.status_code in BUSY_STATUS_CODES
+                    and attempt < settings.embedding_busy_retries
+                ):
+                    wait = retry_after_seconds(response, attempt)
+                    logger.warning(
+                        f"Embedding model busy ({response.status_code}), retry in {wait:.1f}s"
+                    )
+                else:
+                    if response.is_error:
+                        await response.aread()
+                        error_detail = (
+                            f"Local embedding model request failed: {response.text}"
+                        )
+                        logger.error(
+                            f"{error_detail} | Status: {response.status_code}"
+                        )
+                        raise Exception(error_detail)
+                    media_type, params = media_type_params(
+                        response.headers.get("content-type", "")
+                    )
+                    frames = (
+                        _iter_frames(response, params.get("dtype", "float16"))
+                        if media_type == EMBEDDINGS_STREAM_MEDIA_TYPE
+                        else _iter_ndjson(response)
+                    )
+                    async for index, embedding in frames:
+                        received += 1
+                        yield index, embedding
+                    if received != len(data):
+                        raise Exception(
+                            f"Embedding stream ended early: {received}/{len(data)} pages received"
+                        )
+                    return
+            await asyncio.sleep(wait)
+
+    # 模型服务没有流式接口
+    for index, embedding in enumerate(
+        await get_embeddings_from_httpx(data, endpoint="embed_image")
+    ):
+        yield index, embedding
+
 
 # from tenacity import retry, stop_after_attempt, wait_exponential
 # @retry(
@@ -58,7 +253,7 @@ async def _get_local_embeddings(
     ],
     endpoint: Literal["embed_text", "embed_image"],
 ) -> List[List[float]]:
-    """从本地模型服务获取嵌入向量"""
+    """从本地模型服务获取嵌入向量，二进制格式时每项为 numpy 数组"""
     logger.info(
         f"Requesting local embeddings | Endpoint: {endpoint} | Items: {len(data)}"
     )
@@ -72,9 +267,11 @@ async def _get_local_embeddings(
                     logger.error(error_msg)
                     raise TypeError(error_msg)
 
-                response = await client.post(
+                response = await post_with_retry(
+                    client,
                     f"http://model-server:8005/{endpoint}",
                     json={"queries": data},
+                    headers={"Accept": embeddings_accept_header()},
                     timeout=1200.0,
                 )
             else:
@@ -93,15 +290,19 @@ async def _get_local_embeddings(
                     logger.error(error_msg)
                     raise TypeError(error_msg)
 
-                response = await client.post(
-                    f"http://model-server:8005/{endpoint}", files=files, timeout=1200.0
+                response = await post_with_retry(
+                    client,
+                    f"http://model-server:8005/{endpoint}",
+                    files=files,
+                    headers={"Accept": embeddings_accept_header()},
+                    timeout=1200.0,
                 )
 
             response.raise_for_status()
             logger.info(
                 f"Successfully processed embeddings from local embedding model"
             )
-            return response.json()["embeddings"]
+            return parse_embeddings_response(response)
 
         except httpx.HTTPStatusError as e:
             error_detail = f"Local embedding model request failed: {e.response.text}"
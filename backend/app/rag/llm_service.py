@@ -8,9 +8,10 @@ from openai import AsyncOpenAI
 
 from app.rag.mesage import find_depth_parent_mesage
 from app.core.logging import logger
-from app.db.milvus import milvus_client
-from app.rag.get_embedding import get_embeddings_from_httpx
-from app.rag.utils import replace_image_content, sort_and_filter
+from app.db.deletion_queue import deletion_queue
+from app.rag.embedding_cache import embedding_cache
+from app.rag.retrieval import search_knowledge_bases
+from app.rag.utils import replace_image_content
 
 
 class ChatService:
@@ -119,24 +120,16 @@ class ChatService:
         bases.extend(base_used)
         file_used = []
         if bases:
-            result_score = []
-            query_embedding = await get_embeddings_from_httpx(
-                [user_message_content.user_message], endpoint="embed_text"
+            query_embedding = await embedding_cache.get_text_embeddings(
+                [user_message_content.user_message]
+            )
+            cut_score = await search_knowledge_bases(
+                [base["baseId"] for base in bases],
+                query_embedding[0],
+                top_k=top_K,
+                score_threshold=score_threshold,
+                query_text=user_message_content.user_message,
             )
-            for base in bases:
-                collection_name = f"colqwen{base['baseId'].replace('-', '_')}"
-                if milvus_client.check_collection(collection_name):
-                    scores = milvus_client.search(
-                        collection_name, data=query_embedding[0], topk=top_K
-                    )
-                    for score in scores:
-                        score.update({"collection_name": collection_name})
-                    result_score.extend(scores)
-            sorted_score = sort_and_filter(result_score, min_score=score_threshold)
-            if len(sorted_score) >= top_K:
-                cut_score = sorted_score[:top_K]
-            else:
-                cut_score = sorted_score
 
             # 获取minio name并转成base64
             for score in cut_score:
@@ -151,7 +144,7 @@ class ChatService:
                     score["file_id"], score["image_id"]
                 )
                 if not file_and_image_info["status"] == "success":
-                    milvus_client.delete_files(
+                    await deletion_queue.enqueue_files(
                         score["collection_name"], [score["file_id"]]
                     )
                     logger.warning(
@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+from app.core.logging import logger
+from app.db.collection_residency import collection_residency
+from app.db.milvus import milvus_client
+from app.db.milvus_async import async_milvus_manager
+from app.db.mongo import get_mongo
+from app.db.shared_collection_store import (
+    shared_collection_name,
+    shared_collection_store,
+)
+
+
+def get_collection_name(knowledge_base_id: str) -> str:
+    return f"colqwen{knowledge_base_id.replace('-', '_')}"
+
+
+def merge_top_k(results: list, top_k: int, min_score: float = None) -> list:
+    """合并多个知识库的检索结果，按分数取全局 Top-K"""
+    if min_score is not None:
+        results = (item for item in results if item["score"] >= min_score)
+    return heapq.nlargest(top_k, results, key=lambda item: item["score"])
+
+
+async def search_knowledge_base(
+    knowledge_base_id: str,
+    query_embedding,
+    top_k: int,
+    file_ids: list = None,
+    query_text: str = None,
+):
+    """检索单个知识库，集合不存在时返回空列表
+
+    file_ids 可限定只检索部分文件，传入 query_text 时与页文本的关键词检索融合召回
+    """
+    results = await search_knowledge_base_batch(
+        knowledge_base_id,
+        [query_embedding],
+        top_k,
+        file_ids=file_ids,
+        query_texts=[query_text],
+    )
+    return results[0]
+
+
+async def search_knowledge_base_batch(
+    knowledge_base_id: str,
+    query_embeddings: list,
+    top_k: int,
+    file_ids: list = None,
+    query_texts: list = None,
+) -> list:
+    """对单个知识库检索多个查询，返回与查询一一对应的结果列表"""
+    collection_name = get_collection_name(knowledge_base_id)
+    vector_store = await async_milvus_manager.get_vector_store(collection_name)
+    if not await async_milvus_manager.run(
+        vector_store.check_collection, collection_name
+    ):
+        return [[] for _ in query_embeddings]
+    # 记录实际加载的集合的访问时间，冷集合才会被释放
+    if vector_store is milvus_client:
+        await collection_residency.touch(collection_name)
+    elif vector_store is shared_collection_store:
+        await collection_residency.touch(shared_collection_name(collection_name))
+    await async_milvus_manager.ensure_loaded(collection_name, vector_store)
+
+    db = await get_mongo()
+    vector_config = await db.get_knowledge_base_vector_config(knowledge_base_id)
+    results = await async_milvus_manager.run(
+        vector_store.search_batch,
+        collection_name,
+        query_embeddings,
+        top_k,
+        candidate_limit=vector_config.get("candidate_limit"),
+        file_ids=file_ids,
+        index_profile=vector_config.get("index_profile"),
+        search_params=vector_config.get("search_params"),
+        query_texts=query_texts,
+    )
+    for scores in results:
+        for score in scores:
+            score.update({"collection_name": collection_name})
+    return results
+
+
+async def search_knowledge_bases(
+    knowledge_base_ids: list,
+    query_embedding,
+    top_k: int,
+    score_threshold: float,
+    file_ids: dict = None,
+    query_text: str = None,
+) -> list:
+    """并发检索多个知识库并合并为全局 Top-K，单个知识库失败不影响其他结果
+
+    file_ids 为 知识库ID -> 文件ID列表，用于限定部分知识库只检索指定文件
+    """
+    results = await search_knowledge_bases_batch(
+        knowledge_base_ids,
+        [query_embedding],
+        top_k,
+        score_threshold,
+        file_ids=file_ids,
+        query_texts=[query_text],
+    )
+    return results[0]
+
+
+async def search_knowledge_bases_batch(
+    knowledge_base_ids: list,
+    query_embeddings: list,
+    top_k: int,
+    score_threshold: float,
+    file_ids: dict = None,
+    query_texts: list = None,
+) -> list:
+    """多个查询并发检索多个知识库，返回与查询一一对应的全局 Top-K 列表
+
+    每个知识库的所有查询合并为一次批量检索，单个知识库失败不影响其他结果
+    """
+    file_ids = file_ids or {}
+    results = await asyncio.gather(
+        *[
+            search_knowledge_base_batch(
+                knowledge_base_id,
+                query_embeddings,
+                top_k,
+                file_ids=file_ids.get(knowledge_base_id),
+                query_texts=query_texts,
+            )
+            for knowledge_base_id in knowledge_base_ids
+        ],
+        return_exceptions=True,
+    )
+
+    result_scores = [[] for _ in query_embeddings]
+    for knowledge_base_id, result in zip(knowledge_base_ids, results):
+        if isinstance(result, BaseException):
+            logger.error(
+                f"Search knowledge base {knowledge_base_id} failed: {str(result)}"
+            )
+            continue
+        for scores, kb_scores in zip(result_scores, result):
+            scores.extend(kb_scores)
+    return [
+        merge_top_k(scores, top_k, min_score=score_threshold)
+        for scores in result_scores
+    ]
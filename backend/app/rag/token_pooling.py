@@ -0,0 +1,64 @@
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+
+
+def pool_page_tokens(vectors, pool_factor: int) -> np.ndarray:
+    """对一页的 token 向量做层次聚类池化，向量数约减少为原来的 1/pool_factor
+
+    相似的图像块向量被合并为所在簇的均值（重新归一化），
+    MaxSim 检索时基本不损失精度，但显著减少存储和重排的向量数。
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if pool_factor <= 1 or len(vectors) <= pool_factor:
+        return vectors
+
+    n_clusters = max(len(vectors) // pool_factor, 1)
+    labels = fcluster(
+        linkage(vectors, method="ward"), t=n_clusters, criterion="maxclust"
+    )
+    # fcluster 的簇标签从 1 开始
+    counts = np.bincount(labels)[1:]
+    pooled = np.zeros((len(counts), vectors.shape[1]), dtype=np.float32)
+    np.add.at(pooled, labels - 1, vectors)
+    pooled = pooled[counts > 0] / counts[counts > 0, None]
+
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.where(norms > 0, norms, 1)
+
+
+def pool_embeddings(embeddings: list, pool_factor: int) -> list:
+    """对一个文件所有页的 token 向量分别池化"""
+    if pool_factor <= 1:
+        return embeddings
+    return [pool_page_tokens(page, pool_factor) for page in embeddings]
+
+
+def prune_page_tokens(vectors, similarity: float, min_tokens: int = 1):
+    """去掉一页中近似重复的 token 向量（如空白边距、背景的图像块）
+
+    背景图像块的向量彼此几乎相同，每组只保留第一个即可，
+    MaxSim 取最大值，去掉重复向量基本不影响分数。
+
+    Returns:
+        (np.ndarray, int): 保留的向量和去掉的向量数
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if similarity <= 0 or len(vectors) <= min_tokens:
+        return vectors, 0
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = vectors / np.where(norms > 0, norms, 1)
+    removed = np.zeros(len(vectors), dtype=bool)
+    kept = []
+    for i in range(len(vectors)):
+        if removed[i]:
+            continue
+        kept.append(i)
+        # 只标记后面的 token，已保留的 token 不受影响
+        removed[i + 1 :] |= normalized[i + 1 :] @ normalized[i] >= similarity
+
+    if len(kept) < min_tokens:
+        # 几乎空白的页补回部分被去掉的 token
+        dropped = np.flatnonzero(removed)[: min_tokens - len(kept)]
+        kept = sorted(kept + dropped.tolist())
+    return vectors[kept], len(vectors) - len(kept)
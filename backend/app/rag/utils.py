@@ -1,25 +1,18 @@
 import asyncio
 import copy
 import uuid
-from app.db.milvus import milvus_client
+from io import BytesIO
+from app.db.deletion_queue import deletion_queue
+from app.db.milvus_async import async_milvus_manager
 from app.db.mongo import get_mongo
 from app.rag.convert_file import convert_file_to_images, save_image_to_minio
-from app.rag.get_embedding import get_embeddings_from_httpx
+from app.rag.get_embedding import stream_image_embeddings
+from app.rag.token_pooling import pool_embeddings, prune_page_tokens
 from app.db.miniodb import async_minio_manager
+from app.core.config import settings
 from app.core.logging import logger
 
 
-def sort_and_filter(data, min_score=None, max_score=None):
-    # 筛选
-    if min_score is not None:
-        data = [item for item in data if item["score"] >= min_score]
-    if max_score is not None:
-        data = [item for item in data if item["score"] <= max_score]
-    # 排序
-    sorted_data = sorted(data, key=lambda x: x["score"], reverse=True)
-    return sorted_data
-
-
 async def update_task_progress(redis, task_id, status, message):
     await redis.hset(f"task:{task_id}", mapping={"status": status, "message": message})
 
@@ -37,24 +30,48 @@ async def process_file(redis, task_id, username, knowledge_db_id, file_meta):
             file_meta["minio_filename"]
         )
 
-        # 解析为图片
-        images_buffer = await convert_file_to_images(file_content, file_meta["original_filename"])
+        # 解析为图片，同时提取每页文本用于关键词检索
+        images_buffer, page_texts = await convert_file_to_images(
+            file_content, file_meta["original_filename"], extract_text=True
+        )
 
         db = await get_mongo()
-        # 保存图片并生成嵌入
         image_ids = [f"{username}_{uuid.uuid4()}" for _ in range(len(images_buffer))]
-        # 生成嵌入向量
-        embeddings = await generate_embeddings(
-            images_buffer, file_meta["original_filename"]
-        )
-        logger.info(
-            f"task:{task_id}: {file_meta['original_filename']} generate_embeddings!"
+        collection_name = f"colqwen{knowledge_db_id.replace('-', '_')}"
+        # 按知识库记录的去重阈值和池化倍数处理 token 向量，保证同一知识库内一致
+        vector_config = await db.get_knowledge_base_vector_config(knowledge_db_id)
+        pool_factor = vector_config.get("pool_factor", settings.embedding_pool_factor)
+        prune_similarity = vector_config.get(
+            "prune_similarity", settings.embedding_prune_similarity
         )
 
-        # 插入Milvus
-        collection_name = f"colqwen{knowledge_db_id.replace('-', '_')}"
-        await insert_to_milvus(
-            collection_name, embeddings, image_ids, file_meta["file_id"]
+        # 图片上传 MinIO 与生成向量、写入 Milvus 并行执行
+        uploaded = []
+        upload_task = asyncio.create_task(
+            save_images(
+                username, file_meta["original_filename"], images_buffer, uploaded
+            )
+        )
+        try:
+            token_stats = await embed_and_insert(
+                collection_name,
+                images_buffer,
+                image_ids,
+                file_meta,
+                page_texts,
+                pool_factor,
+                prune_similarity,
+            )
+            await upload_task
+        except Exception:
+            upload_task.cancel()
+            await asyncio.gather(upload_task, return_exceptions=True)
+            # 清理已写入的部分向量和图片
+            await deletion_queue.enqueue_files(collection_name, [file_meta["file_id"]])
+            await async_minio_manager.bulk_delete([name for name, _ in uploaded])
+            raise
+        logger.info(
+            f"task:{task_id}: {file_meta['original_filename']} dropped {token_stats['dropped']}/{token_stats['tokens']} duplicate tokens"
         )
         logger.info(
             f"task:{task_id}: images of {file_meta['original_filename']} insert to milvus {collection_name}!"
@@ -67,6 +84,7 @@ async def process_file(redis, task_id, username, knowledge_db_id, file_meta):
             minio_filename=file_meta["minio_filename"],
             minio_url=file_meta["minio_url"],
             knowledge_db_id=knowledge_db_id,
+            token_stats=token_stats,
         )
         await db.knowledge_base_add_file(
             knowledge_base_id=knowledge_db_id,
@@ -80,12 +98,9 @@ async def process_file(redis, task_id, username, knowledge_db_id, file_meta):
             f"task:{task_id}: save file of {file_meta['original_filename']} to mongodb"
         )
 
-        for i, (image_buffer, image_id) in enumerate(zip(images_buffer, image_ids)):
-            # 保存图片到MinIO
-            minio_imagename, image_url = await save_image_to_minio(
-                username, file_meta["original_filename"], image_buffer
-            )
-
+        for i, (image_id, (minio_imagename, image_url)) in enumerate(
+            zip(image_ids, uploaded)
+        ):
             # 保存图片元数据
             await db.add_images(
                 file_id=file_meta["file_id"],
@@ -118,30 +133,95 @@ async def process_file(redis, task_id, username, knowledge_db_id, file_meta):
         raise
 
 
-async def generate_embeddings(images_buffer, filename):
-    # 将同步函数包装到线程池执行
+async def save_images(username, filename, images_buffer, uploaded):
+    """按页顺序上传图片到 MinIO，结果追加到 uploaded，失败时由调用方清理"""
+    for image_buffer in images_buffer:
+        uploaded.append(await save_image_to_minio(username, filename, image_buffer))
+
+
+async def embed_and_insert(
+    collection_name,
+    images_buffer,
+    image_ids,
+    file_meta,
+    page_texts,
+    pool_factor,
+    prune_similarity,
+):
+    """流式接收每页向量，去重、池化后每攒够 embedding_insert_pages 页写入一次，
+    写入与后续页的推理并行，同时最多一批在写入以限制内存，返回 token 统计"""
+    loop = asyncio.get_running_loop()
+    # 图片同时在上传 MinIO，请求使用独立的 BytesIO，避免共用读取位置
     images_request = [
-        ("images", (f"{filename}_{i}.png", img, "image/png"))
-        for i, img in enumerate(images_buffer)
+        (
+            "images",
+            (
+                f"{file_meta['original_filename']}_{i}.png",
+                BytesIO(image_buffer.getvalue()),
+                "image/png",
+            ),
+        )
+        for i, image_buffer in enumerate(images_buffer)
     ]
-    return await get_embeddings_from_httpx(images_request, endpoint="embed_image")
-
-
-async def insert_to_milvus(collection_name, embeddings, image_ids, file_id):
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(
-        None,
-        lambda: [
-            milvus_client.insert(
-                {
-                    "colqwen_vecs": emb,
-                    "page_number": i,
-                    "image_id": image_ids[i],
-                    "file_id": file_id,
-                },
-                collection_name,
+    token_stats = {"tokens": 0, "dropped": 0}
+    pages, insert_task = [], None
+
+    def start_insert(pages):
+        return asyncio.create_task(
+            insert_to_milvus(
+                collection_name, pages, image_ids, file_meta["file_id"], page_texts
             )
-            for i, emb in enumerate(embeddings)
+        )
+
+    try:
+        async for index, embedding in stream_image_embeddings(images_request):
+            # 去掉空白边距等背景图像块的重复向量，在池化前执行以减少聚类的计算量
+            vectors, dropped = await loop.run_in_executor(
+                None,
+                prune_page_tokens,
+                embedding,
+                prune_similarity,
+                settings.embedding_prune_min_tokens,
+            )
+            token_stats["tokens"] += len(embedding)
+            token_stats["dropped"] += dropped
+            if pool_factor > 1:
+                vectors = (
+                    await loop.run_in_executor(
+                        None, pool_embeddings, [vectors], pool_factor
+                    )
+                )[0]
+            pages.append((index, vectors))
+            if len(pages) >= settings.embedding_insert_pages:
+                if insert_task:
+                    await insert_task
+                insert_task, pages = start_insert(pages), []
+        if insert_task:
+            await insert_task
+        if pages:
+            insert_task = start_insert(pages)
+            await insert_task
+    except Exception:
+        # 等待进行中的写入结束，确保调用方清理时不会再有新写入
+        if insert_task and not insert_task.done():
+            await asyncio.gather(insert_task, return_exceptions=True)
+        raise
+    return token_stats
+
+
+async def insert_to_milvus(collection_name, pages, image_ids, file_id, texts=None):
+    """写入一批页，pages 为 (页序号, 向量) 列表"""
+    await async_milvus_manager.insert_pages(
+        collection_name,
+        [
+            {
+                "colqwen_vecs": emb,
+                "page_number": i,
+                "image_id": image_ids[i],
+                "file_id": file_id,
+                "text": texts[i] if texts else "",
+            }
+            for i, emb in pages
         ],
     )
 
@@ -0,0 +1,318 @@
+"""离线检索基准：向测试集合写入 ColQwen 形状的多向量语料并回放查询
+
+通过 MilvusManager.search 检索，与内存中的全量精确 MaxSim 比较得到 recall@k，
+同时统计 p50/p95/p99 延迟和每次查询的 Milvus 往返次数。
+--query-prune 可传入多种查询 token 裁剪方式，在同一语料上对比延迟与召回率。
+
+语料可以是合成的（按主题聚类的归一化向量），也可以是录制的 .npz 文件：
+    vectors        (n_tokens, dim)   所有页的 token 向量，按页连续存放
+    page_offsets   (n_pages + 1,)    第 i 页为 vectors[page_offsets[i]:page_offsets[i + 1]]
+    file_ids       (n_pages,)        可选，页所属文件
+    queries        (n_query_tokens, dim)  可选，缺省时从语料页中采样生成
+    query_offsets  (n_queries + 1,)       与 queries 同时提供
+
+用法（在 backend 目录下执行，--uri 指向本地文件即使用 Milvus Lite）:
+    python -m app.scripts.benchmark_retrieval --uri ./benchmark.db --profile flat
+    python -m app.scripts.benchmark_retrieval --corpus corpus.npz --candidate-limit 100 --output report.json
+    python -m app.scripts.benchmark_retrieval --query-prune none dedup importance --query-filler 10
+"""
+
+import argparse
+import heapq
+import json
+import time
+from collections import Counter
+import numpy as np
+from app.core.config import settings
+from app.db.index_profiles import DEFAULT_INDEX_PROFILES
+from app.db.query_pruning import QUERY_PRUNE_MODES, prune_query_tokens
+
+
+class CountingClient:
+    """代理 MilvusClient，按方法统计调用次数（即 Milvus 往返次数）"""
+
+    def __init__(self, client):
+        self._client = client
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def synthetic_corpus(pages, tokens, dim, topics, files, rng) -> list:
+    """生成按主题聚类的页：同主题的页相似，页内 token 围绕页中心分布"""
+    centers = normalize(rng.normal(size=(topics, dim)))
+    corpus = []
+    for i in range(pages):
+        topic = centers[rng.integers(topics)]
+        page_center = normalize(topic + rng.normal(scale=0.6 / np.sqrt(dim), size=dim))
+        n_tokens = int(rng.integers(int(tokens * 0.9), tokens + 1))
+        vectors = normalize(
+            page_center + rng.normal(scale=1.0 / np.sqrt(dim), size=(n_tokens, dim))
+        )
+        corpus.append(
+            {
+                "image_id": f"page_{i}",
+                "file_id": f"file_{i % files}",
+                "page_number": i // files,
+                "colqwen_vecs": vectors.astype(np.float32),
+            }
+        )
+    return corpus
+
+
+def synthetic_queries(corpus, count, tokens, rng) -> list:
+    """从随机页中采样 token 并加噪声作为查询"""
+    queries = []
+    for page in rng.choice(len(corpus), size=count):
+        vectors = corpus[page]["colqwen_vecs"]
+        picked = vectors[rng.choice(len(vectors), size=tokens, replace=False)]
+        noise = rng.normal(scale=0.5 / np.sqrt(vectors.shape[1]), size=picked.shape)
+        queries.append(normalize(picked + noise).astype(np.float32))
+    return queries
+
+
+def add_query_filler(queries, count, rng) -> list:
+    """在查询末尾追加近似重复的填充 token，模拟 ColQwen 查询的增强 token"""
+    if count <= 0:
+        return queries
+    dim = queries[0].shape[1]
+    filler = normalize(rng.normal(size=dim))
+    padded = []
+    for query in queries:
+        tokens = normalize(
+            filler + rng.normal(scale=0.05 / np.sqrt(dim), size=(count, dim))
+        )
+        padded.append(np.vstack([query, tokens]).astype(np.float32))
+    return padded
+
+
+def split_offsets(vectors, offsets) -> list:
+    return [
+        np.asarray(vectors[offsets[i] : offsets[i + 1]], dtype=np.float32)
+        for i in range(len(offsets) - 1)
+    ]
+
+
+def load_corpus(path, query_count, query_tokens, rng):
+    data = np.load(path, allow_pickle=False)
+    pages = split_offsets(data["vectors"], data["page_offsets"])
+    file_ids = (
+        data["file_ids"].tolist()
+        if "file_ids" in data
+        else [f"file_{i}" for i in range(len(pages))]
+    )
+    corpus = [
+        {
+            "image_id": f"page_{i}",
+            "file_id": str(file_ids[i]),
+            "page_number": i,
+            "colqwen_vecs": vectors,
+        }
+        for i, vectors in enumerate(pages)
+    ]
+    if "queries" in data:
+        queries = split_offsets(data["queries"], data["query_offsets"])
+    else:
+        queries = synthetic_queries(corpus, query_count, query_tokens, rng)
+    return corpus, queries
+
+
+def brute_force_top_k(corpus, queries, k, chunk_pages=256) -> list:
+    """在内存中对全部页做精确 MaxSim，返回每个查询的 Top-K image_id"""
+    from app.db.milvus import maxsim_scores
+
+    heaps = [[] for _ in queries]
+    for i in range(0, len(corpus), chunk_pages):
+        chunk = corpus[i : i + chunk_pages]
+        docs = [page["colqwen_vecs"] for page in chunk]
+        for heap, query in zip(heaps, queries):
+            for page, score in zip(chunk, maxsim_scores(query, docs)):
+                item = (float(score), page["image_id"])
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heappushpop(heap, item)
+    return [[image_id for _, image_id in sorted(heap, reverse=True)] for heap in heaps]
+
+
+def run(args) -> dict:
+    # app.db.milvus 导入时即按配置连接 Milvus，须在 main 覆盖地址之后导入
+    from app.db.milvus import milvus_client
+
+    rng = np.random.default_rng(args.seed)
+    if args.corpus:
+        corpus, queries = load_corpus(args.corpus, args.queries, args.query_tokens, rng)
+    else:
+        corpus = synthetic_corpus(
+            args.pages, args.page_tokens, args.dim, args.topics, args.files, rng
+        )
+        queries = synthetic_queries(corpus, args.queries, args.query_tokens, rng)
+    queries = add_query_filler(queries, args.query_filler, rng)
+    dim = corpus[0]["colqwen_vecs"].shape[1]
+
+    expected = brute_force_top_k(corpus, queries, args.k)
+
+    manager = milvus_client
+    collection_name = args.collection
+    manager.delete_collection(collection_name)
+    try:
+        manager.create_collection(
+            collection_name,
+            dim=dim,
+            page_index=args.page_index,
+            quantization=args.quantization,
+            index_profile=args.profile,
+        )
+        page_index = manager.has_page_index(collection_name)
+        start = time.perf_counter()
+        inserted = manager.insert_pages(collection_name, corpus)
+        insert_seconds = time.perf_counter() - start
+
+        # 召回率始终以未裁剪查询的精确 MaxSim 结果为基准
+        query_prune = {
+            mode: replay(manager, collection_name, queries, expected, mode, args)
+            for mode in args.query_prune
+        }
+    finally:
+        if not args.keep:
+            manager.delete_collection(collection_name)
+
+    return {
+        "collection": collection_name,
+        "pages": len(corpus),
+        "vectors": inserted,
+        "queries": len(queries),
+        "insert_seconds": insert_seconds,
+        "page_index": page_index,
+        "profile": args.profile,
+        "quantization": args.quantization,
+        "candidate_limit": args.candidate_limit,
+        "query_prune": query_prune,
+    }
+
+
+def replay(manager, collection_name, queries, expected, query_prune, args) -> dict:
+    """以指定的查询裁剪方式回放所有查询，统计召回率、延迟和往返次数"""
+    from app.scripts.retrieval_eval import latency_summary, recall_at_k
+
+    def search(query):
+        return manager.search(
+            collection_name,
+            query,
+            args.k,
+            candidate_limit=args.candidate_limit,
+            index_profile=args.profile,
+            query_prune=query_prune,
+        )
+
+    for query in queries[: args.warmup]:
+        search(query)
+
+    client = manager.client
+    manager.client = counter = CountingClient(client)
+    latencies, recalls = [], []
+    try:
+        for query, truth in zip(queries, expected):
+            start = time.perf_counter()
+            results = search(query)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(recall_at_k([r["image_id"] for r in results], truth, args.k))
+    finally:
+        manager.client = client
+
+    kept_tokens = [
+        len(
+            prune_query_tokens(
+                query,
+                query_prune,
+                keep_ratio=settings.milvus_query_prune_keep_ratio,
+                min_tokens=settings.milvus_query_prune_min_tokens,
+                similarity=settings.milvus_query_prune_similarity,
+            )
+        )
+        for query in queries
+    ]
+    return {
+        f"recall@{args.k}": sum(recalls) / len(recalls),
+        "latency_ms": latency_summary(latencies),
+        "query_tokens": sum(len(query) for query in queries) / len(queries),
+        "kept_query_tokens": sum(kept_tokens) / len(queries),
+        "round_trips_per_query": {
+            name: count / len(queries) for name, count in counter.calls.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", help="Milvus 地址，本地文件路径即 Milvus Lite")
+    parser.add_argument("--collection", default="benchmark_colqwen")
+    parser.add_argument("--corpus", help="录制的 .npz 语料，缺省时生成合成语料")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--page-tokens", type=int, default=256)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--query-tokens", type=int, default=20)
+    parser.add_argument(
+        "--query-filler",
+        type=int,
+        default=0,
+        help="每个查询追加的近似重复填充 token 数",
+    )
+    parser.add_argument(
+        "--query-prune",
+        nargs="+",
+        choices=QUERY_PRUNE_MODES,
+        default=["none"],
+        help="对比的查询 token 裁剪方式",
+    )
+    parser.add_argument(
+        "--prune-keep-ratio",
+        type=float,
+        help="importance/norm 裁剪保留的 token 比例，缺省跟随配置",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidate-limit", type=int)
+    parser.add_argument("--profile", help="索引配置，缺省为存储模式的默认配置")
+    parser.add_argument("--quantization", choices=list(DEFAULT_INDEX_PROFILES))
+    parser.add_argument(
+        "--page-index",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="是否创建页级候选集合，缺省跟随配置",
+    )
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="保留测试集合")
+    parser.add_argument("--output", help="将报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.prune_keep_ratio is not None:
+        settings.milvus_query_prune_keep_ratio = args.prune_keep_ratio
+    if args.uri:
+        # milvus_client 在导入时按配置连接，需在导入前覆盖地址
+        settings.milvus_uri = args.uri
+    report = run(args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""为知识库集合构建 PLAID 延迟交互索引，建好后该知识库改用进程内索引检索
+
+索引由 Milvus 中的 token 向量构建，之后的写入和删除会增量更新索引；
+重新执行即按当前数据重建（合并增量分段并清理已删除的页）。
+
+用法（在 backend 目录下执行）:
+    python -m app.scripts.build_plaid_index --collections colqwenxxx
+    python -m app.scripts.build_plaid_index --collections colqwenxxx --centroids 4096 --bits 2
+    python -m app.scripts.build_plaid_index --drop --collections colqwenxxx
+"""
+
+import argparse
+import time
+from app.db.milvus import milvus_client
+from app.db.plaid_index import plaid_vector_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--collections", nargs="+", required=True)
+    parser.add_argument("--centroids", type=int, help="质心数，缺省按 token 数估算")
+    parser.add_argument("--sample-tokens", type=int, default=262144)
+    parser.add_argument("--bits", type=int, choices=[2, 4, 8], help="残差量化位数")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument(
+        "--drop", action="store_true", help="删除索引，恢复 Milvus 检索"
+    )
+    args = parser.parse_args()
+
+    for collection_name in args.collections:
+        if args.drop:
+            plaid_vector_store.drop_index(collection_name)
+            print(f"{collection_name}: index dropped")
+            continue
+        if not milvus_client.check_collection(collection_name):
+            print(f"{collection_name}: not found, skipped")
+            continue
+        start = time.perf_counter()
+        indexed = plaid_vector_store.build_index(
+            collection_name,
+            n_centroids=args.centroids,
+            sample_tokens=args.sample_tokens,
+            bits=args.bits,
+            batch_size=args.batch_size,
+        )
+        print(
+            f"{collection_name}: {indexed} pages indexed in {time.perf_counter() - start:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""将单独集合（colqwen*）中的知识库迁移到以 kb_id 为分区键的共享集合
+
+迁移后原集合被删除，知识库的读写自动转到共享集合。
+共享集合使用全局的量化存储模式（MILVUS_QUANTIZATION），迁移时按需转换。
+
+用法（在 backend 目录下执行）:
+    python -m app.scripts.migrate_layout --all
+    python -m app.scripts.migrate_layout --collections colqwenxxx
+"""
+
+import argparse
+import asyncio
+from app.core.config import settings
+from app.core.logging import logger
+from app.db.index_profiles import DEFAULT_INDEX_PROFILES
+from app.db.milvus import milvus_client
+from app.db.mongo import mongodb
+from app.db.shared_collection_store import (
+    shared_collection_name,
+    shared_collection_store,
+)
+from app.scripts.migrate_quantization import list_token_collections
+
+
+async def migrate(collection_names: list, batch_size: int):
+    await mongodb.connect()
+    try:
+        knowledge_bases = await mongodb.db.knowledge_bases.find(
+            {}, {"knowledge_base_id": 1}
+        ).to_list(length=None)
+        kb_ids = {
+            "colqwen"
+            + kb["knowledge_base_id"].replace("-", "_"): kb["knowledge_base_id"]
+            for kb in knowledge_bases
+        }
+
+        for collection_name in collection_names:
+            if not milvus_client.check_collection(collection_name):
+                print(f"{collection_name}: not found, skipped")
+                continue
+            migrated = await asyncio.to_thread(
+                shared_collection_store.migrate_from_collection,
+                collection_name,
+                batch_size,
+            )
+            if collection_name in kb_ids:
+                await mongodb.update_knowledge_base_vector_config(
+                    kb_ids[collection_name],
+                    {
+                        "quantization": settings.milvus_quantization,
+                        "index_profile": DEFAULT_INDEX_PROFILES[
+                            settings.milvus_quantization
+                        ],
+                    },
+                )
+            shared_name = shared_collection_name(collection_name)
+            logger.info(
+                f"Migrated {collection_name} into {shared_name}: {migrated} vectors"
+            )
+            print(f"{collection_name} -> {shared_name}, {migrated} vectors")
+    finally:
+        await mongodb.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--all", action="store_true", help="迁移所有 colqwen* 集合")
+    target.add_argument("--collections", nargs="+", help="指定要迁移的集合")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    collection_names = list_token_collections() if args.all else args.collections
+    asyncio.run(migrate(collection_names, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""将已有的 colqwen* 知识库集合迁移到指定的量化存储模式
+
+用法（在 backend 目录下执行）:
+    python -m app.scripts.migrate_quantization --mode binary --all
+    python -m app.scripts.migrate_quantization --mode int8 --collections colqwenxxx
+"""
+
+import argparse
+import asyncio
+from app.core.logging import logger
+from app.db.index_profiles import DEFAULT_INDEX_PROFILES
+from app.db.milvus import QUANTIZATION_MODES, milvus_client
+from app.db.mongo import mongodb
+
+
+def list_token_collections():
+    # 排除页级候选集合、迁移临时集合及备份和索引评测副本
+    return [
+        name
+        for name in milvus_client.client.list_collections()
+        if name.startswith("colqwen")
+        and not name.endswith(("_pages", "_migrating", "_backup", "_tune"))
+    ]
+
+
+async def migrate(mode: str, collection_names: list, batch_size: int):
+    await mongodb.connect()
+    try:
+        knowledge_bases = await mongodb.db.knowledge_bases.find(
+            {}, {"knowledge_base_id": 1}
+        ).to_list(length=None)
+        # 集合名由知识库ID替换 "-" 得到，无法反推，只能正向建立映射
+        kb_ids = {
+            "colqwen"
+            + kb["knowledge_base_id"].replace("-", "_"): kb["knowledge_base_id"]
+            for kb in knowledge_bases
+        }
+
+        for collection_name in collection_names:
+            source_mode = milvus_client.storage_mode(collection_name)
+            if source_mode == mode:
+                print(f"{collection_name}: already {mode}, skipped")
+                continue
+
+            migrated = await asyncio.to_thread(
+                milvus_client.migrate_quantization, collection_name, mode, batch_size
+            )
+            if collection_name in kb_ids:
+                # 迁移后的集合使用该存储模式的默认索引
+                await mongodb.update_knowledge_base_vector_config(
+                    kb_ids[collection_name],
+                    {
+                        "quantization": mode,
+                        "index_profile": DEFAULT_INDEX_PROFILES[mode],
+                    },
+                )
+            logger.info(
+                f"Migrated {collection_name} from {source_mode} to {mode}: {migrated} vectors"
+            )
+            print(f"{collection_name}: {source_mode} -> {mode}, {migrated} vectors")
+    finally:
+        await mongodb.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", required=True, choices=QUANTIZATION_MODES)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--all", action="store_true", help="迁移所有 colqwen* 集合")
+    target.add_argument("--collections", nargs="+", help="指定要迁移的集合")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    collection_names = list_token_collections() if args.all else args.collections
+    asyncio.run(migrate(args.mode, collection_names, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
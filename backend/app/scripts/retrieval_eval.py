@@ -0,0 +1,71 @@
+"""检索评测的公共方法：精确 MaxSim 基准、召回率和延迟统计"""
+
+import heapq
+import numpy as np
+from app.db.milvus import MilvusManager, maxsim_scores, page_collection_name
+
+
+def list_pages(manager: MilvusManager, collection_name: str) -> dict:
+    """列出集合中的所有页，返回 image_id -> file_id"""
+    source = (
+        page_collection_name(collection_name)
+        if manager.has_page_index(collection_name)
+        else collection_name
+    )
+    manager.ensure_loaded(source)
+    pages = {}
+    iterator = manager.client.query_iterator(
+        collection_name=source, batch_size=16384, output_fields=["image_id", "file_id"]
+    )
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            for row in rows:
+                pages[row["image_id"]] = row["file_id"]
+    finally:
+        iterator.close()
+    return pages
+
+
+def exact_top_k(
+    manager: MilvusManager,
+    collection_name: str,
+    queries: list,
+    pages: dict,
+    k: int,
+    chunk_pages: int = 256,
+) -> list:
+    """对所有页做精确 MaxSim，返回每个查询的 Top-K image_id 列表"""
+    heaps = [[] for _ in queries]
+    image_ids = list(pages)
+    for i in range(0, len(image_ids), chunk_pages):
+        chunk = manager.fetch_page_vectors(
+            collection_name,
+            {image_id: pages[image_id] for image_id in image_ids[i : i + chunk_pages]},
+        )
+        chunk_ids = list(chunk)
+        docs = [chunk[image_id]["vectors"] for image_id in chunk_ids]
+        for heap, query in zip(heaps, queries):
+            for image_id, score in zip(chunk_ids, maxsim_scores(query, docs)):
+                if len(heap) < k:
+                    heapq.heappush(heap, (float(score), image_id))
+                else:
+                    heapq.heappushpop(heap, (float(score), image_id))
+    return [[image_id for _, image_id in sorted(heap, reverse=True)] for heap in heaps]
+
+
+def recall_at_k(retrieved: list, expected: list, k: int) -> float:
+    if not expected:
+        return 1.0
+    return len(set(retrieved[:k]) & set(expected[:k])) / min(k, len(expected))
+
+
+def latency_summary(latencies: list) -> dict:
+    """延迟（秒）统计，返回毫秒为单位的 p50/p95/p99"""
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        f"p{p}": float(np.percentile(latencies_ms, p)) if len(latencies_ms) else 0.0
+        for p in (50, 95, 99)
+    }
@@ -0,0 +1,159 @@
+"""评估知识库在不同索引配置下的召回率与延迟，选择满足召回要求的最低成本索引
+
+召回率以全量精确 MaxSim 的 Top-K 为基准。评估在知识库集合的临时副本上进行，
+不影响线上检索。
+
+用法（在 backend 目录下执行）:
+    python -m app.scripts.tune_index --knowledge-base-id <kb_id> --sample 50
+    python -m app.scripts.tune_index --knowledge-base-id <kb_id> --queries-file q.txt --profiles hnsw ivf_flat
+    python -m app.scripts.tune_index --knowledge-base-id <kb_id> --apply ivf_flat
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from app.core.logging import logger
+from app.db.index_profiles import compatible_index_profiles, resolve_index_profile
+from app.db.milvus import milvus_client, page_collection_name
+from app.db.mongo import mongodb
+from app.rag.get_embedding import get_embeddings_from_httpx
+from app.rag.retrieval import get_collection_name
+from app.scripts.retrieval_eval import (
+    exact_top_k,
+    latency_summary,
+    list_pages,
+    recall_at_k,
+)
+
+
+async def sample_queries(knowledge_base_id: str, sample: int) -> list:
+    """从使用过该知识库的会话中抽样用户问题"""
+    cursor = mongodb.db.conversations.find(
+        {"model_config.base_used.baseId": knowledge_base_id}, {"turns": 1}
+    )
+    queries = []
+    async for conversation in cursor:
+        for turn in conversation.get("turns", []):
+            content = turn.get("user_message", {}).get("content", [])
+            if isinstance(content, str):
+                queries.append(content)
+                continue
+            queries.extend(
+                item["text"]
+                for item in content
+                if isinstance(item, dict) and item.get("type") == "text"
+            )
+    queries = [query for query in dict.fromkeys(queries) if query.strip()]
+    return random.sample(queries, min(sample, len(queries)))
+
+
+def evaluate_profile(
+    collection_name, profile, queries, expected, k, candidate_limit, search_params
+):
+    latencies, recalls = [], []
+    for query, truth in zip(queries, expected):
+        start = time.perf_counter()
+        results = milvus_client.search(
+            collection_name,
+            query,
+            k,
+            candidate_limit=candidate_limit,
+            index_profile=profile,
+            search_params=search_params,
+        )
+        latencies.append(time.perf_counter() - start)
+        recalls.append(recall_at_k([r["image_id"] for r in results], truth, k))
+    return sum(recalls) / len(recalls), latency_summary(latencies)
+
+
+async def tune(args):
+    await mongodb.connect()
+    try:
+        collection_name = get_collection_name(args.knowledge_base_id)
+        if not milvus_client.check_collection(collection_name):
+            raise SystemExit(f"Collection {collection_name} does not exist")
+        vector_config = await mongodb.get_knowledge_base_vector_config(
+            args.knowledge_base_id
+        )
+        quantization = milvus_client.storage_mode(collection_name)
+
+        if args.apply:
+            profile = resolve_index_profile(args.apply, quantization)
+            await asyncio.to_thread(
+                milvus_client.rebuild_index, collection_name, profile
+            )
+            await mongodb.update_knowledge_base_vector_config(
+                args.knowledge_base_id, {"index_profile": profile}
+            )
+            logger.info(f"Rebuilt {collection_name} with index profile {profile}")
+            print(f"{collection_name}: rebuilt with index profile {profile}")
+            return
+
+        if args.queries_file:
+            with open(args.queries_file, encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        else:
+            texts = await sample_queries(args.knowledge_base_id, args.sample)
+        if not texts:
+            raise SystemExit("No queries found, use --queries-file")
+        queries = await get_embeddings_from_httpx(texts, endpoint="embed_text")
+
+        pages = list_pages(milvus_client, collection_name)
+        print(f"{collection_name}: {len(pages)} pages, {len(queries)} queries")
+        expected = exact_top_k(milvus_client, collection_name, queries, pages, args.k)
+
+        profiles = args.profiles or compatible_index_profiles(quantization)
+        scratch_name = f"{collection_name}_tune"
+        print(
+            f"{'profile':<14}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'build s':>10}"
+        )
+        try:
+            for i, profile in enumerate(profiles):
+                profile = resolve_index_profile(profile, quantization)
+                if i == 0:
+                    milvus_client.copy_collection(collection_name, scratch_name)
+                    if milvus_client.has_page_index(collection_name):
+                        milvus_client.copy_collection(
+                            page_collection_name(collection_name),
+                            page_collection_name(scratch_name),
+                        )
+                # 同步重建索引，确保评测时所有数据都已建好索引
+                start = time.perf_counter()
+                milvus_client.rebuild_index(scratch_name, profile)
+                build_seconds = time.perf_counter() - start
+
+                recall, latency = evaluate_profile(
+                    scratch_name,
+                    profile,
+                    queries,
+                    expected,
+                    args.k,
+                    vector_config.get("candidate_limit"),
+                    vector_config.get("search_params"),
+                )
+                print(
+                    f"{profile:<14}{recall:>10.3f}{latency['p50']:>10.1f}"
+                    f"{latency['p95']:>10.1f}{latency['p99']:>10.1f}{build_seconds:>10.1f}"
+                )
+        finally:
+            milvus_client.delete_collection(scratch_name)
+    finally:
+        await mongodb.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--knowledge-base-id", required=True)
+    parser.add_argument("--profiles", nargs="+", help="默认评估所有兼容的索引配置")
+    parser.add_argument("--queries-file", help="每行一个查询")
+    parser.add_argument(
+        "--sample", type=int, default=50, help="从历史会话中抽样的查询数"
+    )
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--apply", help="用指定的索引配置重建知识库索引并写入配置")
+    asyncio.run(tune(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
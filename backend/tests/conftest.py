@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# 配置从工作目录的 ../.env 读取，测试时切换到 tests 目录，不读取部署用的 .env
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(TESTS_DIR)
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from app.core.config import settings  # noqa: E402
+
+# 使用 Milvus Lite 本地文件，导入 app.db.milvus 时不连接 Milvus 服务
+settings.milvus_uri = os.path.join(tempfile.mkdtemp(), "milvus.db")
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+import numpy as np
+import pytest
+from app.rag.get_embedding import (
+    _iter_frames,
+    decode_embeddings,
+    embeddings_accept_header,
+)
+
+# 编码端在模型服务中，测试两端的二进制格式一致
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../model-server")
+)
+from embedding_codec import (  # noqa: E402
+    encode_embeddings,
+    encode_error_frame,
+    encode_frame,
+    negotiate_dtype,
+)
+
+
+def ragged_embeddings(seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    return [rng.standard_normal((n, 8)).astype(np.float32) for n in (3, 1, 5)]
+
+
+class ChunkedResponse:
+    """按固定大小分块返回内容，模拟帧跨网络分块到达"""
+
+    def __init__(self, content: bytes, chunk_size: int):
+        self.content = content
+        self.chunk_size = chunk_size
+
+    async def aiter_bytes(self):
+        for i in range(0, len(self.content), self.chunk_size):
+            yield self.content[i : i + self.chunk_size]
+
+
+async def collect_frames(response, dtype: str) -> list:
+    return [item async for item in _iter_frames(response, dtype)]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+def test_embeddings_round_trip(dtype):
+    embeddings = ragged_embeddings()
+    decoded = decode_embeddings(encode_embeddings(embeddings, dtype), dtype)
+
+    assert [array.shape for array in decoded] == [array.shape for array in embeddings]
+    for array, expected in zip(decoded, embeddings):
+        np.testing.assert_allclose(
+            array, expected.astype(dtype), rtol=1e-3 if dtype == "float16" else 0
+        )
+
+
+def test_empty_embeddings_round_trip():
+    assert decode_embeddings(encode_embeddings([], "float16"), "float16") == []
+
+
+def test_truncated_payload_is_rejected():
+    content = encode_embeddings(ragged_embeddings(), "float16")
+    with pytest.raises(ValueError):
+        decode_embeddings(content[:-2], "float16")
+
+
+@pytest.mark.parametrize("wire_format", ["float16", "float32"])
+def test_accept_header_negotiates_requested_dtype(wire_format):
+    assert negotiate_dtype(embeddings_accept_header(wire_format)) == wire_format
+    assert negotiate_dtype(embeddings_accept_header("json")) is None
+
+
+def test_frames_round_trip_across_chunk_boundaries():
+    embeddings = ragged_embeddings()
+    content = b"".join(
+        encode_frame(index, embedding, "float16")
+        for index, embedding in enumerate(embeddings)
+    )
+    frames = asyncio.run(collect_frames(ChunkedResponse(content, 7), "float16"))
+
+    assert [index for index, _ in frames] == [0, 1, 2]
+    for (_, array), expected in zip(frames, embeddings):
+        np.testing.assert_allclose(array, expected.astype(np.float16))
+
+
+def test_error_frame_raises():
+    content = encode_frame(0, np.ones((2, 4)), "float16") + encode_error_frame("OOM")
+    with pytest.raises(Exception, match="OOM"):
+        asyncio.run(collect_frames(ChunkedResponse(content, 5), "float16"))
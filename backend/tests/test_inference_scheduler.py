@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import pytest
+
+# 调度器在模型服务中，用假的模型服务测试合批和优先级
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../model-server")
+)
+from inference_scheduler import InferenceScheduler, SchedulerUnavailable  # noqa: E402
+
+
+class FakeService:
+    """记录每批的类型和内容，查询的结果为其大写形式"""
+
+    def __init__(self):
+        self.batches = []
+
+    def image_token_count(self, image) -> int:
+        return 0
+
+    def embed_queries(self, queries: list) -> list:
+        self.batches.append(("text", list(queries)))
+        if "bad" in queries:
+            raise RuntimeError("bad query")
+        return [query.upper() for query in queries]
+
+    def embed_images(self, images: list) -> list:
+        self.batches.append(("image", list(images)))
+        return [f"image:{image}" for image in images]
+
+
+def run(scenario):
+    async def main():
+        service = FakeService()
+        scheduler = InferenceScheduler(service, max_wait_ms=20)
+        try:
+            return service, await scenario(scheduler)
+        finally:
+            await scheduler.stop()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_queries_share_one_batch():
+    async def scenario(scheduler):
+        return await asyncio.gather(
+            scheduler.embed_queries(["a"]),
+            scheduler.embed_queries(["b", "c"]),
+            scheduler.embed_queries(["d"]),
+        )
+
+    service, results = run(scenario)
+    assert results == [["A"], ["B", "C"], ["D"]]
+    assert service.batches == [("text", ["a", "b", "c", "d"])]
+
+
+def test_interactive_queries_run_before_queued_images():
+    async def scenario(scheduler):
+        scheduler.bulk_share = 0
+        images = scheduler.submit_images(["p1", "p2"], lane="bulk")
+        queries = await scheduler.embed_queries(["q"])
+        return queries, await asyncio.gather(*images)
+
+    service, (queries, images) = run(scenario)
+    assert queries == ["Q"]
+    assert images == ["image:p1", "image:p2"]
+    assert [kind for kind, _ in service.batches] == ["text", "image"]
+
+
+def test_failed_batch_only_fails_the_bad_item():
+    async def scenario(scheduler):
+        return await asyncio.gather(
+            scheduler.embed_queries(["a"]),
+            scheduler.embed_queries(["bad"]),
+            return_exceptions=True,
+        )
+
+    _, (good, bad) = run(scenario)
+    assert good == ["A"]
+    assert isinstance(bad, RuntimeError)
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario(scheduler):
+        scheduler.max_pending["text"] = 2
+        pending = scheduler.embed_queries(["a", "b"])
+        task = asyncio.ensure_future(pending)
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerUnavailable) as error:
+            scheduler.check_capacity("text", 1)
+        await task
+        return error.value
+
+    _, error = run(scenario)
+    assert error.status_code == 429
+    assert error.retry_after >= 1
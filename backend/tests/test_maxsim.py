@@ -0,0 +1,39 @@
+import numpy as np
+from app.db.milvus import maxsim_scores, pool_vectors
+
+
+def naive_maxsim(query, doc) -> float:
+    return sum(max(float(q @ d) for d in doc) for q in query)
+
+
+def test_maxsim_matches_naive_loop_for_ragged_docs():
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal((5, 16)).astype(np.float32)
+    docs = [rng.standard_normal((n, 16)).astype(np.float32) for n in (1, 7, 3, 12, 2)]
+
+    scores = maxsim_scores(query, docs)
+
+    assert scores.shape == (len(docs),)
+    np.testing.assert_allclose(
+        scores, [naive_maxsim(query, doc) for doc in docs], rtol=1e-5
+    )
+
+
+def test_maxsim_ignores_padding_when_all_similarities_are_negative():
+    # 补齐位置为零向量，相似度为 0，不能盖过真实 token 的负分
+    query = np.array([[1.0, 0.0]], dtype=np.float32)
+    docs = [np.array([[-1.0, 0.0]]), np.array([[-0.5, 0.0], [-2.0, 0.0], [-3.0, 0.0]])]
+
+    np.testing.assert_allclose(maxsim_scores(query, docs), [-1.0, -0.5])
+
+
+def test_maxsim_with_no_docs():
+    scores = maxsim_scores(np.ones((3, 4)), [])
+    assert scores.shape == (0,)
+
+
+def test_pool_vectors_returns_unit_mean():
+    vectors = np.array([[3.0, 0.0], [0.0, 4.0]])
+    pooled = pool_vectors(vectors)
+    np.testing.assert_allclose(pooled, [0.6, 0.8], rtol=1e-6)
+    np.testing.assert_allclose(pool_vectors(np.zeros((2, 2))), [0.0, 0.0])
@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pytest
+from app.db.milvus import maxsim_scores
+from app.db.plaid_index import (
+    PlaidIndex,
+    compress,
+    decompress,
+    normalize,
+    pack_residuals,
+    train_centroids,
+    unpack_residuals,
+)
+
+DIM = 16
+
+
+def make_pages(file_id: str, count: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "colqwen_vecs": normalize(rng.standard_normal((12, DIM))),
+            "image_id": f"{file_id}_{page_number}",
+            "file_id": file_id,
+            "page_number": page_number,
+        }
+        for page_number in range(count)
+    ]
+
+
+def make_index(tmp_path, pages: list) -> PlaidIndex:
+    sample = np.concatenate([page["colqwen_vecs"] for page in pages])
+    centroids = train_centroids(sample, 16, iterations=5)
+    index = PlaidIndex.create(os.path.join(tmp_path, "index"), centroids, bits=4)
+    index.add_pages(pages)
+    return index
+
+
+def search_all(index: PlaidIndex, query) -> list:
+    # 探测全部质心、不做阈值裁剪，结果应与精确 MaxSim 一致
+    return index.search(
+        query, topk=100, nprobe=16, centroid_threshold=-1, candidate_pages=100
+    )
+
+
+@pytest.mark.parametrize("bits", [2, 4, 8])
+def test_residuals_pack_round_trip(bits):
+    levels = np.random.default_rng(0).integers(0, 2**bits, size=(5, DIM))
+    packed = pack_residuals(levels.astype(np.uint8), bits)
+    np.testing.assert_array_equal(unpack_residuals(packed, bits, DIM), levels)
+
+
+@pytest.mark.parametrize("bits", [2, 4, 8])
+def test_decompress_error_within_quantization_step(bits):
+    rng = np.random.default_rng(1)
+    vectors = normalize(rng.standard_normal((64, DIM))).astype(np.float32)
+    centroids = train_centroids(vectors, 8, iterations=5)
+    codes, packed, scales = compress(vectors, centroids, bits)
+
+    restored = decompress(centroids, codes, packed, scales, bits)
+    error = np.abs(restored - vectors).max(axis=1)
+    assert (error <= scales.astype(np.float32) * 0.5 + 1e-3).all()
+
+
+def test_search_matches_exact_maxsim(tmp_path):
+    pages = make_pages("f1", 6, seed=2) + make_pages("f2", 6, seed=3)
+    index = make_index(tmp_path, pages)
+    query = pages[4]["colqwen_vecs"][:4]
+
+    results = search_all(index, query)
+
+    assert results[0]["image_id"] == "f1_4"
+    # 分数基于解压后的向量，与原始向量的 MaxSim 仅差量化误差
+    exact = maxsim_scores(query, [page["colqwen_vecs"] for page in pages])
+    assert [result["image_id"] for result in results[:3]] == [
+        pages[i]["image_id"] for i in np.argsort(-exact)[:3]
+    ]
+
+
+def test_deleted_files_are_not_returned(tmp_path):
+    pages = make_pages("f1", 3, seed=4) + make_pages("f2", 3, seed=5)
+    index = make_index(tmp_path, pages)
+    index.delete_files(["f1"])
+
+    results = search_all(index, pages[0]["colqwen_vecs"])
+    assert {result["file_id"] for result in results} == {"f2"}
+    assert index.page_count() == 3
+
+
+def test_reingested_pages_replace_old_ones(tmp_path):
+    pages = make_pages("f1", 3, seed=6)
+    index = make_index(tmp_path, pages)
+    index.add_pages(make_pages("f1", 2, seed=7))
+
+    assert index.page_count() == 3
+    results = search_all(index, pages[2]["colqwen_vecs"])
+    assert sorted(result["page_number"] for result in results) == [0, 1, 2]
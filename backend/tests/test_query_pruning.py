@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from app.db.query_pruning import QUERY_PRUNE_MODES, prune_query_tokens
+
+
+def kept_positions(vectors, pruned) -> list:
+    """裁剪结果中每个 token 在原查询中的位置"""
+    return [int(np.flatnonzero((vectors == row).all(axis=1))[0]) for row in pruned]
+
+
+def query_with_duplicates(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((12, 16)).astype(np.float32)
+    # 模拟查询末尾重复的填充 token
+    vectors[8:] = vectors[7] * np.array([2.0, 0.5, 3.0, 4.0])[:, None]
+    return vectors
+
+
+@pytest.mark.parametrize("mode", QUERY_PRUNE_MODES)
+@pytest.mark.parametrize("min_tokens", [1, 4, 10])
+def test_pruned_tokens_are_an_ordered_subset(mode, min_tokens):
+    vectors = query_with_duplicates()
+    pruned = prune_query_tokens(
+        vectors, mode, keep_ratio=0.5, min_tokens=min_tokens, similarity=0.95
+    )
+
+    positions = kept_positions(vectors, pruned)
+    assert positions == sorted(set(positions))
+    assert min(min_tokens, len(vectors)) <= len(pruned) <= len(vectors)
+
+
+def test_none_keeps_all_tokens():
+    vectors = query_with_duplicates()
+    np.testing.assert_array_equal(prune_query_tokens(vectors, "none"), vectors)
+
+
+def test_dedup_drops_repeated_padding_tokens():
+    vectors = query_with_duplicates()
+    pruned = prune_query_tokens(vectors, "dedup", similarity=0.95)
+    assert kept_positions(vectors, pruned) == list(range(8))
+
+
+def test_importance_keeps_ratio_of_tokens():
+    vectors = np.random.default_rng(1).standard_normal((10, 16))
+    pruned = prune_query_tokens(vectors, "importance", keep_ratio=0.6, min_tokens=2)
+    assert len(pruned) == 6
+
+
+def test_norm_keeps_largest_tokens():
+    vectors = np.eye(6, dtype=np.float32) * np.array([1, 5, 2, 6, 3, 4])[:, None]
+    pruned = prune_query_tokens(vectors, "norm", keep_ratio=0.5, min_tokens=1)
+    assert kept_positions(vectors, pruned) == [1, 3, 5]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        prune_query_tokens(np.ones((4, 2)), "random")
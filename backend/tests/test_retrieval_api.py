@@ -0,0 +1,80 @@
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.endpoints import retrieval
+from app.core.security import get_current_user
+from app.models.user import User
+from app.rag import retrieval as rag_retrieval
+
+
+def make_client(monkeypatch, kb_scores: dict) -> TestClient:
+    """kb_scores 为 知识库ID -> 每个查询的检索结果"""
+
+    async def get_text_embeddings(queries):
+        return [np.ones((4, 8), dtype=np.float32) for _ in queries]
+
+    async def search_knowledge_base_batch(
+        knowledge_base_id, query_embeddings, top_k, file_ids=None, query_texts=None
+    ):
+        collection_name = rag_retrieval.get_collection_name(knowledge_base_id)
+        return [
+            [{**score, "collection_name": collection_name} for score in scores]
+            for scores in kb_scores[knowledge_base_id]
+        ]
+
+    monkeypatch.setattr(
+        retrieval.embedding_cache, "get_text_embeddings", get_text_embeddings
+    )
+    monkeypatch.setattr(
+        rag_retrieval, "search_knowledge_base_batch", search_knowledge_base_batch
+    )
+    app = FastAPI()
+    app.include_router(retrieval.router, prefix="/retrieval")
+    app.dependency_overrides[get_current_user] = lambda: User(username="alice")
+    return TestClient(app)
+
+
+def page(file_id: str, page_number: int, score: float) -> dict:
+    return {
+        "file_id": file_id,
+        "image_id": f"{file_id}_{page_number}",
+        "page_number": page_number,
+        "score": score,
+    }
+
+
+def test_batch_retrieval_returns_pages_with_knowledge_base_ids(monkeypatch):
+    client = make_client(
+        monkeypatch,
+        {
+            "alice_kb-1": [[page("f1", 1, 0.9)], [page("f1", 2, 0.3)]],
+            "alice_kb-2": [[page("f2", 1, 0.5)], []],
+        },
+    )
+    response = client.post(
+        "/retrieval/batch",
+        json={
+            "queries": ["q1", "q2"],
+            "knowledge_base_ids": ["alice_kb-1", "alice_kb-2"],
+            "top_k": 2,
+        },
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["query"] for result in results] == ["q1", "q2"]
+    assert [
+        (item["knowledge_base_id"], item["image_id"]) for item in results[0]["pages"]
+    ] == [("alice_kb-1", "f1_1"), ("alice_kb-2", "f2_1")]
+    assert [
+        (item["knowledge_base_id"], item["page_number"]) for item in results[1]["pages"]
+    ] == [("alice_kb-1", 2)]
+
+
+def test_batch_retrieval_rejects_other_users_knowledge_base(monkeypatch):
+    client = make_client(monkeypatch, {})
+    response = client.post(
+        "/retrieval/batch",
+        json={"queries": ["q1"], "knowledge_base_ids": ["bob_kb-1"]},
+    )
+    assert response.status_code == 403
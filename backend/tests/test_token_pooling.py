@@ -0,0 +1,76 @@
+import numpy as np
+from app.db.milvus import maxsim_scores
+from app.rag.token_pooling import pool_embeddings, pool_page_tokens, prune_page_tokens
+
+
+def page_with_background(seed: int = 0) -> np.ndarray:
+    """前 10 个 token 各不相同，之后 30 个为相同的背景图像块"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((40, 16)).astype(np.float32)
+    vectors[10:] = vectors[9]
+    return vectors
+
+
+def test_prune_keeps_first_token_of_each_duplicate_group():
+    vectors = page_with_background()
+    pruned, removed = prune_page_tokens(vectors, similarity=0.98)
+
+    np.testing.assert_array_equal(pruned, vectors[:10])
+    assert removed == 30
+
+
+def test_prune_keeps_maxsim_scores_for_exact_duplicates():
+    vectors = page_with_background()
+    pruned, _ = prune_page_tokens(vectors, similarity=0.98)
+    query = np.random.default_rng(1).standard_normal((5, 16))
+
+    np.testing.assert_allclose(
+        maxsim_scores(query, [pruned]), maxsim_scores(query, [vectors]), rtol=1e-6
+    )
+
+
+def test_pruned_tokens_are_below_similarity_threshold():
+    rng = np.random.default_rng(2)
+    base = rng.standard_normal((8, 16))
+    vectors = np.repeat(base, 4, axis=0) + rng.normal(scale=0.01, size=(32, 16))
+    pruned, removed = prune_page_tokens(vectors, similarity=0.9)
+
+    normalized = pruned / np.linalg.norm(pruned, axis=1, keepdims=True)
+    similarity = normalized @ normalized.T
+    assert (similarity[~np.eye(len(pruned), dtype=bool)] < 0.9).all()
+    assert len(pruned) + removed == len(vectors)
+
+
+def test_prune_keeps_min_tokens_for_blank_pages():
+    vectors = np.tile(np.arange(1, 9, dtype=np.float32), (20, 1))
+    pruned, removed = prune_page_tokens(vectors, similarity=0.98, min_tokens=4)
+    assert (len(pruned), removed) == (4, 16)
+
+
+def test_prune_disabled_by_zero_similarity():
+    vectors = page_with_background()
+    pruned, removed = prune_page_tokens(vectors, similarity=0)
+    np.testing.assert_array_equal(pruned, vectors)
+    assert removed == 0
+
+
+def test_pool_reduces_tokens_to_unit_vectors():
+    vectors = np.random.default_rng(3).standard_normal((40, 16))
+    pooled = pool_page_tokens(vectors, pool_factor=4)
+
+    assert 1 <= len(pooled) <= 10
+    np.testing.assert_allclose(np.linalg.norm(pooled, axis=1), 1.0, rtol=1e-5)
+
+
+def test_pool_merges_repeated_tokens():
+    directions = np.eye(3, 8, dtype=np.float32)
+    pooled = pool_page_tokens(np.repeat(directions, 4, axis=0), pool_factor=4)
+    np.testing.assert_allclose(
+        sorted(map(tuple, pooled)), sorted(map(tuple, directions)), atol=1e-6
+    )
+
+
+def test_pool_factor_one_keeps_pages_unchanged():
+    pages = [np.ones((3, 4)), np.zeros((2, 4))]
+    assert pool_embeddings(pages, 1) is pages
+    np.testing.assert_array_equal(pool_page_tokens(pages[0], 1), pages[0])
@@ -1,11 +1,10 @@
 # app/core/colbert_service.py
 from colpali_engine.models import ColQwen2_5, ColQwen2_5_Processor
-from colpali_engine.utils.torch_utils import ListDataset, get_torch_device
-from torch.utils.data import DataLoader
+from colpali_engine.utils.torch_utils import get_torch_device
 import torch
 from typing import List, cast
+from transformers.models.qwen2_vl.image_processing_qwen2_vl import smart_resize
 from transformers.utils.import_utils import is_flash_attn_2_available
-from tqdm import tqdm
 from config import settings
 
 
@@ -27,44 +26,34 @@ class ColBERTService:
             ),
         )
 
-    def process_query(self, queries: list) -> List[torch.Tensor]:
-        dataloader = DataLoader(
-            dataset=ListDataset[str](queries),
-            batch_size=1,
-            shuffle=False,
-            collate_fn=lambda x: self.processor.process_queries(x),
+    def image_token_count(self, image) -> int:
+        """图片缩放后的视觉 token 数，用于按分辨率分桶"""
+        image_processor = self.processor.image_processor
+        factor = image_processor.patch_size * image_processor.merge_size
+        height, width = smart_resize(
+            image.height,
+            image.width,
+            factor=factor,
+            min_pixels=image_processor.size["shortest_edge"],
+            max_pixels=image_processor.size["longest_edge"],
         )
-
-        qs: List[torch.Tensor] = []
-        for batch_query in dataloader:
-            with torch.no_grad():
-                batch_query = {
-                    k: v.to(self.model.device) for k, v in batch_query.items()
-                }
-                embeddings_query = self.model(**batch_query)
-            qs.extend(list(torch.unbind(embeddings_query.to("cpu"))))
-        for i in range(len(qs)):
-            qs[i] = qs[i].float().tolist()
-        return qs
-
-    def process_image(self, images: List) -> List[List[float]]:
-        batch_size = 1 # if len(images) > 2 else len(images)
-        dataloader = DataLoader(
-            dataset=ListDataset[str](images),
-            batch_size=batch_size,
-            shuffle=False,
-            collate_fn=lambda x: self.processor.process_images(x),
-        )
-
-        ds: List[torch.Tensor] = []
-        for batch_doc in tqdm(dataloader):
-            with torch.no_grad():
-                batch_doc = {k: v.to(self.model.device) for k, v in batch_doc.items()}
-                embeddings_doc = self.model(**batch_doc)
-            ds.extend(list(torch.unbind(embeddings_doc.to("cpu"))))
-        for i in range(len(ds)):
-            ds[i] = ds[i].float().tolist()
-        return ds
+        return (height // factor) * (width // factor)
+
+    def _forward(self, batch) -> List[torch.Tensor]:
+        """一次前向计算，按 attention_mask 去掉批内补齐位置的向量"""
+        with torch.no_grad():
+            batch = {k: v.to(self.model.device) for k, v in batch.items()}
+            embeddings = self.model(**batch)
+        mask = batch["attention_mask"].bool()
+        return [embedding[m].float().cpu() for embedding, m in zip(embeddings, mask)]
+
+    def embed_queries(self, queries: list) -> List[torch.Tensor]:
+        """一批查询做一次前向计算，返回每条查询的多向量"""
+        return self._forward(self.processor.process_queries(queries))
+
+    def embed_images(self, images: list) -> List[torch.Tensor]:
+        """一批图片做一次前向计算，返回每张图片的多向量"""
+        return self._forward(self.processor.process_images(images))
 
 
 colbert = ColBERTService(settings.colbert_model_path)
@@ -3,6 +3,14 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     colbert_model_path:str = "/home/liwei/ai/colqwen2.5-v0.2"
+    inference_max_text_batch: int = 32  # 文本查询单批最大条数
+    inference_max_image_batch: int = 8  # 图片单批最大张数
+    inference_max_wait_ms: float = 10  # 凑批时最早的请求最多等待的时间（毫秒）
+    inference_max_pending_texts: int = 256  # 排队的文本查询上限，超出时返回 429
+    inference_max_pending_images: int = 64  # 排队的图片上限，超出时返回 429
+    inference_decode_workers: int = 4  # 解码图片的线程数
+    inference_bulk_share: float = 0.2  # 有查询等待时批量图片推理至少占用的推理时间比例，0 表示查询完全优先
+    inference_bucket_tokens: int = 256  # 图片按视觉 token 数分桶的宽度，同一桶内的图片才合批以减少补齐
 
     class Config:
         env_file = "../.env"
@@ -0,0 +1,56 @@
+import struct
+from typing import List, Optional
+import numpy as np
+
+# 二进制向量响应格式（小端）：
+#   count, dim (uint32) | count 个 uint32 行数 | 按顺序拼接的 rows * dim 个 float16/float32
+# Content-Type 为 "application/x-embeddings; dtype=float16"
+EMBEDDINGS_MEDIA_TYPE = "application/x-embeddings"
+HEADER = struct.Struct("<II")
+# 流式响应由逐页的帧组成：index, rows, dim (int32, uint32, uint32) | rows * dim 个值，
+# index 为 -1 表示出错，之后为 rows 字节的 UTF-8 错误信息，流随即结束
+EMBEDDINGS_STREAM_MEDIA_TYPE = "application/x-embeddings-stream"
+FRAME_HEADER = struct.Struct("<iII")
+DTYPES = {"float16": np.float16, "float32": np.float32}
+
+
+def negotiate_dtype(
+    accept: Optional[str], media_type: str = EMBEDDINGS_MEDIA_TYPE
+) -> Optional[str]:
+    """从 Accept 头选择二进制格式的数据类型，客户端不支持时返回 None（使用 JSON）"""
+    for media_range in (accept or "").split(","):
+        accepted_type, *params = [part.strip() for part in media_range.split(";")]
+        if accepted_type != media_type:
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "dtype" and value.strip() in DTYPES:
+                return value.strip()
+        return "float16"
+    return None
+
+
+def encode_embeddings(embeddings: List, dtype: str = "float16") -> bytes:
+    arrays = [np.asarray(embedding) for embedding in embeddings]
+    dim = arrays[0].shape[1] if arrays else 0
+    rows = np.array([len(array) for array in arrays], dtype="<u4")
+    data = (
+        np.concatenate(arrays).astype(np.dtype(DTYPES[dtype]).newbyteorder("<"))
+        if arrays
+        else np.empty(0, dtype=DTYPES[dtype])
+    )
+    return HEADER.pack(len(arrays), dim) + rows.tobytes() + data.tobytes()
+
+
+def embeddings_media_type(dtype: str, media_type: str = EMBEDDINGS_MEDIA_TYPE) -> str:
+    return f"{media_type}; dtype={dtype}"
+
+
+def encode_frame(index: int, embedding, dtype: str = "float16") -> bytes:
+    array = np.asarray(embedding).astype(np.dtype(DTYPES[dtype]).newbyteorder("<"))
+    return FRAME_HEADER.pack(index, *array.shape) + array.tobytes()
+
+
+def encode_error_frame(message: str) -> bytes:
+    data = message.encode("utf-8")
+    return FRAME_HEADER.pack(-1, len(data), 0) + data
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 优先级通道：interactive 为对话查询等等待结果的请求，bulk 为入库等批量请求
+LANES = ("interactive", "bulk")
+DEFAULT_LANES = {"text": "interactive", "image": "bulk"}
+# 各通道近期推理耗时的衰减系数，每执行一批衰减一次
+LANE_DECAY = 0.9
+
+
+class InferenceItem:
+    """一条待推理的查询或图片，结果通过 future 返回给等待的请求"""
+
+    __slots__ = ("kind", "lane", "payload", "bucket", "future", "enqueued_at")
+
+    def __init__(
+        self, kind: str, lane: str, payload: Any, bucket: int, future: asyncio.Future
+    ):
+        self.kind = kind  # "text" / "image"
+        self.lane = lane  # "interactive" / "bulk"
+        self.payload = payload
+        self.bucket = bucket  # 同一 (lane, kind, bucket) 的条目才会合成一批
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class SchedulerUnavailable(Exception):
+    """推理队列已满（429）或服务正在停止（503），retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class InferenceScheduler:
+    """动态合批推理
+
+    各请求的查询和图片逐条入队，后台任务先选通道，再以该通道最早入队的条目为准，
+    收集同类型、同分辨率桶的条目直到达到批大小或最早条目等满 max_wait，做一次
+    前向计算后把结果分发给各请求。推理在单独的线程中串行执行，事件循环继续接收
+    请求，模型忙时到达的请求会自然凑成更大的批。
+
+    interactive 通道优先于 bulk 通道，在批与批之间抢占；两个通道都有等待时，
+    bulk 通道在近期推理时间中的占比低于 bulk_share 才调度 bulk，避免其饿死。
+    """
+
+    def __init__(
+        self,
+        service,
+        max_text_batch: int = settings.inference_max_text_batch,
+        max_image_batch: int = settings.inference_max_image_batch,
+        max_wait_ms: float = settings.inference_max_wait_ms,
+        bucket_tokens: int = settings.inference_bucket_tokens,
+        max_pending_texts: int = settings.inference_max_pending_texts,
+        max_pending_images: int = settings.inference_max_pending_images,
+        bulk_share: float = settings.inference_bulk_share,
+    ):
+        self.service = service
+        self.max_batch = {"text": max_text_batch, "image": max_image_batch}
+        self.max_wait = max_wait_ms / 1000
+        self.bucket_tokens = max(1, bucket_tokens)
+        # 按类型分别限制排队条目数，批量入库的图片排满时不影响查询
+        self.max_pending = {"text": max_pending_texts, "image": max_pending_images}
+        self.bulk_share = bulk_share
+        self.lane_seconds = {lane: 0.0 for lane in LANES}  # 各通道近期推理耗时（衰减）
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="inference"
+        )
+        self.pending: List[InferenceItem] = []
+        self.running = {"kind": None, "lane": None, "size": 0, "started_at": None}
+        self.stats = {
+            kind: {
+                "batches": 0,
+                "items": 0,
+                "batch_seconds": 0.0,
+                "wait_seconds": 0.0,
+                "failed": 0,
+                "rejected": 0,
+            }
+            for kind in ("text", "image")
+        }
+        self._wakeup = asyncio.Event()
+        self._worker = None
+        self._stopping = False
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for item in self.pending:
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Inference scheduler stopped"))
+        self.pending = []
+
+    async def embed_queries(self, queries: list, lane: str = None) -> list:
+        return list(
+            await asyncio.gather(
+                *self._enqueue("text", lane, [(query, 0) for query in queries])
+            )
+        )
+
+    async def embed_images(self, images: list, lane: str = None) -> list:
+        return list(await asyncio.gather(*self.submit_images(images, lane)))
+
+    def submit_images(self, images: list, lane: str = None) -> List[asyncio.Future]:
+        """图片入队后立即返回各自的 future，可逐张等待结果"""
+        return self._enqueue(
+            "image",
+            lane,
+            [
+                (image, self.service.image_token_count(image) // self.bucket_tokens)
+                for image in images
+            ],
+        )
+
+    def pending_count(self, kind: str) -> int:
+        return sum(1 for item in self.pending if item.kind == kind)
+
+    def retry_after(self, kind: str) -> int:
+        """按排队条目数和平均每批耗时估算队列排空所需的秒数"""
+        stats = self.stats[kind]
+        batch_seconds = (
+            stats["batch_seconds"] / stats["batches"] if stats["batches"] else 1.0
+        )
+        batches = math.ceil(self.pending_count(kind) / self.max_batch[kind])
+        return max(1, math.ceil(batches * batch_seconds))
+
+    def metrics(self) -> dict:
+        running = dict(self.running)
+        started_at = running.pop("started_at")
+        if started_at is not None:
+            running["seconds"] = time.perf_counter() - started_at
+        total = sum(self.lane_seconds.values())
+        metrics = {
+            "running": running,
+            "lanes": {
+                lane: {
+                    "pending": sum(1 for item in self.pending if item.lane == lane),
+                    "recent_share": self.lane_seconds[lane] / total if total else 0.0,
+                }
+                for lane in LANES
+            },
+            "bulk_share": self.bulk_share,
+        }
+        for kind, stats in self.stats.items():
+            batches = max(1, stats["batches"])
+            metrics[kind] = {
+                "pending": self.pending_count(kind),
+                "max_pending": self.max_pending[kind],
+                **stats,
+                "avg_batch_size": stats["items"] / batches,
+                "avg_batch_seconds": stats["batch_seconds"] / batches,
+                "avg_wait_seconds": stats["wait_seconds"] / max(1, stats["items"]),
+            }
+        return metrics
+
+    def check_capacity(self, kind: str, count: int):
+        """队列无法接收 count 个条目时抛出 SchedulerUnavailable"""
+        if self._stopping:
+            raise SchedulerUnavailable("Inference scheduler is stopping", 503, 5)
+        pending = self.pending_count(kind)
+        # 队列为空时总是接收，单个请求的条目数超过上限也能执行
+        if pending and pending + count > self.max_pending[kind]:
+            self.stats[kind]["rejected"] += 1
+            raise SchedulerUnavailable(
+                f"Inference queue full: {pending} {kind} items pending",
+                429,
+                self.retry_after(kind),
+            )
+
+    def _enqueue(self, kind: str, lane: str, payloads: list) -> List[asyncio.Future]:
+        self.check_capacity(kind, len(payloads))
+        self.start()
+        lane = lane if lane in LANES else DEFAULT_LANES[kind]
+        loop = asyncio.get_running_loop()
+        items = [
+            InferenceItem(kind, lane, payload, bucket, loop.create_future())
+            for payload, bucket in payloads
+        ]
+        self.pending.extend(items)
+        self._wakeup.set()
+        return [item.future for item in items]
+
+    def _next_item(self) -> InferenceItem:
+        """选出下一批的首个条目：interactive 优先，bulk 按 bulk_share 保底"""
+        firsts = {}
+        for item in self.pending:
+            firsts.setdefault(item.lane, item)
+            if len(firsts) == len(LANES):
+                break
+        interactive, bulk = firsts.get("interactive"), firsts.get("bulk")
+        if interactive is None or bulk is None:
+            return interactive or bulk
+        total = sum(self.lane_seconds.values())
+        if total and self.lane_seconds["bulk"] / total < self.bulk_share:
+            return bulk
+        return interactive
+
+    def _batch_candidates(self, first: InferenceItem) -> List[InferenceItem]:
+        return [
+            item
+            for item in self.pending
+            if item.lane == first.lane
+            and item.kind == first.kind
+            and item.bucket == first.bucket
+        ][: self.max_batch[first.kind]]
+
+    async def _run(self):
+        while True:
+            # 丢弃已取消（客户端断开）的条目
+            self.pending = [item for item in self.pending if not item.future.done()]
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            first = self._next_item()
+            deadline = first.enqueued_at + self.max_wait
+            preempted = False
+            while len(self._batch_candidates(first)) < self.max_batch[first.kind]:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                # 凑批期间到达了更高优先级的条目，重新选择
+                if self._next_item().lane != first.lane:
+                    preempted = True
+                    break
+            if preempted:
+                continue
+
+            batch = self._batch_candidates(first)
+            batch_ids = {id(item) for item in batch}
+            self.pending = [item for item in self.pending if id(item) not in batch_ids]
+            await self._execute(batch)
+
+    async def _execute(self, batch: List[InferenceItem]):
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        embed = (
+            self.service.embed_queries
+            if batch[0].kind == "text"
+            else self.service.embed_images
+        )
+        loop = asyncio.get_running_loop()
+        kind, lane = batch[0].kind, batch[0].lane
+        start = time.perf_counter()
+        self.running = {
+            "kind": kind,
+            "lane": lane,
+            "size": len(batch),
+            "started_at": start,
+        }
+        try:
+            results = await loop.run_in_executor(
+                self.executor, embed, [item.payload for item in batch]
+            )
+        except Exception as e:
+            self.stats[kind]["failed"] += 1
+            if len(batch) > 1:
+                # 整批失败（如显存不足）时逐条重试，只让出错的条目失败
+                logger.warning(
+                    f"Batch of {len(batch)} failed, retrying one by one: {e}"
+                )
+                for item in batch:
+                    await self._execute([item])
+                return
+            batch[0].future.set_exception(e)
+            return
+        finally:
+            self.running = {"kind": None, "lane": None, "size": 0, "started_at": None}
+            for name in self.lane_seconds:
+                self.lane_seconds[name] *= LANE_DECAY
+            self.lane_seconds[lane] += time.perf_counter() - start
+        stats = self.stats[kind]
+        stats["batches"] += 1
+        stats["items"] += len(batch)
+        stats["batch_seconds"] += time.perf_counter() - start
+        stats["wait_seconds"] += sum(start - item.enqueued_at for item in batch)
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
@@ -1,35 +1,168 @@
 # 新建文件 app/core/model_server.py
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from io import BytesIO
-from typing import List
-from fastapi import FastAPI, File, UploadFile, status
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from fastapi import FastAPI, File, Header, Request, UploadFile, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from colbert_service import colbert
+from config import settings
+from embedding_codec import (
+    EMBEDDINGS_STREAM_MEDIA_TYPE,
+    embeddings_media_type,
+    encode_embeddings,
+    encode_error_frame,
+    encode_frame,
+    negotiate_dtype,
+)
+from inference_scheduler import InferenceScheduler, SchedulerUnavailable
 import uvicorn
 from pydantic import BaseModel
 from PIL import Image
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 service = colbert  # 单实例加载
+scheduler = InferenceScheduler(service)  # 并发请求合批推理
+# 图片解码在独立线程池中执行，不占用事件循环和推理线程
+decode_executor = ThreadPoolExecutor(
+    max_workers=settings.inference_decode_workers, thread_name_prefix="decode"
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.start()
+    yield
+    await scheduler.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(SchedulerUnavailable)
+async def scheduler_unavailable_handler(request: Request, exc: SchedulerUnavailable):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 class TextRequest(BaseModel):
     queries: list  # 显式定义字段
 
+
+def encode_json(embeddings: list) -> bytes:
+    return json.dumps(
+        {"embeddings": [embedding.tolist() for embedding in embeddings]}
+    ).encode("utf-8")
+
+
+async def embeddings_response(embeddings: list, accept: Optional[str]) -> Response:
+    # 客户端声明支持二进制格式时返回原始向量，否则返回 JSON；序列化在线程中执行
+    dtype = negotiate_dtype(accept)
+    if dtype is None:
+        return Response(
+            content=await asyncio.to_thread(encode_json, embeddings),
+            media_type="application/json",
+        )
+    return Response(
+        content=await asyncio.to_thread(encode_embeddings, embeddings, dtype),
+        media_type=embeddings_media_type(dtype),
+    )
+
+# 请求可用 X-Priority: interactive/bulk 指定优先级通道，默认文本为 interactive、图片为 bulk
 @app.post("/embed_text")
-async def embed_text(request: TextRequest):
-    return {"embeddings": service.process_query(request.queries)}
+async def embed_text(
+    request: TextRequest,
+    accept: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+):
+    embeddings = await scheduler.embed_queries(request.queries, x_priority)
+    return await embeddings_response(embeddings, accept)
 
-@app.post("/embed_image")
-async def embed_image(images: List[UploadFile] = File(...)):
-    pil_images = []
+def decode_image(content: bytes):
+    # 提前解码为 RGB，推理线程不再花时间解码
+    return Image.open(BytesIO(content)).convert("RGB")
+
+async def read_images(images: List[UploadFile]) -> list:
+    # 队列已满时在读取和解码之前拒绝
+    scheduler.check_capacity("image", len(images))
+    contents = []
     for image_file in images:
-        # 读取二进制流并转为 PIL.Image
-        content = await image_file.read()
-        buffer = BytesIO(content)
-        image = Image.open(buffer)
-        pil_images.append(image)
+        contents.append(await image_file.read())
         # 重要：关闭文件流避免内存泄漏
         await image_file.close()
-    return {"embeddings": service.process_image(pil_images)}
+    loop = asyncio.get_running_loop()
+    return list(
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(decode_executor, decode_image, content)
+                for content in contents
+            )
+        )
+    )
+
+@app.post("/embed_image")
+async def embed_image(
+    images: List[UploadFile] = File(...),
+    accept: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+):
+    pil_images = await read_images(images)
+    embeddings = await scheduler.embed_images(pil_images, x_priority)
+    return await embeddings_response(embeddings, accept)
+
+@app.post("/embed_image_stream")
+async def embed_image_stream(
+    images: List[UploadFile] = File(...),
+    accept: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+):
+    """按页顺序逐张返回向量：二进制帧流，或每行一个 {"index", "embedding"} 的 NDJSON"""
+    pil_images = await read_images(images)
+    futures = scheduler.submit_images(pil_images, x_priority)
+    dtype = negotiate_dtype(accept, EMBEDDINGS_STREAM_MEDIA_TYPE)
+
+    async def frames():
+        try:
+            for index, future in enumerate(futures):
+                try:
+                    embedding = await future
+                except Exception as e:
+                    logger.error(f"Embedding of image {index} failed: {e}")
+                    if dtype is None:
+                        yield json.dumps({"index": index, "error": str(e)}) + "\n"
+                    else:
+                        yield encode_error_frame(str(e))
+                    return
+                if dtype is None:
+                    yield await asyncio.to_thread(
+                        lambda: json.dumps(
+                            {"index": index, "embedding": embedding.tolist()}
+                        )
+                        + "\n"
+                    )
+                else:
+                    yield encode_frame(index, embedding, dtype)
+        finally:
+            # 出错或客户端断开时取消尚未推理的图片
+            for future in futures:
+                future.cancel()
+
+    if dtype is None:
+        return StreamingResponse(frames(), media_type="application/x-ndjson")
+    return StreamingResponse(
+        frames(),
+        media_type=embeddings_media_type(dtype, EMBEDDINGS_STREAM_MEDIA_TYPE),
+    )
+
+# 推理队列深度、正在执行的批次和各类型的批次统计
+@app.get("/metrics", response_model=dict)
+async def metrics():
+    return scheduler.metrics()
 
 # 创建新会话
 @app.get("/healthy-check", response_model=dict)